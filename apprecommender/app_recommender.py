@@ -33,15 +33,28 @@ class AppRecommender:
 
         return user_reccomendation
 
+    def make_recommendations(self, recommendation_size, strategies,
+                             no_auto_pkg_profile=False, progress=None):
+        user = self.get_user(no_auto_pkg_profile)
+        recommendations = self.recommender.get_recommendations(
+            user, strategies, recommendation_size, progress)
+
+        logging.info("Recommending applications for user %s" % user.user_id)
+        for strategy, recommendation in recommendations.iteritems():
+            logging.info("%s: %s" % (strategy, recommendation))
+
+        return recommendations
+
     def get_user(self, no_auto_pkg_profile):
         config = Config()
 
         user = LocalSystem()
-        user.filter_pkg_profile(
-            os.path.join(config.filters_dir, "desktopapps"))
-        user.maximal_pkg_profile()
+        stages = [user.get_filter_stage(
+            os.path.join(config.filters_dir, "desktopapps")),
+            user.get_maximal_stage()]
 
         if no_auto_pkg_profile:
-            user.no_auto_pkg_profile()
+            stages.append(user.get_no_auto_stage())
+        user.apply_profile_stages(stages)
 
         return user
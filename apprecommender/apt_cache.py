@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+    apt_cache - python module for the apt cache shared by the whole
+                process.
+"""
+
+import apt
+import logging
+import os
+import threading
+import time
+
+DPKG_STATUS = '/var/lib/dpkg/status'
+APT_LISTS = '/var/lib/apt/lists'
+
+shared_cache = {}
+shared_cache_lock = threading.Lock()
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_state():
+    # the lists directory changes when apt-get update renames new lists in
+    return (get_mtime(DPKG_STATUS), get_mtime(APT_LISTS))
+
+
+def get_cache():
+    """
+    Return a read-only snapshot of the apt cache of the process. The cache
+    is opened on first use and opened again when the dpkg status or the apt
+    lists change; snapshots taken before keep the cache they were taken of.
+    """
+    state = get_state()
+    with shared_cache_lock:
+        if shared_cache.get('state') != state:
+            begin_time = time.time()
+            shared_cache['snapshot'] = CacheSnapshot(apt.Cache())
+            shared_cache['state'] = state
+            logging.debug("Apt cache opened in %.2f seconds" %
+                          (time.time() - begin_time))
+        return shared_cache['snapshot']
+
+
+class CacheSnapshot:
+
+    """
+    Read-only view of an apt.Cache: packages can be looked up and iterated,
+    but not marked for changes, as the cache is shared.
+    """
+
+    def __init__(self, cache):
+        """
+        Set initial parameters.
+        """
+        self._cache = cache
+
+    def __getitem__(self, name):
+        return self._cache[name]
+
+    def __contains__(self, name):
+        return name in self._cache
+
+    def __iter__(self):
+        return iter(self._cache)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, name, default=None):
+        """
+        Return the package called 'name', or 'default' if there is none.
+        """
+        if name in self._cache:
+            return self._cache[name]
+        return default
+
+    def keys(self):
+        return self._cache.keys()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+    bm25 - python module for in-memory BM25 scoring of the items repository
+           documents, as an alternative to xapian.Enquire.
+"""
+
+import threading
+
+import numpy as np
+import scipy.sparse as sparse
+
+engines_cache = {}
+engines_lock = threading.Lock()
+
+
+def get_bm25_engine(term_store, k1, k2, k3, b, min_normlen):
+    """
+    Return the BM25 engine of 'term_store' with the given parameters, built
+    once per process and again when the store is loaded anew.
+    """
+    key = (term_store.path, k1, k2, k3, b, min_normlen)
+    with engines_lock:
+        engine = engines_cache.get(key)
+        if engine is None or engine.store is not term_store:
+            engine = BM25Engine(term_store, k1, k2, k3, b, min_normlen)
+            engines_cache[key] = engine
+        return engine
+
+
+class BM25Engine:
+
+    """
+    BM25 scoring of the documents of a term vectors store.
+
+    The store is loaded once into a CSR matrix of documents x terms holding,
+    for each term of a document, the BM25 wdf part (k1 + 1) * wdf / (K +
+    wdf), where K = k1 * ((1 - b) + b * normlen) is precomputed from the
+    document length norm. A query profile is then scored with a sparse dot
+    product against the query term weights, which gives the same weights as
+    xapian.BM25Weight over an OR query of the profile terms.
+    """
+
+    def __init__(self, term_store, k1, k2, k3, b, min_normlen):
+        """
+        Set initial parameters and precompute the documents matrix.
+        """
+        self.store = term_store
+        self.pkgs = np.array(term_store.pkgs, dtype=object)
+        # document classes of PkgMatchDecider.accept_pkg, which only depend
+        # on the package names
+        self.names = np.array(term_store.pkgs, dtype=str)
+        self.kde_pkgs = np.char.find(self.names, 'kde') >= 0
+        self.gnome_pkgs = (~self.kde_pkgs &
+                           (np.char.find(self.names, 'gnome') >= 0))
+        self.plain_pkgs = ~(self.kde_pkgs | self.gnome_pkgs |
+                            np.char.startswith(self.names, 'lib') |
+                            np.char.endswith(self.names, 'doc'))
+        self.arch_pkgs = np.char.find(self.names, ':') >= 0
+        self.k2 = k2
+        self.k3 = k3
+        self.terms_ids = dict((term, i) for i, term in
+                              enumerate(term_store.terms))
+
+        indptr = np.asarray(term_store.indptr)
+        indices = np.asarray(term_store.indices)
+        wdf = np.asarray(term_store.wdf).astype(float)
+        num_docs, num_terms = len(self.pkgs), len(term_store.terms)
+
+        normlen = np.maximum(np.asarray(term_store.doc_length) /
+                             float(term_store.avlength), min_normlen)
+        norm = k1 * ((1 - b) + b * normlen)
+        entries_norm = np.repeat(norm, np.diff(indptr))
+        # wdf is 0 for terms which do not index the document (xapian boolean
+        # terms), which then only make the document match
+        values = np.where(wdf > 0, (k1 + 1) * wdf /
+                          np.maximum(entries_norm + wdf, 1e-10), 0)
+        shape = (num_docs, num_terms)
+        self.matrix = sparse.csr_matrix((values, indices, indptr), shape)
+        self.presence = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr), shape)
+        # per document factor of the k2 extra part of BM25
+        self.extra = (1 - normlen) / (1 + normlen)
+
+        doc_count = float(term_store.doc_count)
+        term_freq = np.asarray(term_store.term_freq).astype(float)
+        term_weight = (doc_count - term_freq + 0.5) / (term_freq + 0.5)
+        term_weight = np.where(term_weight < 2, term_weight * 0.5 + 1,
+                               term_weight)
+        self.idf = np.log(term_weight)
+
+    def can_score(self, profile):
+        """
+        True if every term of 'profile' is in the store vocabulary. Terms
+        the store left out would be missed, so such profiles must be scored
+        by xapian.
+        """
+        return all([term in self.terms_ids for term in profile])
+
+    def get_exclusion_mask(self, installed_pkgs):
+        """
+        Return a boolean mask of the documents accepted by a PkgMatchDecider
+        of 'installed_pkgs', computed over arrays of the package names.
+        """
+        installed = frozenset(installed_pkgs)
+        accepted = self.plain_pkgs.copy()
+        if "kde" in installed:
+            accepted |= self.kde_pkgs
+        if "gnome" in installed:
+            accepted |= self.gnome_pkgs
+        accepted &= ~self.arch_pkgs
+        if installed and len(self.names):
+            installed = np.unique(np.array(list(installed), dtype=str))
+            positions = np.minimum(np.searchsorted(installed, self.names),
+                                   len(installed) - 1)
+            accepted &= installed[positions] != self.names
+        return accepted
+
+    def get_query_matrix(self, profiles):
+        # one row of weighted query terms per profile
+        rows, cols, wqf = [], [], []
+        for row, profile in enumerate(profiles):
+            counts = {}
+            for term in profile:
+                term_id = self.terms_ids[term]
+                counts[term_id] = counts.get(term_id, 0) + 1
+            for term_id, count in counts.iteritems():
+                rows.append(row)
+                cols.append(term_id)
+                wqf.append(count)
+        cols = np.array(cols, dtype=np.int64)
+        wqf = np.array(wqf, dtype=float)
+        values = self.idf[cols] * (self.k3 + 1) * wqf / (self.k3 + wqf)
+        shape = (len(profiles), len(self.idf))
+        return (sparse.csr_matrix((values, (rows, cols)), shape),
+                sparse.csr_matrix((np.ones(len(cols)), (rows, cols)), shape))
+
+    def score_batch(self, profiles, size, masks=None):
+        """
+        Return the 'size' best (packages, weights) arrays for each profile
+        in 'profiles', scoring all of them with one sparse matrix product.
+        'masks' is an optional list of exclusion masks, one per profile.
+        """
+        if not profiles:
+            return []
+        query, query_presence = self.get_query_matrix(profiles)
+        scores = np.asarray((self.matrix * query.T).todense())
+        matches = np.asarray((self.presence * query_presence.T).todense()) > 0
+        if self.k2:
+            query_length = np.array([len(profile) for profile in profiles])
+            scores += self.k2 * np.outer(self.extra, query_length)
+
+        results = []
+        for i in range(len(profiles)):
+            accepted = matches[:, i]
+            if masks is not None:
+                accepted = accepted & masks[i]
+            results.append(self.get_top(scores[:, i], np.flatnonzero(accepted),
+                                        size))
+        return results
+
+    def score(self, profile, size, mask=None):
+        """
+        Return the 'size' best (packages, weights) arrays for 'profile'.
+        """
+        masks = [mask] if mask is not None else None
+        return self.score_batch([profile], size, masks)[0]
+
+    def get_top(self, scores, candidates, size):
+        # top 'size' candidates in decreasing weight, ties in document order
+        # as xapian does
+        if size <= 0:
+            candidates = candidates[:0]
+        elif size < len(candidates):
+            top = np.argpartition(-scores[candidates], size - 1)[:size]
+            threshold = scores[candidates[top]].min()
+            above = candidates[scores[candidates] > threshold]
+            tied = candidates[scores[candidates] == threshold]
+            candidates = np.concatenate((above, tied[:size - len(above)]))
+        order = np.lexsort((candidates, -scores[candidates]))
+        candidates = candidates[order]
+        return (self.pkgs[candidates], scores[candidates])
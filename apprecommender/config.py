@@ -65,6 +65,22 @@ class Config(Singleton):
             self.axi_desktopapps = os.path.join(self.base_dir,
                                                 "axi_desktopapps")
             self.stopwords = os.path.join(self.filters_dir, 'stopwords')
+            # packed term vectors of axi_desktopapps packages
+            self.term_store = os.path.join(self.base_dir, "term_store")
+            # package names vocabulary, mapping names to int32 ids
+            self.pkgs_vocabulary = os.path.join(self.base_dir,
+                                                "pkgs_vocabulary.npy")
+            # forward and reverse dependencies of the apt cache packages
+            self.dependency_index = os.path.join(self.base_dir,
+                                                 "dependency_index")
+            # description stems, debtags and section of the desktop
+            # packages, for the machine learning strategies
+            self.ml_feature_store = os.path.join(self.base_dir,
+                                                 "ml_feature_store")
+            # opened handles per xapian database shared by threads, and
+            # seconds to wait for a free one
+            self.database_pool_size = 8
+            self.database_pool_timeout = 30
             # popcon indexes
             self.index_mode = "old"
             # check if there are popcon indexes available
@@ -74,6 +90,8 @@ class Config(Singleton):
             self.popcon_desktopapps = os.path.join(self.base_dir,
                                                    "popcon_desktopapps")
             self.popcon_index = self.popcon_desktopapps
+            self.popcon_term_store = os.path.join(self.base_dir,
+                                                  "popcon_term_store")
             self.popcon_dir = os.path.join(self.base_dir, "popcon-entries")
             self.max_popcon = 1000
             # popcon clustering
@@ -95,10 +113,29 @@ class Config(Singleton):
             self.bm25_k3 = 7
             self.bm25_b = 0.75
             self.bm25_nl = 0.5
+            # query expansion engine ('xapian' or 'sparse')
+            self.eset_engine = "xapian"
+            # items repository matching engine ('xapian' or 'sparse'), the
+            # sparse one is only used with bm25 weight
+            self.items_engine = "xapian"
+            # paged recommendations: number of ranked candidates kept per
+            # cursor, cursors cache size (MB) and expiry (seconds)
+            self.cursor_results = 120
+            self.cursor_cache_size = 16
+            self.cursor_cache_expiry = 1800
+            # warm up the indexes when the recommender starts, and the
+            # queries run then (';' separated lists of terms)
+            self.warmup = 0
+            self.warmup_queries = ("XTuse::editing XTworks-with::image;"
+                                   "XTuse::browsing XTworks-with::text;"
+                                   "XPvim XPgimp XPfirefox")
             # user content profile size
             self.profile_size = 10
             # neighborhood size
             self.k_neighbors = 50
+            # number of nearest shards searched for neighbours when the
+            # users repository is sharded by clusters (0 searches it all)
+            self.popcon_shards = 0
             # popcon profiling method: full, voted
             self.popcon_profiling = "full"
 
@@ -144,6 +181,21 @@ class Config(Singleton):
         self.axi_desktopapps = os.path.join(
             self.base_dir, self.read_option('data_sources',
                                             'axi_desktopapps'))
+        self.term_store = os.path.join(
+            self.base_dir, self.read_option('data_sources', 'term_store'))
+        self.pkgs_vocabulary = os.path.join(
+            self.base_dir, self.read_option('data_sources',
+                                            'pkgs_vocabulary'))
+        self.dependency_index = os.path.join(
+            self.base_dir, self.read_option('data_sources',
+                                            'dependency_index'))
+        self.ml_feature_store = os.path.join(
+            self.base_dir, self.read_option('data_sources',
+                                            'ml_feature_store'))
+        self.database_pool_size = int(
+            self.read_option('data_sources', 'database_pool_size'))
+        self.database_pool_timeout = int(
+            self.read_option('data_sources', 'database_pool_timeout'))
         # self.index_mode = self.read_option('data_sources', 'index_mode')
         self.popcon = int(self.read_option('data_sources', 'popcon'))
         self.popcon_programs = os.path.join(
@@ -155,6 +207,9 @@ class Config(Singleton):
         self.popcon_index = os.path.join(
             self.base_dir, self.read_option('data_sources',
                                             'popcon_index'))
+        self.popcon_term_store = os.path.join(
+            self.base_dir, self.read_option('data_sources',
+                                            'popcon_term_store'))
         self.popcon_dir = os.path.join(
             self.base_dir, self.read_option('data_sources',
                                             'popcon_dir'))
@@ -173,11 +228,23 @@ class Config(Singleton):
         self.bm25_k3 = float(self.read_option('recommender', 'bm25_k3'))
         self.bm25_b = float(self.read_option('recommender', 'bm25_b'))
         self.bm25_nl = float(self.read_option('recommender', 'bm25_nl'))
+        self.eset_engine = self.read_option('recommender', 'eset_engine')
+        self.items_engine = self.read_option('recommender', 'items_engine')
+        self.cursor_results = int(
+            self.read_option('recommender', 'cursor_results'))
+        self.cursor_cache_size = int(
+            self.read_option('recommender', 'cursor_cache_size'))
+        self.cursor_cache_expiry = int(
+            self.read_option('recommender', 'cursor_cache_expiry'))
+        self.warmup = int(self.read_option('recommender', 'warmup'))
+        self.warmup_queries = self.read_option('recommender', 'warmup_queries')
         self.strategy = self.read_option('recommender', 'strategy')
         self.profile_size = int(
             self.read_option('recommender', 'profile_size'))
         self.k_neighbors = int(
             self.read_option('recommender', 'k_neighbors'))
+        self.popcon_shards = int(
+            self.read_option('recommender', 'popcon_shards'))
         self.popcon_profiling = self.read_option(
             'recommender', 'popcon_profiling')
 
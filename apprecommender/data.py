@@ -27,18 +27,23 @@ import logging
 import random
 import cluster
 import shutil
-import apt
 import re
 import operator
 import urllib
 import simplejson as json
 import socket
 import math
-import commands
+import threading
 
-from apprecommender.data_classification import time_weight
+import numpy as np
+
+from apprecommender.apt_cache import get_cache
+from apprecommender.data_classification import (get_terms_incidence,
+                                                get_time_weights,
+                                                get_usage_time_store)
 from apprecommender.error import Error
 from apprecommender.config import Config
+from apprecommender.dpkg_state import get_dpkg_state
 from apprecommender.dissimilarity import JaccardDistance
 from apprecommender.singleton import Singleton
 
@@ -81,6 +86,16 @@ def axi_search_pkg_tags(axi, pkg):
             return tags
 
 
+def get_database_key(index):
+    """
+    Return a key identifying the contents of 'index', its database and
+    revision. Database handles are pooled and reused once released, so
+    results computed over an index are not kept per handle.
+    """
+    get_revision = getattr(index, 'get_revision', index.get_lastdocid)
+    return (index.get_uuid(), get_revision(), index.get_doccount())
+
+
 def print_index(index):
     output = "\n---\n" + xapian.Database.__repr__(index) + "\n---\n"
     for term in index.allterms():
@@ -92,35 +107,198 @@ def print_index(index):
 
 
 def get_user_installed_pkgs():
-    dpkg_output = commands.getoutput('/usr/bin/dpkg --get-selections')
+    """
+    Return the frozenset of packages installed on the local system, read
+    again only when the dpkg status changes.
+    """
+    return get_dpkg_state().installed
+
+
+# Value slot holding the packed term vector of users repository documents,
+# and metadata key of the vocabulary of its term ids
+TERMS_PAYLOAD_SLOT = 0
+TERMS_PAYLOAD_VOCABULARY = 'terms_payload_vocabulary'
+TERMS_PAYLOAD_DTYPE = '<i4'
+
+payload_vocabularies = {}
+
+
+def set_terms_with_payload(doc, doc_terms, vocabulary):
+    """
+    Add the terms of the {term: wdf} dictionary 'doc_terms' to 'doc', and
+    their ids and wdf packed in the payload value slot. New terms are
+    given ids in 'vocabulary'.
+    """
+    ids = []
+    wdf = []
+    for term, term_wdf in doc_terms.iteritems():
+        doc.add_term(term, term_wdf)
+        ids.append(vocabulary.setdefault(term, len(vocabulary)))
+        wdf.append(term_wdf)
+    payload = np.array(ids + wdf, dtype=TERMS_PAYLOAD_DTYPE)
+    doc.add_value(TERMS_PAYLOAD_SLOT, payload.tostring())
+
+
+def save_payload_vocabulary(index, vocabulary):
+    terms = sorted(vocabulary, key=vocabulary.get)
+    index.set_metadata(TERMS_PAYLOAD_VOCABULARY, '\n'.join(terms))
+
+
+def get_payload_vocabulary(index):
+    """
+    Return the array of terms indexed by the payload term ids of 'index', or
+    None if its documents have no payloads.
+    """
+    revision = (index.get_doccount(), index.get_lastdocid())
+    cached = payload_vocabularies.get(id(index))
+    if cached is None or cached[0] is not index or cached[1] != revision:
+        metadata = index.get_metadata(TERMS_PAYLOAD_VOCABULARY)
+        terms = None
+        if metadata:
+            terms = np.array(metadata.split('\n'), dtype=object)
+        cached = (index, revision, terms)
+        payload_vocabularies[id(index)] = cached
+    return cached[2]
+
+
+def get_payload_terms(vocabulary, docs, payloads, content_filters,
+                      normalized_weights):
+    # Same as the termlist walk of get_all_terms_multi, decoding the packed
+    # term ids of each document, and calling the filters once per term
+
+    ids_list = []
+    wdf_incs = []
+    packages = []
+    for d, payload in zip(docs, payloads):
+        values = np.frombuffer(payload, dtype=TERMS_PAYLOAD_DTYPE)
+        ids_list.append(values[:len(values) / 2])
+        if normalized_weights:
+            wdf_incs.append(int(math.ceil(normalized_weights[d.docid])))
+        else:
+            wdf_incs.append(1)
+        packages.append(d.document.get_data())
+
+    ids = np.concatenate(ids_list)
+    docs_rows = np.repeat(np.arange(len(ids_list)),
+                          [len(doc_ids) for doc_ids in ids_list])
+    term_ids, inverse = np.unique(ids, return_inverse=True)
+    wdf = np.bincount(inverse, weights=np.array(wdf_incs)[docs_rows])
+    order = np.argsort(inverse, kind='mergesort')
+    bounds = np.cumsum(np.bincount(inverse))
+
+    terms_packages = {}
+    terms_docs = [xapian.Document() for content_filter in content_filters]
+    begin = 0
+    for i, term in enumerate(vocabulary[term_ids]):
+        for content_filter, terms_doc in zip(content_filters, terms_docs):
+            if content_filter(term):
+                terms_doc.add_term(term, int(wdf[i]))
+        if not term.startswith('XP'):
+            terms_packages[term] = [packages[row] for row in
+                                    docs_rows[order[begin:bounds[i]]]]
+        begin = bounds[i]
+
+    return (terms_docs, terms_packages)
+
+
+# Prefix of the boolean term of the shard (cluster) of users repository
+# documents, and metadata key of the packages of the shards medoids
+SHARD_PREFIX = 'XS'
+SHARDS_MEDOIDS = 'shards_medoids'
 
-    packages = [pkg.split('\t')[0] for pkg in dpkg_output.splitlines()
-                if 'deinstall' not in pkg.split('\t')[-1]]
+shards_medoids = {}
+shards_medoids_lock = threading.Lock()
 
-    packages = set(packages)
 
-    return packages
+def set_shard(doc, shard):
+    doc.add_boolean_term(SHARD_PREFIX + str(shard))
+
+
+def save_shards_medoids(index, medoids):
+    """
+    Save the packages of each shard medoid, 'medoids' being a list of
+    packages lists ordered by shard.
+    """
+    index.set_metadata(SHARDS_MEDOIDS, '\n'.join([' '.join(sorted(pkgs))
+                                                  for pkgs in medoids]))
+
+
+def get_shards_medoids(index):
+    """
+    Return the list of packages sets of the shards medoids of 'index', or
+    None if the index is not sharded. They are read again when the index
+    changes, and shared by the handles of the same database.
+    """
+    database_key = get_database_key(index)
+    with shards_medoids_lock:
+        cached = shards_medoids.get(database_key[0])
+    if cached is None or cached[0] != database_key:
+        metadata = index.get_metadata(SHARDS_MEDOIDS)
+        medoids = None
+        if metadata:
+            medoids = [set(line.split()) for line in metadata.split('\n')]
+        cached = (database_key, medoids)
+        with shards_medoids_lock:
+            shards_medoids[database_key[0]] = cached
+    return cached[1]
+
+
+def get_nearest_shards(medoids, pkgs, min_shards, min_docs=0, index=None):
+    """
+    Return the shards whose medoids are nearest to the packages set 'pkgs'
+    by Jaccard distance, nearest first. At least 'min_shards' shards are
+    taken, and more while they hold less than 'min_docs' documents of
+    'index'.
+    """
+    distance = JaccardDistance()
+    pkgs = set(pkgs)
+    distances = [(distance(pkgs, medoid), shard)
+                 for shard, medoid in enumerate(medoids)]
+    shards = []
+    shards_docs = 0
+    for _, shard in sorted(distances):
+        if len(shards) >= min_shards and shards_docs >= min_docs:
+            break
+        shards.append(shard)
+        if index is not None:
+            shards_docs += index.get_termfreq(SHARD_PREFIX + str(shard))
+    return shards
 
 
 def get_all_terms(index, docs, content_filter, normalized_weights):
-    # Store all terms in one single document
+    terms_docs, terms_packages = get_all_terms_multi(index, docs,
+                                                     [content_filter],
+                                                     normalized_weights)
+    return (terms_docs[0], terms_packages)
+
+
+def get_all_terms_multi(index, docs, content_filters, normalized_weights):
+    # Store all terms accepted by each filter in one single document per
+    # filter, reading the termlist of each document only once
+
+    vocabulary = get_payload_vocabulary(index)
+    if vocabulary is not None:
+        payloads = [d.document.get_value(TERMS_PAYLOAD_SLOT) for d in docs]
+        if payloads and all(payloads):
+            return get_payload_terms(vocabulary, docs, payloads,
+                                     content_filters, normalized_weights)
 
     terms_packages = {}
-    terms_doc = xapian.Document()
+    terms_docs = [xapian.Document() for content_filter in content_filters]
 
     for d in docs:
 
         package = d.document.get_data()
+        if normalized_weights:
+            wdf_inc = int(math.ceil(normalized_weights[d.docid]))
+        else:
+            wdf_inc = 1
 
         for term in index.get_document(d.docid).termlist():
 
-            if content_filter(term.term):
-                if normalized_weights:
-                    terms_doc.add_term(term.term,
-                                       int(math.ceil(
-                                           normalized_weights[d.docid])))
-                else:
-                    terms_doc.add_term(term.term)
+            for content_filter, terms_doc in zip(content_filters, terms_docs):
+                if content_filter(term.term):
+                    terms_doc.add_term(term.term, wdf_inc)
 
             if term.term.startswith('XP'):
                 continue
@@ -129,7 +307,7 @@ def get_all_terms(index, docs, content_filter, normalized_weights):
             else:
                 terms_packages[term.term] = [package]
 
-    return (terms_doc, terms_packages)
+    return (terms_docs, terms_packages)
 
 
 def get_tfidf_terms_weights(terms_doc, index, terms_package, time_context=0):
@@ -146,14 +324,21 @@ def get_tfidf_terms_weights(terms_doc, index, terms_package, time_context=0):
 
             tfidf = tf * idf
             weights[term.term] = tfidf
-
-            if time_context:
-                weight = time_weight(term.term,
-                                     terms_package[term.term])
-                weights[term.term] *= weight
         except:
             pass
 
+    if time_context:
+        # terms without packages or time weight keep their tfidf weight
+        terms = weights.keys()
+        incidence, pkgs = get_terms_incidence(
+            [terms_package.get(term, []) for term in terms])
+        time_weights = get_time_weights(terms, incidence, pkgs)
+        for term, weight in zip(terms, time_weights):
+            if not np.isnan(weight):
+                weights[term] *= weight
+        # keep the binaries of the packages met for the next processes
+        get_usage_time_store().save()
+
     # print_best_weight_terms(terms_package)
 
     return weights
@@ -166,13 +351,34 @@ def tfidf_weighting(index, docs, content_filter, normalized_weights=0,
     documents, based on the frequency of terms in the selected set (docids).
     """
 
-    terms_doc, terms_packages = get_all_terms(index, docs, content_filter,
-                                              normalized_weights)
-    weights = get_tfidf_terms_weights(terms_doc, index, terms_packages,
-                                      time_context)
+    return tfidf_weighting_multi(index, docs, [content_filter],
+                                 normalized_weights, time_context)[0]
 
-    sorted_weights = list(reversed(sorted(weights.items(),
-                                          key=operator.itemgetter(1))))
+
+def tfidf_weighting_multi(index, docs, content_filters, normalized_weights=0,
+                          time_context=0):
+    """
+    Return, for each content filter, the sorted terms and weights computed
+    as in tfidf_weighting, reading the documents only once.
+    """
+
+    terms_docs, terms_packages = get_all_terms_multi(index, docs,
+                                                     content_filters,
+                                                     normalized_weights)
+    return sort_tfidf_weights(terms_docs, index, terms_packages, time_context)
+
+
+def sort_tfidf_weights(terms_docs, index, terms_packages, time_context=0):
+    """
+    Return the terms of each document in 'terms_docs' sorted by their
+    tfidf weight.
+    """
+    sorted_weights = []
+    for terms_doc in terms_docs:
+        weights = get_tfidf_terms_weights(terms_doc, index, terms_packages,
+                                          time_context)
+        sorted_weights.append(list(reversed(sorted(
+            weights.items(), key=operator.itemgetter(1)))))
     return sorted_weights
 
 
@@ -216,19 +422,23 @@ def split_pkg_data(user_pkg, partition_size):
 class StopWords(Singleton):
 
     def __init__(self):
-        self._stopwords = set()
+        # __init__ runs on every StopWords() call, keep the loaded words
+        if not hasattr(self, '_stopwords'):
+            self._stopwords = set()
 
     @property
     def stopwords(self):
         if not self._stopwords:
+            # Load in a new set, so that concurrent threads never see a
+            # partially loaded one
+            words = set()
             stopwords_path = Config().stopwords
             with open(stopwords_path, 'r') as stopwords:
                 for word in stopwords:
-                    self._stopwords.add(word.strip())
+                    words.add(word.strip())
+            self._stopwords = words
 
-            return self._stopwords
-        else:
-            return self._stopwords
+        return self._stopwords
 
 
 class FilteredXapianIndex(xapian.WritableDatabase):
@@ -309,7 +519,7 @@ class DebianPackage():
             json_data = json.load(urllib.urlopen(cfg.dde_url % self.name))
             self.summary = json_data['r']['description']
         else:
-            pkg_version = apt.Cache()[self.name].candidate
+            pkg_version = get_cache()[self.name].candidate
             self.summary = pkg_version.summary
 
     def load_details(self):
@@ -320,7 +530,7 @@ class DebianPackage():
             self.load_details_from_apt()
 
     def load_details_from_apt(self):
-        pkg_version = apt.Cache()[self.name].candidate
+        pkg_version = get_cache()[self.name].candidate
 
         self.maintainer = pkg_version.record['Maintainer']
         self.version = pkg_version.version
@@ -512,6 +722,7 @@ class FilteredPopconXapianIndex(xapian.WritableDatabase):
 
         # build new index
         doc_count = 0
+        vocabulary = {}
         for root, dirs, files in os.walk(self.popcon_dir):
             for popcon_file in files:
                 submission = PopconSubmission(os.path.join(root, popcon_file))
@@ -522,25 +733,28 @@ class FilteredPopconXapianIndex(xapian.WritableDatabase):
                                   (submission.user_id, len(submission_pkgs)))
                 else:
                     doc.set_data(submission.user_id)
-                    doc.add_term("ID" + submission.user_id)
-                    doc.add_term("ARCH" + submission.arch)
+                    doc_terms = {"ID" + submission.user_id: 1,
+                                 "ARCH" + submission.arch: 1}
                     logging.debug("Parsing popcon submission \'%s\'" %
                                   submission.user_id)
                     for pkg, freq in submission_pkgs.items():
                         tags = axi_search_pkg_tags(self.axi, pkg)
                         # if the package was found in axi
                         if tags:
-                            doc.add_term("XP" + pkg, freq)
+                            doc_terms["XP" + pkg] = freq
                             # if the package has tags associated with it
                             if not tags == "notags":
                                 for tag in tags:
                                     if tag.lstrip("XT") in self.valid_tags:
-                                        doc.add_term(tag, freq)
+                                        doc_terms[tag] = (
+                                            doc_terms.get(tag, 0) + freq)
+                    set_terms_with_payload(doc, doc_terms, vocabulary)
                     doc_id = self.add_document(doc)
                     doc_count += 1
                     logging.debug("Popcon Xapian: Indexing doc %d" % doc_id)
             # python garbage collector
                 gc.collect()
+        save_payload_vocabulary(self, vocabulary)
         # flush to disk database changes
         try:
             self.commit()
@@ -580,6 +794,7 @@ class PopconXapianIndex(xapian.WritableDatabase):
             if not os.listdir(cfg.popcon_dir):
                 logging.critical("Popcon dir seems to be empty.")
                 raise Error
+            medoids = None
             if cfg.index_mode == "reindex" or cfg.index_mode == "old":
                 self.source_dir = os.path.expanduser(cfg.popcon_dir)
                 logging.debug(self.source_dir)
@@ -588,7 +803,7 @@ class PopconXapianIndex(xapian.WritableDatabase):
                 if not os.path.exists(cfg.clusters_dir):
                     os.makedirs(cfg.clusters_dir)
                 if not os.listdir(cfg.clusters_dir) or \
-                   cfg.index_mode == "recluster":
+                   cfg.index_mode in ("recluster", "reshard"):
                     shutil.rmtree(cfg.clusters_dir, 1)
                     os.makedirs(cfg.clusters_dir)
                     logging.info("Clustering popcon submissions from \'%s\'"
@@ -607,7 +822,14 @@ class PopconXapianIndex(xapian.WritableDatabase):
                 else:
                     logging.info("Using clusters from \'%s\'" %
                                  cfg.clusters_dir)
-            self.build_index()
+                # Shard modes index all submissions, each one in the shard
+                # of its nearest medoid, instead of the medoids only
+                if cfg.index_mode in ("shard", "reshard"):
+                    medoids = [submission.get_filtered(self.valid_pkgs)
+                               for submission in
+                               self.get_submissions(cfg.clusters_dir)]
+                    self.source_dir = os.path.expanduser(cfg.popcon_dir)
+            self.build_index(medoids)
 
     def __str__(self):
         return print_index(self)
@@ -625,10 +847,11 @@ class PopconXapianIndex(xapian.WritableDatabase):
             logging.info("Could not open popcon index.")
             return 0
 
-    def build_index(self):
+    def build_index(self, medoids=None):
         """
         Create a xapian index for popcon submissions at 'source_dir' and
-        place it at 'self.path'.
+        place it at 'self.path'. If the packages of cluster 'medoids' are
+        given, each submission is put in the shard of the nearest one.
         """
         shutil.rmtree(self.path, 1)
         os.makedirs(self.path)
@@ -646,6 +869,7 @@ class PopconXapianIndex(xapian.WritableDatabase):
             raise Error
 
         doc_count = 0
+        vocabulary = {}
         for root, dirs, files in os.walk(self.source_dir):
             if doc_count == self.max_popcon:
                 break
@@ -660,23 +884,32 @@ class PopconXapianIndex(xapian.WritableDatabase):
                                   (submission.user_id, len(submission_pkgs)))
                 else:
                     doc.set_data(submission.user_id)
+                    doc_terms = {}
                     logging.debug("Parsing popcon submission \'%s\'" %
                                   submission.user_id)
                     for pkg, freq in submission_pkgs.items():
                         tags = axi_search_pkg_tags(self.axi, pkg)
                         # if the package was foung in axi
                         if tags:
-                            doc.add_term("XP" + pkg, freq)
+                            doc_terms["XP" + pkg] = freq
                             # if the package has tags associated with it
                             if not tags == "notags":
                                 for tag in tags:
                                     if tag.lstrip("XT") in self.valid_tags:
-                                        doc.add_term(tag, freq)
+                                        doc_terms[tag] = (
+                                            doc_terms.get(tag, 0) + freq)
+                    set_terms_with_payload(doc, doc_terms, vocabulary)
+                    if medoids:
+                        set_shard(doc, get_nearest_shards(
+                            medoids, submission_pkgs, 1)[0])
                     doc_id = self.add_document(doc)
                     doc_count += 1
                     logging.debug("Popcon Xapian: Indexing doc %d" % doc_id)
             # python garbage collector
                 gc.collect()
+        save_payload_vocabulary(self, vocabulary)
+        if medoids:
+            save_shards_medoids(self, medoids)
         # flush to disk database changes
         try:
             self.commit()
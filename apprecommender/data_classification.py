@@ -1,16 +1,76 @@
 #!/usr/bin/env python
 
-import commands
 import calendar
 import logging
 import math
 import operator
+import os
+import pickle
+import threading
 import time
 
-pkgs_times = {}
-pkgs_time_weight = {}
-best_weight_terms = {}
+import numpy as np
+import scipy.sparse as sparse
+
+from collections import OrderedDict
+
+from apprecommender.config import Config
+from apprecommender.dpkg_state import DPKG_STATUS, get_mtime, get_pkg_files
+from apprecommender.error import Error
+
+# stat(1) format options of the file times
+STAT_TIMES = {'X': 'st_atime', 'Y': 'st_mtime', 'Z': 'st_ctime'}
+# entries kept by each of the caches below
+TIMES_CACHE_SIZE = 20000
+
+
+class BoundedCache:
+
+    """
+    Dictionary keeping up to 'max_size' entries, the least recently set
+    ones being dropped first.
+    """
+
+    def __init__(self, max_size):
+        """
+        Set initial parameters.
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def items(self):
+        with self.lock:
+            return self.entries.items()
+
+
+# Caches shared by the threads of the process. Their values only depend on
+# the key, so concurrent threads can at most compute the same value twice.
+pkgs_times = BoundedCache(TIMES_CACHE_SIZE)
+pkgs_time_weight = BoundedCache(TIMES_CACHE_SIZE)
+best_weight_terms = BoundedCache(TIMES_CACHE_SIZE)
 user_tfidf_weights = {}
+usage_time_stores = {}
+usage_time_stores_lock = threading.Lock()
 
 
 def pkg_name_with_error(pkg):
@@ -21,23 +81,24 @@ def get_time_from_package(pkg, pkg_bin=True):
     if pkg_name_with_error(pkg):
         pkgs_times[pkg] = [None, None]
 
-    if pkg in pkgs_times:
-        modify, access = pkgs_times[pkg]
-    else:
-        modify = get_time('Z', pkg, pkg_bin)
-        access = get_time('X', pkg, pkg_bin)
-        pkgs_times[pkg] = [modify, access]
+    times = pkgs_times.get(pkg)
+    if times is None:
+        pkg_stat = get_stat(pkg, pkg_bin)
+        times = [get_stat_time('Z', pkg_stat), get_stat_time('X', pkg_stat)]
+        pkgs_times[pkg] = times
 
-    return pkgs_times[pkg]
+    return times
 
 
 def get_alternative_pkg(pkg):
-    dpkg_command = "dpkg -L {0}| grep /usr/bin/"
-    dpkg_command += " || dpkg -L {0}| grep /usr/sbin/"
-    pkg_bin = commands.getoutput(dpkg_command.format(pkg))
+    pkg_files = get_pkg_files(pkg)
+    pkg_bin = [pkg_file for pkg_file in pkg_files if '/usr/bin/' in pkg_file]
+    if not pkg_bin:
+        pkg_bin = [pkg_file for pkg_file in pkg_files
+                   if '/usr/sbin/' in pkg_file]
 
     possible_pkgs = {}
-    for pkg_path in pkg_bin.splitlines():
+    for pkg_path in pkg_bin:
         possible_pkgs[pkg_path] = get_time('X', pkg_path)
 
     if bool(possible_pkgs):
@@ -46,20 +107,44 @@ def get_alternative_pkg(pkg):
     return None
 
 
-def get_time(option, pkg, pkg_bin=True):
-    stat_base = "stat -c '%{option}'"
-    stat_base += " `which {package}`" if pkg_bin else " {package}"
-    stat_error = 'stat:'
-    stat_time = stat_base.format(option=option, package=pkg)
-
-    pkg_time = commands.getoutput(stat_time)
+def which(program):
+    # as which(1): names with a slash are checked as they are
+    if '/' in program:
+        paths = [program]
+    else:
+        paths = [os.path.join(path_dir, program) for path_dir in
+                 os.environ.get('PATH', os.defpath).split(os.pathsep)]
 
-    if stat_error not in pkg_time:
-        return pkg_time
+    for path in paths:
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
 
     return None
 
 
+def get_stat(pkg, pkg_bin=True):
+    path = which(pkg) if pkg_bin else pkg
+    if not path:
+        return None
+
+    # as stat(1), symbolic links are not followed
+    try:
+        return os.lstat(path)
+    except OSError:
+        return None
+
+
+def get_stat_time(option, pkg_stat):
+    if pkg_stat is None:
+        return None
+
+    return str(int(getattr(pkg_stat, STAT_TIMES[option])))
+
+
+def get_time(option, pkg, pkg_bin=True):
+    return get_stat_time(option, get_stat(pkg, pkg_bin))
+
+
 def linear_percent_function(modify, access, time_now):
     modify, access = int(modify), int(access)
 
@@ -99,12 +184,157 @@ def square_percent_function(modify, access, time_now):
     return percent
 
 
-def get_pkg_time_weight(pkg):
-    modify, access = get_time_from_package(pkg)
+def get_usage_time_store():
+    """
+    Return the usage time store of the user data, loaded and refreshed once
+    per process, and refreshed again when dpkg changes the installed
+    packages.
+    """
+    path = os.path.join(Config().user_data_dir, 'usage_times')
+    with usage_time_stores_lock:
+        store = usage_time_stores.get(path)
+        if store is None:
+            store = UsageTimeStore(path)
+            store.refresh()
+            usage_time_stores[path] = store
+            return store
+    if store.status_mtime != get_mtime(DPKG_STATUS):
+        store.refresh()
+    return store
+
+
+class UsageTimeStore:
+
+    """
+    Modify and access times of the binary telling how much each package is
+    used: the program named as the package or, if there is none, the one
+    get_alternative_pkg picks among its files.
+
+    The store is pickled at 'path' as (dpkg status mtime, {pkg: binary},
+    {binary: times}). Refreshing it stats the known binaries again, and
+    only looks for the binary of the packages whose binary changed or, when
+    dpkg changed the installed packages since, which had no binary.
+    """
+
+    def __init__(self, path):
+        """
+        Set initial parameters, loading the store saved at 'path'.
+        """
+        self.path = path
+        self.status_mtime = None
+        self.binaries = {}
+        self.times = {}
+        self.changed = False
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as store_file:
+                    (self.status_mtime, self.binaries,
+                     self.times) = pickle.load(store_file)
+            except (IOError, EOFError, ValueError,
+                    pickle.UnpicklingError) as error:
+                logging.debug("Could not load usage times: %s" % error)
+
+    @staticmethod
+    def find_binary(pkg):
+        binary = which(pkg) if not pkg_name_with_error(pkg) else None
+        if binary and get_stat(binary):
+            return binary
+        return get_alternative_pkg(pkg)
+
+    @staticmethod
+    def get_binary_times(binary):
+        if pkg_name_with_error(binary):
+            return [None, None]
+        binary_stat = get_stat(binary)
+        return [get_stat_time('Z', binary_stat),
+                get_stat_time('X', binary_stat)]
+
+    def get_times(self, pkg):
+        """
+        Return the [modify, access] times of the binary of 'pkg', or None if
+        it has no binary.
+        """
+        if pkg not in self.binaries:
+            binary = self.find_binary(pkg)
+            times = self.get_binary_times(binary) if binary else None
+            with self.lock:
+                self.binaries[pkg] = binary
+                if binary:
+                    self.times[binary] = times
+                self.changed = True
+
+        binary = self.binaries[pkg]
+        if binary is None:
+            return None
+        return self.times[binary]
+
+    def refresh(self):
+        """
+        Update the times of the known binaries and save the store if they
+        changed.
+        """
+        status_mtime = get_mtime(DPKG_STATUS)
+        with self.lock:
+            binaries = dict(self.binaries)
+            times = dict(self.times)
+            status_changed = status_mtime != self.status_mtime
+            self.status_mtime = status_mtime
+
+        new_times = {}
+        for binary in set(binaries.itervalues()):
+            if binary:
+                new_times[binary] = self.get_binary_times(binary)
+
+        new_binaries = {}
+        for pkg, binary in binaries.iteritems():
+            if binary is None or new_times[binary][0] is None:
+                stale = status_changed
+            else:
+                stale = new_times[binary][0] != times.get(binary, [None])[0]
+            if stale:
+                binary = self.find_binary(pkg)
+                if binary and binary not in new_times:
+                    new_times[binary] = self.get_binary_times(binary)
+            new_binaries[pkg] = binary
+
+        with self.lock:
+            if (status_changed or new_binaries != binaries or
+                    new_times != times):
+                self.changed = True
+            self.binaries.update(new_binaries)
+            self.times.update(new_times)
+            used = set(self.binaries.itervalues())
+            for binary in self.times.keys():
+                if binary not in used:
+                    del self.times[binary]
+        self.save()
+
+    def save(self):
+        """
+        Save the store at its path if it changed since it was loaded.
+        """
+        with self.lock:
+            if not self.changed:
+                return
+            self.changed = False
+            content = (self.status_mtime, dict(self.binaries),
+                       dict(self.times))
+        try:
+            with open(self.path + '.tmp', 'wb') as store_file:
+                pickle.dump(content, store_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError) as error:
+            logging.debug("Could not save usage times: %s" % error)
 
-    if not modify and not access:
-        modify, access = get_time_from_package(get_alternative_pkg(pkg))
 
+def get_pkg_time_weight(pkg):
+    times = get_usage_time_store().get_times(pkg)
+    if times is None:
+        raise Error("No binary found for package %s" % pkg)
+
+    modify, access = times
     if not modify and not access:
         return 0
 
@@ -124,29 +354,109 @@ def calculate_time_curve(pkg_time_weight):
     return const_a * (1 / math.exp((1 - pkg_time_weight) * lambda_value))
 
 
-def time_weight(term, term_list):
-    weight = []
+def get_pkgs_time_weights(pkgs):
+    """
+    Return the array of the time curve weights of 'pkgs', with NaN for the
+    packages whose weight can not be computed.
+    """
+    weights = np.empty(len(pkgs))
+    for i, pkg in enumerate(pkgs):
+        weight = pkgs_time_weight.get(pkg)
+        if weight is None:
+            try:
+                weight = calculate_time_curve(get_pkg_time_weight(pkg))
+            except Exception:
+                weights[i] = np.nan
+                continue
+            pkgs_time_weight[pkg] = weight
+        weights[i] = weight
+    return weights
+
+
+def get_terms_incidence(terms_pkgs):
+    """
+    Return the CSR matrix of the terms by the packages, counting how many
+    times each package is in the list of packages of each term of
+    'terms_pkgs', and the list of the packages of its columns.
+    """
+    pkgs = sorted(set([pkg for term_pkgs in terms_pkgs
+                       for pkg in term_pkgs]))
+    columns = dict([(pkg, column) for column, pkg in enumerate(pkgs)])
+    rows = np.repeat(np.arange(len(terms_pkgs)),
+                     [len(term_pkgs) for term_pkgs in terms_pkgs])
+    cols = [columns[pkg] for term_pkgs in terms_pkgs for pkg in term_pkgs]
+    incidence = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.int32), (rows, cols)),
+        shape=(len(terms_pkgs), len(pkgs)))
+    return incidence, pkgs
+
+
+def get_terms_time_weights(incidence, pkgs_weights):
+    """
+    Return the time weights of the terms of the CSR 'incidence' matrix of
+    the terms by the packages, given the time weights of the packages. The
+    weight of a term is the mean of the 5 best weights of its packages,
+    padded with weights decreasing by 0.2 from the lowest one when it has
+    less. Terms with no package or a package without weight are NaN.
+    """
     weight_len = 5
     weight_delta = 0.2
 
-    for pkg in term_list:
-        if pkg in pkgs_time_weight:
-            weight.append(pkgs_time_weight[pkg])
-        else:
-            pkg_time_weight = get_pkg_time_weight(pkg)
-            pkgs_time_weight[pkg] = pkg_time_weight
-            weight.append(calculate_time_curve(pkg_time_weight))
+    incidence = sparse.csr_matrix(incidence)
+    terms_count = incidence.shape[0]
+    counts = incidence.data.astype(int)
+    entries_rows = np.repeat(np.repeat(np.arange(terms_count),
+                                       np.diff(incidence.indptr)), counts)
+    values = np.repeat(np.asarray(pkgs_weights, dtype=float)[
+        incidence.indices], counts)
+
+    lengths = np.bincount(entries_rows, minlength=terms_count)
+    invalid = (lengths == 0) | (np.bincount(
+        entries_rows, weights=np.isnan(values), minlength=terms_count) > 0)
+
+    # the weights of each term sorted from the best, without building a
+    # dense matrix, as a common term can have most of the packages
+    values = np.where(np.isnan(values), -np.inf, values)
+    order = np.lexsort((-values, entries_rows))
+    sorted_rows = entries_rows[order]
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(len(values)) - starts[sorted_rows]
+    kept = positions < weight_len
+    best = np.full((terms_count, weight_len), -np.inf)
+    best[sorted_rows[kept], positions[kept]] = values[order][kept]
+
+    for i in range(1, weight_len):
+        best[:, i] = np.where(lengths <= i, best[:, i - 1] - weight_delta,
+                              best[:, i])
+
+    # summed in the order of the sorted weights, as sum() does
+    total = best[:, 0]
+    for i in range(1, weight_len):
+        total = total + best[:, i]
+    terms_weights = total / float(weight_len)
+    terms_weights[invalid] = np.nan
+    return terms_weights
+
+
+def get_time_weights(terms, incidence, pkgs):
+    """
+    Return the time weights of 'terms', given their CSR incidence matrix by
+    'pkgs', computed in one pass. Terms without a time weight are NaN.
+    """
+    weights = get_terms_time_weights(incidence, get_pkgs_time_weights(pkgs))
+    for term, weight in zip(terms, weights):
+        if not np.isnan(weight):
+            best_weight_terms[term] = weight
+    return weights
 
-    weight = list(reversed(sorted(weight)))
-    if len(weight) < weight_len:
-        for i in range(len(weight), weight_len):
-            weight.append(weight[-1] - weight_delta)
 
-    time_weight = float(sum(weight[0:weight_len])) / float(weight_len)
-
-    best_weight_terms[term] = time_weight
+def time_weight(term, term_list):
+    incidence, pkgs = get_terms_incidence([term_list])
+    weight = get_time_weights([term], incidence, pkgs)[0]
+    if np.isnan(weight):
+        raise Error("No time weight for term %s" % term)
 
-    return time_weight
+    return float(weight)
 
 
 def print_best_weight_terms(terms_package):
@@ -154,11 +464,11 @@ def print_best_weight_terms(terms_package):
     total = 0
     logging.info("BEST TERMS")
 
-    for term in sorted(best_weight_terms, key=best_weight_terms.get,
-                       reverse=True):
+    weight_terms = dict(best_weight_terms.items())
+    for term in sorted(weight_terms, key=weight_terms.get, reverse=True):
         if index < 10:
             logging.info("\n")
-            logging.info(term, best_weight_terms[term])
+            logging.info(term, weight_terms[term])
             logging.info('-')
 
             for pkg in terms_package[term]:
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+    database_pool - python module for bounded pools of xapian database
+                    handles, shared by the threads of a process.
+"""
+
+import logging
+import threading
+import time
+import xapian
+
+from contextlib import contextmanager
+
+from apprecommender.config import Config
+from apprecommender.error import Error
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """
+    Return the handles pool of the database at 'path', creating it with the
+    configured size on first use.
+    """
+    with pools_lock:
+        if path not in pools:
+            cfg = Config()
+            pools[path] = DatabasePool(path, cfg.database_pool_size,
+                                       cfg.database_pool_timeout)
+        return pools[path]
+
+
+class DatabasePool:
+
+    """
+    Bounded pool of opened handles of a xapian database.
+
+    A xapian.Database object must not be used by concurrent threads, so each
+    thread (or request) acquires a handle of its own and releases it when it
+    is done. Up to 'max_size' handles are opened, further acquirers wait for
+    one to be released. Released handles are kept open to be reused, and
+    handles opened before the last call to reopen() are brought up to date
+    when they are acquired again.
+    """
+
+    def __init__(self, path, max_size, timeout=30):
+        """
+        Set initial parameters.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.opened = 0
+        self.generation = 0
+        # idle handles, as (database, generation) pairs
+        self.idle = []
+        self.generations = {}
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Return a handle for the exclusive use of the caller, opening a new
+        one if none is idle and the pool is not full.
+        """
+        deadline = time.time() + self.timeout
+        with self.condition:
+            while not self.idle and self.opened >= self.max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logging.critical("No free handle of database %s after "
+                                     "%d seconds" % (self.path, self.timeout))
+                    raise Error
+                self.condition.wait(remaining)
+            generation = self.generation
+            if self.idle:
+                database, database_generation = self.idle.pop()
+            else:
+                database, database_generation = None, generation
+                self.opened += 1
+
+        # Opening and reopening are done out of the lock, as they read disk
+        try:
+            if database is None:
+                database = xapian.Database(self.path)
+            elif database_generation < generation:
+                database.reopen()
+        except xapian.Error:
+            self.discard(database)
+            raise
+
+        with self.condition:
+            self.generations[id(database)] = generation
+        return database
+
+    def release(self, database):
+        """
+        Give back a handle obtained from acquire().
+        """
+        with self.condition:
+            generation = self.generations.pop(id(database), -1)
+            self.idle.append((database, generation))
+            self.condition.notify()
+
+    def discard(self, database=None):
+        """
+        Drop a broken handle obtained from acquire(), so that a new one can
+        be opened in its place.
+        """
+        with self.condition:
+            if database is not None:
+                self.generations.pop(id(database), None)
+            self.opened -= 1
+            self.condition.notify()
+
+    def reopen(self):
+        """
+        Make every handle of the pool move to the latest revision of the
+        database, as after the index is rebuilt. Idle handles are reopened
+        when acquired, handles in use when their users call reopen() on
+        them or release them.
+        """
+        with self.condition:
+            self.generation += 1
+
+    @contextmanager
+    def handle(self):
+        """
+        Context manager to use a handle of the pool.
+        """
+        database = self.acquire()
+        try:
+            yield database
+        except xapian.DatabaseModifiedError:
+            # the handle is reopened on its next acquire
+            with self.condition:
+                self.generations[id(database)] = -1
+            raise
+        finally:
+            self.release(database)
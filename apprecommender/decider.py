@@ -18,19 +18,26 @@ class PkgMatchDecider(xapian.MatchDecider):
         """
         xapian.MatchDecider.__init__(self)
         self.pkgs_list = pkgs_list
+        self.pkgs = frozenset(pkgs_list)
 
     def __call__(self, doc):
         """
         True if the package is not already installed and is not a lib or a doc.
         """
-        pkg = doc.get_data()
-        is_new = pkg not in self.pkgs_list
+        return self.accept_pkg(doc.get_data())
+
+    def accept_pkg(self, pkg):
+        """
+        True if the package named 'pkg' is not already installed and is not
+        a lib or a doc.
+        """
+        is_new = pkg not in self.pkgs
         is_new = is_new and ':' not in pkg
 
         if "kde" in pkg:
-            return is_new and "kde" in self.pkgs_list
+            return is_new and "kde" in self.pkgs
         if "gnome" in pkg:
-            return is_new and "gnome" in self.pkgs_list
+            return is_new and "gnome" in self.pkgs
 
         if re.match(r'^lib.*', pkg) or re.match(r'.*doc$', pkg):
             return False
@@ -50,17 +57,18 @@ class PkgExpandDecider(xapian.ExpandDecider):
         """
         xapian.ExpandDecider.__init__(self)
         self.pkgs_list = pkgs_list
+        self.pkgs = frozenset(pkgs_list)
 
     def __call__(self, term):
         """
         True if the term is a package.
         """
         pkg = term.lstrip("XP")
-        is_new_pkg = pkg not in self.pkgs_list and term.startswith("XP")
+        is_new_pkg = term.startswith("XP") and pkg not in self.pkgs
         if "kde" in pkg:
-            return is_new_pkg and "kde" in self.pkgs_list
+            return is_new_pkg and "kde" in self.pkgs
         if "gnome" in pkg:
-            return is_new_pkg and "gnome" in self.pkgs_list
+            return is_new_pkg and "gnome" in self.pkgs
         return is_new_pkg
 
 
@@ -143,3 +151,36 @@ class FilterTag_or_Description(xapian.ExpandDecider):
         is_tag = FilterTag(self.valid_tags)(term)
         is_description = FilterDescription()(term)
         return is_tag or is_description
+
+
+class FilterAny(xapian.ExpandDecider):
+
+    """
+    Extend xapian.ExpandDecider to consider terms accepted by any of a list
+    of filters.
+    """
+
+    def __init__(self, content_filters):
+        """
+        Set initial parameters.
+        """
+        xapian.ExpandDecider.__init__(self)
+        self.content_filters = content_filters
+        self.accepted = {}
+
+    def __call__(self, term):
+        """
+        Return true if the term is accepted by one of the filters.
+        """
+        return bool(self.accepting_filters(term))
+
+    def accepting_filters(self, term):
+        """
+        Return the indexes of the filters accepting the term. Each term is
+        only run through the filters once.
+        """
+        if term not in self.accepted:
+            self.accepted[term] = [
+                i for i, content_filter in enumerate(self.content_filters)
+                if content_filter(term)]
+        return self.accepted[term]
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+    dependency_index - python module for the forward and reverse dependency
+                       index of the packages, built offline from the apt
+                       cache and memory-mapped at runtime.
+"""
+
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from apprecommender.config import Config
+from apprecommender.pkg_vocabulary import PackageVocabulary
+
+index_cache = {}
+index_lock = threading.Lock()
+
+
+def get_dependency_index():
+    """
+    Return the dependency index of the configured data, loaded once per
+    process, or None if it was not built.
+    """
+    path = Config().dependency_index
+    with index_lock:
+        if path not in index_cache:
+            index_cache[path] = DependencyIndex.load(path)
+        return index_cache[path]
+
+
+def get_rows_entries(indptr, indices, rows):
+    # concatenation of the rows of a CSR adjacency, without a python loop
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[offsets + np.arange(lengths.sum())]
+
+
+class DependencyIndex:
+
+    """
+    Dependencies of the candidate versions of the packages of the apt
+    cache, as integer adjacency arrays over a vocabulary of the package
+    names. 'indptr' and 'indices' hold the packages each package depends on
+    (any alternative of its Depends and Pre-Depends), 'reverse_indptr' and
+    'reverse_indices' the packages depending on each package.
+    """
+
+    NAMES = 'names.npy'
+    ARRAYS = ['indptr', 'indices', 'reverse_indptr', 'reverse_indices']
+
+    @staticmethod
+    def build(cache, path):
+        """
+        Walk the packages of the apt 'cache' once and save their dependency
+        index at 'path'.
+        """
+        pkgs_deps = {}
+        for pkg in cache:
+            if pkg.candidate:
+                pkgs_deps[pkg.name] = set(
+                    [or_dep.name for dep in pkg.candidate.dependencies
+                     for or_dep in dep.or_dependencies])
+
+        names = set(pkgs_deps)
+        for deps in pkgs_deps.itervalues():
+            names.update(deps)
+
+        shutil.rmtree(path, 1)
+        os.makedirs(path)
+        vocabulary = PackageVocabulary.build(
+            names, os.path.join(path, DependencyIndex.NAMES))
+
+        rows = []
+        cols = []
+        for pkg, deps in pkgs_deps.iteritems():
+            dep_ids = vocabulary.get_ids(deps)
+            rows.extend([vocabulary.get_id(pkg)] * len(dep_ids))
+            cols.extend(dep_ids)
+        rows = np.array(rows, dtype=np.int32)
+        cols = np.array(cols, dtype=np.int32)
+
+        arrays = {}
+        for name, (src, dst) in [('', (rows, cols)),
+                                 ('reverse_', (cols, rows))]:
+            order = np.lexsort((dst, src))
+            counts = np.bincount(src, minlength=len(vocabulary))
+            arrays[name + 'indptr'] = np.concatenate(
+                ([0], np.cumsum(counts))).astype(np.int64)
+            arrays[name + 'indices'] = dst[order]
+        for name in DependencyIndex.ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), arrays[name])
+
+        logging.info("Dependencies of %d packages saved at %s" %
+                     (len(pkgs_deps), path))
+        return DependencyIndex(path)
+
+    @staticmethod
+    def load(path):
+        """
+        Return the index saved at 'path', or None if there is none.
+        """
+        files = [name + '.npy' for name in DependencyIndex.ARRAYS]
+        files.append(DependencyIndex.NAMES)
+        for name in files:
+            if not os.path.exists(os.path.join(path, name)):
+                logging.info("No dependency index found at %s" % path)
+                return None
+        return DependencyIndex(path)
+
+    def __init__(self, path):
+        """
+        Set initial parameters. The arrays are memory-mapped.
+        """
+        self.path = path
+        self.vocabulary = PackageVocabulary(
+            os.path.join(path, DependencyIndex.NAMES))
+        for name in DependencyIndex.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'),
+                                        mmap_mode='r'))
+
+    def get_dependencies(self, pkg):
+        """
+        Return the names of the packages 'pkg' depends on.
+        """
+        return self.get_related(pkg, self.indptr, self.indices)
+
+    def get_reverse_dependencies(self, pkg):
+        """
+        Return the names of the packages depending on 'pkg'.
+        """
+        return self.get_related(pkg, self.reverse_indptr,
+                                self.reverse_indices)
+
+    def get_related(self, pkg, indptr, indices):
+        pkg_id = self.vocabulary.get_id(pkg)
+        if pkg_id < 0:
+            return []
+        return self.vocabulary.get_names(
+            indices[indptr[pkg_id]:indptr[pkg_id + 1]])
+
+    def get_maximal(self, pkgs):
+        """
+        Return the packages of 'pkgs', in order, which are not a dependency
+        of any package of 'pkgs'.
+        """
+        pkgs = list(pkgs)
+        ids = self.vocabulary.get_ids(pkgs)
+        known = ids >= 0
+        deps = get_rows_entries(np.asarray(self.indptr),
+                                np.asarray(self.indices), ids[known])
+        is_dep = np.zeros(len(self.vocabulary), dtype=bool)
+        is_dep[deps] = True
+        removed = np.zeros(len(ids), dtype=bool)
+        removed[known] = is_dep[ids[known]]
+        return [pkg for pkg, is_removed in zip(pkgs, removed)
+                if not is_removed]
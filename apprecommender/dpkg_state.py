@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+    dpkg_state - python module to read the packages state of the local
+                 system from the dpkg and apt databases.
+"""
+
+import glob
+import gzip
+import logging
+import os
+import pickle
+import threading
+
+DPKG_STATUS = '/var/lib/dpkg/status'
+APT_EXTENDED_STATES = '/var/lib/apt/extended_states'
+DPKG_LOGS = '/var/log/dpkg.log*'
+DPKG_INFO = '/var/lib/dpkg/info'
+
+states_cache = {}
+states_lock = threading.Lock()
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_dpkg_state(status_path=DPKG_STATUS,
+                   extended_states_path=APT_EXTENDED_STATES):
+    """
+    Return the DpkgState of the given files. It is read once per process
+    and again only when one of the files changes, appears or is removed.
+    """
+    key = (status_path, extended_states_path)
+    mtimes = (get_mtime(status_path), get_mtime(extended_states_path))
+    with states_lock:
+        cached = states_cache.get(key)
+        if cached is None or cached[0] != mtimes:
+            cached = (mtimes, DpkgState(status_path, extended_states_path))
+            states_cache[key] = cached
+        return cached[1]
+
+
+def parse_stanzas(path, fields):
+    """
+    Yield the {field: value} dictionary of the given single line 'fields'
+    of each stanza of the deb822 file at 'path', streaming it line by line.
+    """
+    stanza = {}
+    with open(path) as deb822:
+        for line in deb822:
+            if not line.strip():
+                if stanza:
+                    yield stanza
+                stanza = {}
+            elif not line[0].isspace():
+                field, _, value = line.partition(':')
+                if field in fields:
+                    stanza[field] = value.strip()
+    if stanza:
+        yield stanza
+
+
+class DpkgState:
+
+    """
+    Packages state of the system: the packages selected for installation
+    (as 'dpkg --get-selections' lists them, without those being removed),
+    the ones installed by hand (as 'apt-mark showmanual' lists them), and
+    the name and priority of every package dpkg knows about.
+    """
+
+    def __init__(self, status_path=DPKG_STATUS,
+                 extended_states_path=APT_EXTENDED_STATES):
+        """
+        Read the dpkg status and apt extended states files.
+        """
+        installed = set()
+        known = set()
+        self.priorities = {}
+        for stanza in parse_stanzas(status_path,
+                                    ('Package', 'Status', 'Priority')):
+            pkg = stanza.get('Package')
+            if not pkg:
+                continue
+            known.add(pkg)
+            status = stanza.get('Status', '').split()
+            if status and status[0] in ('install', 'hold'):
+                installed.add(pkg)
+            if 'Priority' in stanza:
+                self.priorities[pkg] = stanza['Priority']
+        self.installed = frozenset(installed)
+        self.known = frozenset(known)
+
+        auto_installed = set()
+        if os.path.exists(extended_states_path):
+            for stanza in parse_stanzas(extended_states_path,
+                                        ('Package', 'Auto-Installed')):
+                if stanza.get('Auto-Installed') == '1':
+                    auto_installed.add(stanza.get('Package'))
+        self.manual = frozenset(self.installed - auto_installed)
+
+    def get_pkgs_with_priority(self, priorities):
+        """
+        Return the packages with one of the given priorities.
+        """
+        return [pkg for pkg, priority in self.priorities.iteritems()
+                if priority in priorities]
+
+
+def get_pkg_files(pkg, info_dir=DPKG_INFO):
+    """
+    Return the paths of the files installed by 'pkg' as 'dpkg -L' lists
+    them, read from its list file in the dpkg database, or an empty list if
+    it is not installed.
+    """
+    paths = [os.path.join(info_dir, pkg + '.list')]
+    if ':' not in pkg and not os.path.exists(paths[0]):
+        # multi-arch packages have one list file per architecture
+        paths = sorted(glob.glob(os.path.join(info_dir, pkg + ':*.list')))
+
+    pkg_files = []
+    for path in paths:
+        try:
+            with open(path) as list_file:
+                pkg_files.extend([line.rstrip('\n') for line in list_file])
+        except IOError:
+            continue
+    return pkg_files
+
+
+def get_logged_line_pkg(line):
+    """
+    Return the package installed by a dpkg log line as
+    '2016-05-18 15:16:40 install liblmdb0:amd64 <none> 0.9.18-1', or None
+    if the line is not an install action.
+    """
+    fields = line.split()
+    if len(fields) > 3 and fields[2] == 'install':
+        return fields[3].split(':')[0]
+    return None
+
+
+def read_log(path, offset, compressed):
+    """
+    Return the packages installed by the log at 'path' from byte 'offset'
+    on, and the offset after its last complete line. Compressed logs are
+    read whole.
+    """
+    pkgs = set()
+    if compressed:
+        with gzip.open(path, 'rb') as log:
+            content = log.read()
+        end = len(content)
+    else:
+        with open(path, 'rb') as log:
+            log.seek(offset)
+            content = log.read()
+        # a line being written is read on the next run
+        end = content.rfind('\n') + 1
+        content = content[:end]
+        end += offset
+    for line in content.splitlines():
+        pkg = get_logged_line_pkg(line)
+        if pkg:
+            pkgs.add(pkg)
+    return pkgs, end
+
+
+def get_logged_installed_pkgs(state_path=None, logs_pattern=DPKG_LOGS):
+    """
+    Return the set of packages installed according to the dpkg logs.
+
+    The logs read are kept in the pickled state file at 'state_path' as
+    {inode: (offset, mtime, pkgs)}, so that later calls only parse the lines
+    appended since. Logs are tracked by inode, so a log rotated to
+    'dpkg.log.1' is not read again, and compressed logs are only read when
+    they are new.
+    """
+    state = {}
+    if state_path and os.path.exists(state_path):
+        try:
+            with open(state_path, 'rb') as state_file:
+                state = pickle.load(state_file)
+        except (IOError, EOFError, pickle.UnpicklingError) as error:
+            logging.debug("Could not load dpkg logs state: %s" % error)
+
+    new_state = {}
+    for path in glob.glob(logs_pattern):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        compressed = path.endswith('.gz')
+        offset, mtime, pkgs = state.get(stat.st_ino, (0, None, set()))
+        if mtime == stat.st_mtime and (compressed or
+                                       stat.st_size == offset):
+            new_state[stat.st_ino] = (offset, mtime, pkgs)
+            continue
+        if compressed or stat.st_size < offset:
+            # the file was rewritten under the same inode
+            offset, pkgs = 0, set()
+        try:
+            new_pkgs, offset = read_log(path, offset, compressed)
+        except IOError as error:
+            logging.debug("Could not read dpkg log %s: %s" % (path, error))
+            continue
+        new_state[stat.st_ino] = (offset, stat.st_mtime, pkgs | new_pkgs)
+
+    if state_path and new_state != state:
+        try:
+            with open(state_path + '.tmp', 'wb') as state_file:
+                pickle.dump(new_state, state_file)
+            os.rename(state_path + '.tmp', state_path)
+        except (IOError, OSError) as error:
+            logging.debug("Could not save dpkg logs state: %s" % error)
+
+    logged_pkgs = set()
+    for offset, mtime, pkgs in new_state.itervalues():
+        logged_pkgs |= pkgs
+    return logged_pkgs
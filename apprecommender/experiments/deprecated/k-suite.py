@@ -177,6 +177,8 @@ if __name__ == '__main__':
                     results.add_result(recommendation.ranking, sample)
                     recommended[k] = recommended[
                         k].union(recommendation.ranking)
+            # give back the database handles of the recommender
+            rec.close()
             # save summary
             roc_point = results.get_roc_point()
             roc_summary[k].append(roc_point)
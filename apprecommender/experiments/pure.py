@@ -158,6 +158,8 @@ if __name__ == '__main__':
                             recommendation.ranking[:10])
                         c_100[size] = c_100[size].union(
                             recommendation.ranking[:100])
+                # give back the database handles of the recommender
+                rec.close()
                 # save summary
                 if p_10:
                     p_10_summary[size].append(numpy.mean(p_10))
@@ -7,7 +7,13 @@ import os
 import xapian
 import shutil
 
+from apprecommender.apt_cache import get_cache
 from apprecommender.config import Config
+from apprecommender.dependency_index import DependencyIndex
+from apprecommender.ml.data import MachineLearningData
+from apprecommender.ml.feature_store import FeatureStore
+from apprecommender.pkg_vocabulary import PackageVocabulary
+from apprecommender.term_store import TermVectorStore
 
 
 class Initialize:
@@ -112,6 +118,25 @@ class Initialize:
 
         self.indexer_axi('sample', pkgs_path)
         self.move_stopwords()
+        self.build_term_store(tags)
+        self.build_pkgs_vocabulary(pkgs)
+        self.build_dependency_index()
+        self.build_ml_feature_store(pkgs)
+
+    def build_term_store(self, tags):
+        axi = xapian.Database(self.config.axi_desktopapps)
+        TermVectorStore.build(axi, self.config.term_store, tags)
+
+    def build_pkgs_vocabulary(self, pkgs):
+        PackageVocabulary.build(pkgs, self.config.pkgs_vocabulary)
+
+    def build_dependency_index(self):
+        DependencyIndex.build(get_cache(), self.config.dependency_index)
+
+    def build_ml_feature_store(self, pkgs):
+        axi = xapian.Database(self.config.axi_desktopapps)
+        FeatureStore.build(pkgs, MachineLearningData(), axi, get_cache(),
+                           self.config.ml_feature_store)
 
     def get_role_program_pkgs(self):
         command = "cat /var/lib/debtags/package-tags | " \
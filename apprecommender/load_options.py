@@ -104,7 +104,7 @@ class LoadOptions(Singleton):
         # deprecated options
         # print " -m, --popcondir=PATH    Path to popcon submissions dir"
         # print " -u, --indexmode=MODE    " \
-        #        "'old'|'reindex'|'cluster'|'recluster'"
+        #        "'old'|'reindex'|'cluster'|'recluster'|'shard'|'reshard'"
         # print " -l, --clustersdir=PATH  Path to popcon clusters dir"
         # print " -c, --medoids=k         " \
         #        "Number of medoids for clustering"
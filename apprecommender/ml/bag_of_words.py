@@ -1,12 +1,15 @@
 import os
 import pickle
-from apt import Cache
+
+import scipy.sparse as sparse
 
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import GaussianNB
+from sklearn.naive_bayes import GaussianNB, MultinomialNB
 
+from apprecommender.apt_cache import get_cache
 from apprecommender.config import Config
 from apprecommender.ml.data import MachineLearningData
+from apprecommender.ml.utils import load_sparse_features, save_sparse_features
 
 
 class BagOfWords():
@@ -16,8 +19,7 @@ class BagOfWords():
     BAG_OF_WORDS_MODEL = BAG_OF_WORDS_DIR + 'bag_of_words_model.pickle'
     BAG_OF_WORDS_TERMS = BAG_OF_WORDS_DIR + 'bag_of_words_terms.pickle'
     BAG_OF_WORDS_DEBTAGS = BAG_OF_WORDS_DIR + 'bag_of_words_debtags.pickle'
-    BAG_OF_WORDS_PKGS_CLASSIFICATION = BAG_OF_WORDS_DIR + \
-        'bow_pkgs_classification.pickle'
+    BAG_OF_WORDS_PKGS_FEATURES = BAG_OF_WORDS_DIR + 'bow_pkgs_features.npz'
 
     MODEL_ALREADY_CREATED = 1
     CREATED_MODEL = 0
@@ -34,6 +36,10 @@ class BagOfWords():
 
         return bag_of_words
 
+    @staticmethod
+    def load_pkgs_features(file_path):
+        return load_sparse_features(file_path)
+
     def __init__(self):
         self.vectorizer = TfidfVectorizer(
             max_df=0.8,
@@ -54,14 +60,31 @@ class BagOfWords():
     def classify_pkg(self, attribute_vector, transform=True):
         if transform:
             pkg_feature = self.vectorizer.transform([attribute_vector])
-            pkg_feature = pkg_feature.toarray()
         else:
             pkg_feature = attribute_vector
 
-        label = self.classifier.predict(pkg_feature)
+        label = self.classifier.predict(self.get_classifier_input(
+            pkg_feature))
 
         return label[0]
 
+    def classify_batch(self, attribute_vectors, transform=True):
+        if transform:
+            pkgs_features = self.vectorizer.transform(attribute_vectors)
+        else:
+            pkgs_features = attribute_vectors
+
+        return list(self.classifier.predict(self.get_classifier_input(
+            pkgs_features)))
+
+    def get_classifier_input(self, features):
+        # models trained before the classifier took sparse input
+        if isinstance(self.classifier, GaussianNB) and sparse.issparse(
+                features):
+            return features.toarray()
+
+        return features
+
     def create_pkg_data(self, pkg, axi, cache, ml_data):
         description = self.get_pkg_description(pkg, cache, ml_data)
         debtags = self.get_pkg_debtags(pkg, axi, ml_data)
@@ -120,40 +143,32 @@ class BagOfWords():
         with open(path, 'wa') as feature_file:
             pickle.dump(features, feature_file)
 
-    def save_pkgs_features(self, path, pkgs_list, features_array,
+    def save_pkgs_features(self, path, pkgs_list, pkgs_features,
                            pkg_classification):
-        pkgs_classification = {}
-
-        for index, pkg in enumerate(pkgs_list):
-            value = features_array[index, :].tolist()
-            value.append(pkg_classification[index])
-
-            pkgs_classification[pkg] = value
-
-        with open(path, 'wa') as bow_pkgs_classification:
-            pickle.dump(pkgs_classification, bow_pkgs_classification)
+        save_sparse_features(path, pkgs_list, pkgs_features,
+                             pkg_classification)
 
     def train_model(self, pkgs_list, axi, save_files=True):
-        cache = Cache()
+        cache = get_cache()
         ml_data = MachineLearningData()
 
         pkgs_description, pkg_classification = self.prepare_data(
             pkgs_list, axi, cache, ml_data)
+        # The tfidf features are kept as a CSR matrix all along
         pkg_features = self.vectorizer.fit_transform(pkgs_description)
-        features_array = pkg_features.toarray()
 
         terms, debtags = self.get_used_terms_and_debtags(
             self.vectorizer.get_feature_names())
 
-        self.classifier = GaussianNB()
-        self.classifier.fit(features_array, pkg_classification)
+        self.classifier = MultinomialNB()
+        self.classifier.fit(pkg_features, pkg_classification)
 
-        path = BagOfWords.BAG_OF_WORDS_PKGS_CLASSIFICATION
+        path = BagOfWords.BAG_OF_WORDS_PKGS_FEATURES
 
         if save_files:
             self.save_features(terms, BagOfWords.BAG_OF_WORDS_TERMS)
             self.save_features(debtags, BagOfWords.BAG_OF_WORDS_DEBTAGS)
             self.save_pkgs_features(
-                path, pkgs_list, features_array, pkg_classification)
+                path, pkgs_list, pkg_features, pkg_classification)
 
         return BagOfWords.CREATED_MODEL
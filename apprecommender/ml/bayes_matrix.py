@@ -1,5 +1,6 @@
 import pickle
 import numpy as np
+import scipy.sparse as sparse
 
 
 class BayesMatrix:
@@ -58,23 +59,46 @@ class BayesMatrix:
     prob:               A l x a matrix that holds the probability of a given
                           feature a to be present in a given label l.
 
-    diag_histogram:       A diagonal matrix for the histogram one.
+    log_weights:          A a x l matrix that holds, for each feature a, how
+                          much its presence adds to the log-likelihood of a
+                          label l: log(1 + prob) - log(2 - prob).
+
+    log_base:             A vector with the log-likelihood of each label l
+                          for a package with no feature present.
 
     attribute_vector:     A vector 1 x a with the values of features to get a
                           classification for this vector based on the
                           training
 
     '''
+
+    # Only needed while training, so they are not pickled
+    TRAINING_ATTRIBUTES = ['data', 'classifications', 'adjacency',
+                           'feature_per_label']
+
     def __init__(self):
         self.data = None
         self.classifications = None
         self.labels = None
-        self.adjacecy = None
+        self.adjacency = None
         self.histogram = None
         self.label_probability = None
         self.feature_per_label = None
         self.prob = None
-        self.diag_histogram = None
+        self.log_weights = None
+        self.log_base = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attribute in BayesMatrix.TRAINING_ATTRIBUTES:
+            state.pop(attribute, None)
+        return state
+
+    def __setstate__(self, state):
+        # unpickled models can classify, but have no training data
+        self.__dict__.update(state)
+        for attribute in BayesMatrix.TRAINING_ATTRIBUTES:
+            self.__dict__.setdefault(attribute, None)
 
     def training(self, data_matrix, classifications,
                  order_of_classifications):
@@ -100,54 +124,57 @@ class BayesMatrix:
 
         self.feature_per_label = self.adjacency * self.data
 
-        self.diag_histogram = np.diag(np.array(self.histogram)[:, 0])
-        self.prob = np.linalg.inv(
-            self.diag_histogram) * self.feature_per_label
+        self.prob = self.feature_per_label / self.histogram
+        self.set_log_tables()
 
-    def get_classification(self, attribute_vector):
-        attribute_vector = attribute_vector.astype(float)
-        prob_vector = self.prob.copy()
-        label_probability_log = np.log(self.label_probability + 1)
+    def set_log_tables(self):
+        '''
+        Precompute the log-likelihood tables from the probabilities, so that
+        classifying a package is a single sparse dot product.
+        '''
+        prob = np.asarray(self.prob, dtype=float)
+        log_present = np.log(1 + prob)
+        log_absent = np.log(2 - prob)
 
-        indexes_one = np.matrix(np.where(attribute_vector == 1.0)[1])
-        indexes_one = indexes_one.tolist()[0]
-        indexes_zero = np.matrix(np.where(attribute_vector == 0.0)[1])
-        indexes_zero = indexes_zero.tolist()[0]
+        self.log_weights = (log_present - log_absent).T
+        self.log_base = (np.log(np.asarray(self.label_probability,
+                                           dtype=float)[:, 0] + 1) +
+                         log_absent.sum(axis=1))
 
-        prob_vector[:, indexes_one] = 1 + prob_vector[:, indexes_one]
-        prob_vector[:, indexes_zero] = 2 - prob_vector[:, indexes_zero]
+    def get_classification(self, attribute_vector):
+        return self.classify_batch(attribute_vector)[0]
 
-        prob_vector = np.log(prob_vector)
-        prob_vector = prob_vector * np.ones((prob_vector.shape[1], 1))
-        prob_vector = label_probability_log + prob_vector
+    def classify_batch(self, attributes_matrix):
+        '''
+        Classify each line of the binary p x a 'attributes_matrix', dense or
+        sparse, at once and return the list of the p classifications.
+        '''
+        # models pickled before the tables existed compute them once
+        if getattr(self, 'log_weights', None) is None:
+            self.set_log_tables()
 
-        line, col = np.unravel_index(prob_vector.argmax(), prob_vector.shape)
-        best_prob_index = line
+        attributes = sparse.csr_matrix(attributes_matrix, dtype=float,
+                                       copy=True)
+        attributes.data[:] = 1
+        prob_vectors = attributes.dot(self.log_weights) + self.log_base
 
-        return self.used_order_of_classifications[best_prob_index]
+        return [self.used_order_of_classifications[index]
+                for index in np.asarray(prob_vectors).argmax(axis=1)]
 
     def convert_possible_labels_to_number(self, order_of_classifications):
-        numbers = ""
-        for i in range(len(order_of_classifications)):
-            numbers += "{0};".format(i)
-
-        return np.matrix(numbers[0:-1])
+        return np.matrix(np.arange(len(order_of_classifications))).T
 
     def convert_classifications_to_number(self, classifications,
                                           order_of_classifications):
-        numbers = ""
-        for i in range(len(classifications)):
-            number = order_of_classifications.index(classifications[i])
-            numbers += "{0};".format(number)
+        numbers = [[order_of_classifications.index(classifications[i])]
+                   for i in range(len(classifications))]
 
-        return np.matrix(numbers[0:-1])
+        return np.matrix(numbers)
 
     def get_adjacent_matrix(self, num_labels, num_packages):
         adjacent_matrix = np.zeros((num_labels, num_packages))
-
-        for i in range(len(self.classifications)):
-            index = int(self.classifications[i].item())
-            adjacent_matrix[index][i] = 1
+        indexes = np.asarray(self.classifications, dtype=int)[:, 0]
+        adjacent_matrix[indexes, np.arange(len(indexes))] = 1
 
         return adjacent_matrix
 
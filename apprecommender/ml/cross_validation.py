@@ -313,12 +313,10 @@ class CrossValidationBVA(CrossValidationMachineLearning):
         and use it to generate the prediction.
         '''
 
-        predicted_results = []
-
-        for pkg, input_vector in round_partition.iteritems():
-            input_vector = np.matrix(input_vector[:-1])
-            predicted_results.append(
-                round_user.get_classification(input_vector))
+        input_vectors = [input_vector[:-1]
+                         for input_vector in round_partition.itervalues()]
+        predicted_results = round_user.classify_batch(
+            np.matrix(input_vectors))
 
         return create_column_matrix(predicted_results)
 
@@ -1,7 +1,6 @@
 from os import path
 from os import makedirs
 
-import apt
 import calendar
 import pickle
 import time
@@ -11,6 +10,8 @@ import Stemmer
 
 import apprecommender.data_classification as data_cl
 
+from apprecommender.apt_cache import get_cache
+from apprecommender.ml.feature_store import get_feature_store
 from apprecommender.ml.pkg_time import PkgTime
 from apprecommender.config import Config
 from apprecommender.decider import FilterTag, FilterDescription
@@ -40,6 +41,11 @@ class MachineLearningData():
                           if not line.startswith("#")]
         self.filter_tag = FilterTag(valid_tags)
         self.filter_description = FilterDescription()
+        self.feature_store = get_feature_store()
+
+    def in_feature_store(self, pkg_name):
+        return (self.feature_store is not None and
+                pkg_name in self.feature_store)
 
     def create_data(self, labels):
         if not path.exists(MachineLearningData.USER_DATA_DIR):
@@ -48,7 +54,7 @@ class MachineLearningData():
         pkgs = self.get_pkgs_classification(data_cl.square_percent_function,
                                             labels)
 
-        cache = apt.Cache()
+        cache = get_cache()
 
         terms_name = self.get_terms_for_all_pkgs(cache, pkgs.keys())
         debtags_name = self.get_debtags_for_all_pkgs(self.axi, pkgs.keys())
@@ -127,9 +133,24 @@ class MachineLearningData():
         return pkg_info
 
     def get_pkg_debtags(self, axi, pkg_name):
-        return self.get_pkg_data(axi, pkg_name, 'XT')
+        if self.in_feature_store(pkg_name):
+            return self.feature_store.get_debtags(pkg_name)
+        return self.extract_pkg_debtags(axi, pkg_name)
 
     def get_pkg_terms(self, cache, pkg_name):
+        if self.in_feature_store(pkg_name):
+            return self.feature_store.get_terms(pkg_name)
+        return self.extract_pkg_terms(cache, pkg_name)
+
+    def get_pkg_section(self, cache, pkg_name):
+        if self.in_feature_store(pkg_name):
+            return self.feature_store.get_section(pkg_name)
+        return self.extract_pkg_section(cache, pkg_name)
+
+    def extract_pkg_debtags(self, axi, pkg_name):
+        return self.get_pkg_data(axi, pkg_name, 'XT')
+
+    def extract_pkg_terms(self, cache, pkg_name):
         description = cache[pkg_name].candidate.description.strip()
         description = re.sub('[^a-zA-Z]', ' ', description)
 
@@ -139,7 +160,7 @@ class MachineLearningData():
 
         return stems
 
-    def get_pkg_section(self, cache, pkg_name):
+    def extract_pkg_section(self, cache, pkg_name):
         return cache[pkg_name].section
 
     def get_debtags_name(self, file_path):
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+    feature_store - python module for the machine learning features of the
+                    desktop packages (description stems, debtags and
+                    section), extracted once at initialization.
+"""
+
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from apprecommender.config import Config
+from apprecommender.pkg_vocabulary import PackageVocabulary
+
+stores_cache = {}
+stores_lock = threading.Lock()
+
+
+def get_feature_store():
+    """
+    Return the feature store of the configured data, loaded once per
+    process, or None if it was not built.
+    """
+    path = Config().ml_feature_store
+    with stores_lock:
+        if path not in stores_cache:
+            stores_cache[path] = FeatureStore.load(path)
+        return stores_cache[path]
+
+
+class FeatureStore:
+
+    """
+    Features of the packages as ids over a vocabulary of the feature
+    strings. 'terms_indptr' and 'terms_indices' hold the stems of the
+    description of each package, in order and with repetitions,
+    'debtags_indptr' and 'debtags_indices' its debtags, and 'sections' the
+    id of its section.
+    """
+
+    NAMES = 'pkgs.npy'
+    FEATURES = 'features.npy'
+    ARRAYS = ['terms_indptr', 'terms_indices', 'debtags_indptr',
+              'debtags_indices', 'sections']
+
+    @staticmethod
+    def build(pkgs, ml_data, axi, cache, path):
+        """
+        Extract the features of the packages in 'pkgs' with the
+        MachineLearningData 'ml_data' and save them at 'path'. Packages out
+        of the apt 'cache' are left out.
+        """
+        pkgs_features = {}
+        for pkg in pkgs:
+            if pkg not in cache or not cache[pkg].candidate:
+                continue
+            pkgs_features[pkg] = (ml_data.extract_pkg_terms(cache, pkg),
+                                  ml_data.extract_pkg_debtags(axi, pkg),
+                                  ml_data.extract_pkg_section(cache, pkg))
+
+        features = set()
+        for terms, debtags, section in pkgs_features.itervalues():
+            features.update(terms)
+            features.update(debtags)
+            features.add(section)
+
+        shutil.rmtree(path, 1)
+        os.makedirs(path)
+        names = PackageVocabulary.build(
+            pkgs_features, os.path.join(path, FeatureStore.NAMES))
+        vocabulary = PackageVocabulary.build(
+            features, os.path.join(path, FeatureStore.FEATURES))
+
+        arrays = dict([(name, []) for name in FeatureStore.ARRAYS])
+        for pkg in names.get_names(np.arange(len(names))):
+            terms, debtags, section = pkgs_features[pkg]
+            arrays['terms_indices'].append(vocabulary.get_ids(terms))
+            arrays['debtags_indices'].append(vocabulary.get_ids(debtags))
+            arrays['sections'].append(vocabulary.get_id(section))
+
+        for name in ['terms', 'debtags']:
+            indices = arrays[name + '_indices']
+            arrays[name + '_indptr'] = np.concatenate(
+                ([0], np.cumsum([len(ids) for ids in indices]))).astype(
+                    np.int64)
+            arrays[name + '_indices'] = np.concatenate(
+                [np.zeros(0, dtype=np.int32)] + indices).astype(np.int32)
+        arrays['sections'] = np.array(arrays['sections'], dtype=np.int32)
+
+        for name in FeatureStore.ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), arrays[name])
+
+        logging.info("Features of %d packages saved at %s" %
+                     (len(pkgs_features), path))
+        # the store loaded before, if any, is out of date
+        with stores_lock:
+            stores_cache.pop(path, None)
+        return FeatureStore(path)
+
+    @staticmethod
+    def load(path):
+        """
+        Return the store saved at 'path', or None if there is none.
+        """
+        files = [name + '.npy' for name in FeatureStore.ARRAYS]
+        files.extend([FeatureStore.NAMES, FeatureStore.FEATURES])
+        for name in files:
+            if not os.path.exists(os.path.join(path, name)):
+                logging.info("No feature store found at %s" % path)
+                return None
+        return FeatureStore(path)
+
+    def __init__(self, path):
+        """
+        Set initial parameters. The arrays are memory-mapped, while the
+        package names and the features are loaded in memory, so lookups
+        do not search the vocabularies.
+        """
+        self.path = path
+        self.names = PackageVocabulary(os.path.join(path, FeatureStore.NAMES))
+        self.vocabulary = PackageVocabulary(
+            os.path.join(path, FeatureStore.FEATURES))
+        self.pkgs_ids = dict((pkg, pkg_id) for pkg_id, pkg in enumerate(
+            self.names.get_names(np.arange(len(self.names)))))
+        self.features = self.vocabulary.get_names(
+            np.arange(len(self.vocabulary)))
+        for name in FeatureStore.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'),
+                                        mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.pkgs_ids)
+
+    def __contains__(self, pkg):
+        return pkg in self.pkgs_ids
+
+    def get_features(self, pkg, indptr, indices):
+        pkg_id = self.pkgs_ids[pkg]
+        return [self.features[feature_id] for feature_id in
+                indices[indptr[pkg_id]:indptr[pkg_id + 1]]]
+
+    def get_terms(self, pkg):
+        """
+        Return the stems of the description of 'pkg', in order.
+        """
+        return self.get_features(pkg, self.terms_indptr, self.terms_indices)
+
+    def get_debtags(self, pkg):
+        """
+        Return the debtags of 'pkg'.
+        """
+        return self.get_features(pkg, self.debtags_indptr,
+                                 self.debtags_indices)
+
+    def get_section(self, pkg):
+        """
+        Return the section of 'pkg'.
+        """
+        return self.features[self.sections[self.pkgs_ids[pkg]]]
@@ -1,12 +1,16 @@
 import os
 import re
-import commands
+
+from multiprocessing.pool import ThreadPool
 
 from apprecommender.data_classification import get_time_from_package
 from apprecommender.config import Config
+from apprecommender.dpkg_state import get_pkg_files
 from apprecommender.user import LocalSystem
 
 USER_DATA_DIR = Config().user_data_dir
+# threads stating the files of the packages, which mostly wait on the disk
+SCAN_THREADS = 8
 
 
 class PkgTime:
@@ -16,8 +20,8 @@ class PkgTime:
 
     def create_pkg_data(self):
         user = LocalSystem()
-        user.maximal_pkg_profile()
-        user.no_auto_pkg_profile()
+        user.apply_profile_stages([user.get_maximal_stage(),
+                                   user.get_no_auto_stage()])
         user_pkgs = user.pkg_profile
 
         pkgs_time = self.get_packages_time(user_pkgs)
@@ -27,10 +31,10 @@ class PkgTime:
     def get_best_time(self, pkg):
         valid_regex = re.compile(
             r'/usr/bin/|/usr/sbin|/usr/game/|/usr/lib/.+/')
-        pkg_files = commands.getoutput('dpkg -L {}'.format(pkg))
+        pkg_files = get_pkg_files(pkg)
 
         bestatime, bestmtime = 0, 0
-        for pkg_file in pkg_files.splitlines():
+        for pkg_file in pkg_files:
             if valid_regex.search(pkg_file):
                 access, modify = get_time_from_package(pkg_file, pkg_bin=False)
 
@@ -56,10 +60,16 @@ class PkgTime:
 
     def get_packages_time(self, pkgs, verbose=False):
         pkgs_time = {}
+        pkgs = list(pkgs)
 
-        for pkg in pkgs:
-            modify, access = self.get_best_time(pkg)
+        pool = ThreadPool(min(SCAN_THREADS, max(len(pkgs), 1)))
+        try:
+            best_times = pool.map(self.get_best_time, pkgs)
+        finally:
+            pool.close()
+            pool.join()
 
+        for pkg, (modify, access) in zip(pkgs, best_times):
             if modify and access:
                 if verbose:
                     print 'ADD: {}'.format(pkg)
@@ -1,3 +1,6 @@
+import numpy as np
+import scipy.sparse as sparse
+
 from numpy import array, where
 
 INVALID_PARAMETERS = -1
@@ -11,3 +14,37 @@ def create_column_matrix(matrix):
 
 def create_binary_matrix(original_vector, value, default_value):
     return where(original_vector == value, 1, default_value)
+
+
+def save_sparse_features(path, pkgs_list, features, classifications):
+    """
+    Save the features matrix of the packages in 'pkgs_list', as a CSR
+    matrix, and their classifications in the numpy archive at 'path'.
+    """
+    features = sparse.csr_matrix(features)
+
+    with open(path, 'wb') as features_file:
+        np.savez(features_file, data=features.data, indices=features.indices,
+                 indptr=features.indptr, shape=np.array(features.shape),
+                 pkgs=np.array(pkgs_list, dtype=str),
+                 classifications=np.array(classifications, dtype=str))
+
+
+def load_sparse_features(path):
+    """
+    Return the packages list, the CSR features matrix and the
+    classifications saved with save_sparse_features at 'path'.
+    """
+    features_file = np.load(path)
+    try:
+        features = sparse.csr_matrix(
+            (features_file['data'], features_file['indices'],
+             features_file['indptr']),
+            shape=tuple(features_file['shape']))
+        pkgs_list = [str(pkg) for pkg in features_file['pkgs']]
+        classifications = [str(label) for label in
+                           features_file['classifications']]
+    finally:
+        features_file.close()
+
+    return pkgs_list, features, classifications
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+    pkg_vocabulary - python module for the global vocabulary of package
+                     names, mapping them to int32 ids.
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+
+from apprecommender.config import Config
+
+vocabulary_cache = {}
+vocabulary_lock = threading.Lock()
+pkgs_sets = {}
+pkgs_sets_lock = threading.Lock()
+pkgs_files = {}
+pkgs_files_lock = threading.Lock()
+
+
+def get_vocabulary():
+    """
+    Return the package vocabulary of the configured data, loaded once per
+    process and again when it is built anew, or None if it was not built.
+    """
+    path = Config().pkgs_vocabulary
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        mtime = None
+    with vocabulary_lock:
+        cached = vocabulary_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            vocabulary_cache[path] = (mtime, PackageVocabulary.load(path))
+        return vocabulary_cache[path][1]
+
+
+def get_pkgs_set(pkgs, key=None):
+    """
+    Return a set of the package names in 'pkgs' for membership tests: a
+    PackageSet over the vocabulary if there is one, a python set otherwise.
+    Sets given a 'key', as the path of the list they were read from, are
+    built once per process for the same names and vocabulary.
+    """
+    vocabulary = get_vocabulary()
+    names = frozenset(pkgs)
+    if key is None:
+        return new_pkgs_set(vocabulary, names)
+    with pkgs_sets_lock:
+        cached = pkgs_sets.get(key)
+        if (cached is None or cached[0] is not vocabulary or
+                cached[1] != names):
+            pkgs_sets[key] = (vocabulary, names,
+                              new_pkgs_set(vocabulary, names))
+        return pkgs_sets[key][2]
+
+
+def new_pkgs_set(vocabulary, names):
+    if vocabulary is None:
+        return names
+    return PackageSet(vocabulary, names)
+
+
+def load_pkgs_set(path):
+    """
+    Return the set of the package names listed in the file at 'path', one
+    per line, read again only when the file or the vocabulary changes.
+    """
+    mtime = os.stat(path).st_mtime
+    vocabulary = get_vocabulary()
+    with pkgs_files_lock:
+        cached = pkgs_files.get(path)
+        if (cached is None or cached[0] != mtime or
+                cached[1] is not vocabulary):
+            with open(path) as pkgs_file:
+                names = frozenset([line.strip() for line in pkgs_file])
+            pkgs_files[path] = (mtime, vocabulary,
+                                new_pkgs_set(vocabulary, names))
+        return pkgs_files[path][2]
+
+
+class PackageVocabulary:
+
+    """
+    Sorted array of package names, where the id of a package is its
+    position. The array is saved as a fixed width numpy file and memory
+    mapped, so every process shares the same pages and names are looked up
+    by binary search.
+    """
+
+    @staticmethod
+    def build(pkgs, path):
+        """
+        Save the vocabulary of the package names in 'pkgs' at 'path'.
+        """
+        names = np.unique(np.array(list(set(pkgs)), dtype=str))
+        with open(path, 'wb') as vocabulary_file:
+            np.save(vocabulary_file, names)
+        logging.info("Vocabulary of %d packages saved at %s" %
+                     (len(names), path))
+        return PackageVocabulary(path)
+
+    @staticmethod
+    def load(path):
+        """
+        Return the vocabulary saved at 'path', or None if there is none.
+        """
+        if not os.path.exists(path):
+            logging.info("No package vocabulary found at %s" % path)
+            return None
+        return PackageVocabulary(path)
+
+    def __init__(self, path):
+        """
+        Set initial parameters.
+        """
+        self.path = path
+        self.names = np.load(path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, pkg):
+        return self.get_id(pkg) >= 0
+
+    def get_id(self, pkg):
+        """
+        Return the id of 'pkg', or -1 if it is not in the vocabulary.
+        """
+        # longer names would be truncated to the array width on comparison
+        if not self.names.size or len(pkg) > self.names.itemsize:
+            return -1
+        pkg_id = int(np.searchsorted(self.names, pkg))
+        if pkg_id < len(self.names) and self.names[pkg_id] == pkg:
+            return pkg_id
+        return -1
+
+    def get_ids(self, pkgs):
+        """
+        Return the int32 array of the ids of the names in 'pkgs', with -1
+        for names which are not in the vocabulary.
+        """
+        pkgs = np.array(list(pkgs), dtype=str)
+        if not pkgs.size or not self.names.size:
+            return np.zeros(len(pkgs), dtype=np.int32) - 1
+        ids = np.searchsorted(self.names, pkgs)
+        found = ids < len(self.names)
+        found[found] = self.names[ids[found]] == pkgs[found]
+        return np.where(found, ids, -1).astype(np.int32)
+
+    def get_names(self, ids):
+        """
+        Return the list of the names of the packages with the given ids.
+        """
+        return [str(name) for name in self.names[np.asarray(ids)]]
+
+    def get_mask(self, pkgs):
+        """
+        Return a boolean mask over the vocabulary with the packages in
+        'pkgs' set.
+        """
+        mask = np.zeros(len(self.names), dtype=bool)
+        ids = self.get_ids(pkgs)
+        mask[ids[ids >= 0]] = True
+        return mask
+
+
+class PackageSet:
+
+    """
+    Set of package names held as the sorted int32 array of their ids in the
+    package vocabulary, plus the few names out of the vocabulary. Names are
+    tested in batches, with one binary search over the vocabulary for the
+    names and one over the set for their ids.
+    """
+
+    def __init__(self, vocabulary, pkgs):
+        """
+        Set initial parameters.
+        """
+        self.vocabulary = vocabulary
+        pkgs = list(set(pkgs))
+        ids = vocabulary.get_ids(pkgs)
+        self.ids = np.unique(ids[ids >= 0]).astype(np.int32)
+        # names out of the vocabulary, as packages not in the repositories
+        self.others = frozenset([pkg for pkg, pkg_id in zip(pkgs, ids)
+                                 if pkg_id < 0])
+
+    def __contains__(self, pkg):
+        return bool(self.contains([pkg])[0])
+
+    def __iter__(self):
+        for pkg in self.vocabulary.get_names(self.ids):
+            yield pkg
+        for pkg in self.others:
+            yield pkg
+
+    def __len__(self):
+        return len(self.ids) + len(self.others)
+
+    def contains_ids(self, ids):
+        """
+        Return a boolean array telling which of the vocabulary 'ids' are in
+        the set.
+        """
+        ids = np.asarray(ids, dtype=np.int32)
+        if not len(self.ids):
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.ids, ids),
+                               len(self.ids) - 1)
+        return self.ids[positions] == ids
+
+    def contains(self, pkgs):
+        """
+        Return a boolean array telling which of the names in 'pkgs' are in
+        the set.
+        """
+        pkgs = list(pkgs)
+        ids = self.vocabulary.get_ids(pkgs)
+        member = self.contains_ids(ids)
+        if self.others:
+            for i in np.flatnonzero(ids < 0):
+                member[i] = pkgs[i] in self.others
+        return member
+
+    def filter(self, pkgs):
+        """
+        Return the names in 'pkgs' which are in the set, in order.
+        """
+        pkgs = list(pkgs)
+        return [pkg for pkg, is_member in zip(pkgs, self.contains(pkgs))
+                if is_member]
@@ -21,68 +21,253 @@ __license__ = """
 
 import logging
 import os
+import sys
+import threading
+import time
+import uuid
 import xapian
-import operator
 import strategy
 
+import numpy as np
+
+from collections import OrderedDict
+
+import apprecommender.database_pool as database_pool
+import apprecommender.warmup as warmup
+
+from apprecommender.bm25 import get_bm25_engine
 from apprecommender.config import Config
+from apprecommender.pkg_vocabulary import get_pkgs_set
+from apprecommender.term_store import get_term_store
 
 
-class RecommendationResult:
+class RecommendationResult(object):
     """
     Class designed to describe a recommendation result: items and scores.
+
+    Items and scores are kept as parallel arrays, so that ranking, top-k
+    selection and slicing do not need to sort or copy a dictionary.
     """
+
+    __slots__ = ('pkgs', 'scores', 'limit', 'ranked', '_item_score')
+
     def __init__(self, item_score, ranking=0, limit=0):
         """
         Set initial parameters.
         """
-        self.item_score = item_score
-        self.size = len(item_score)
-        self.limit = limit
         if ranking:
-            self.ranking = ranking
+            pkgs = list(ranking)
+            scores = [item_score[pkg] for pkg in pkgs]
+        else:
+            pkgs = item_score.keys()
+            scores = [item_score[pkg] for pkg in pkgs]
+
+        self.pkgs = np.array(pkgs, dtype=object)
+        self.scores = np.array(scores, dtype=float)
+        self.limit = limit
+        self.ranked = bool(ranking)
+        self._item_score = None
+
+    @classmethod
+    def from_arrays(cls, pkgs, scores, limit=0, ranked=False):
+        """
+        Create a result from parallel arrays of packages and scores. If
+        'ranked' is set, the arrays are assumed to be in decreasing score
+        order already.
+        """
+        result = cls.__new__(cls)
+        result.pkgs = np.asarray(pkgs, dtype=object)
+        result.scores = np.asarray(scores, dtype=float)
+        result.limit = limit
+        result.ranked = ranked
+        result._item_score = None
+        return result
+
+    @property
+    def size(self):
+        return len(self.pkgs)
+
+    @property
+    def item_score(self):
+        """
+        Dictionary view of the result, built only when requested.
+        """
+        if self._item_score is None:
+            self._item_score = dict(zip(self.pkgs.tolist(),
+                                        self.scores.tolist()))
+        return self._item_score
+
+    @property
+    def ranking(self):
+        """
+        Ranked list of packages.
+        """
+        return self.pkgs[self.get_order()].tolist()
 
     def __str__(self):
         """
         String representation of the object.
         """
-        # [FIXME] try alternative way to get pkgs summarys (efficiency)
-        # cache = apt.Cache()
-        result = self.get_prediction(self.limit)
-        str = "\n"
-        for i in range(len((list(result)))):
-            # summary = cache[result[i][0]].candidate.summary
-            # str += "%2d: %s\t\t- %s\n" % (i,result[i][0],summary)
-            str += "%2d: %s\n" % (i, result[i][0])
-        return str
+        lines = ["%2d: %s" % (i, pkg) for i, (pkg, _) in enumerate(self)]
+        return "\n" + "".join(line + "\n" for line in lines)
+
+    def __len__(self):
+        return len(self.get_order(self.limit))
+
+    def __iter__(self):
+        """
+        Iterate over ranked (package, score) pairs, up to the result limit.
+        """
+        order = self.get_order(self.limit)
+        return iter(zip(self.pkgs[order].tolist(),
+                        self.scores[order].tolist()))
+
+    def __getitem__(self, index):
+        """
+        Return the ranked (package, score) pair at 'index', or a new ranked
+        result when 'index' is a slice.
+        """
+        order = self.get_order(self.limit)
+        if isinstance(index, slice):
+            order = order[index]
+            return RecommendationResult.from_arrays(self.pkgs[order],
+                                                    self.scores[order],
+                                                    ranked=True)
+        position = order[index]
+        return (self.pkgs[position], float(self.scores[position]))
+
+    def get_order(self, limit=0):
+        """
+        Return the indices of the 'limit' best scored items, in decreasing
+        score order. Ties keep the order used by get_prediction: the item
+        stored last comes first.
+        """
+        size = self.size
+        if not limit or limit > size:
+            limit = size
+
+        if self.ranked:
+            return np.arange(limit)
+        if limit == 0:
+            return np.arange(0)
+
+        if limit < size:
+            top = np.argpartition(-self.scores, limit - 1)[:limit]
+            threshold = self.scores[top].min()
+            above = np.flatnonzero(self.scores > threshold)
+            tied = np.flatnonzero(self.scores == threshold)
+            indices = np.concatenate((above, tied[len(tied) - limit +
+                                                  len(above):]))
+        else:
+            indices = np.arange(size)
+
+        order = np.lexsort((-indices, -self.scores[indices]))
+        return indices[order]
 
     def get_prediction(self, limit=0):
         """
         Return prediction based on recommendation size (number of items).
         """
-        sorted_result = sorted(self.item_score.items(),
-                               key=operator.itemgetter(1))
-        if not limit or limit > self.size:
-            limit = self.size
+        order = self.get_order(limit)
+        return zip(self.pkgs[order].tolist(), self.scores[order].tolist())
 
-        return list(reversed(sorted_result[-limit:]))
+
+class RecommendationCache:
+    """
+    Bounded cache of ranked recommendation results, indexed by cursor tokens.
+
+    Entries expire 'expiry' seconds after their last use, and the least
+    recently used ones are dropped to keep the cache under 'max_size' bytes.
+    """
+
+    def __init__(self, max_size, expiry):
+        """
+        Set initial parameters.
+        """
+        self.max_size = max_size
+        self.expiry = expiry
+        # token -> (result, size, last use), least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_result_size(result):
+        """
+        Estimate the memory used by 'result', in bytes.
+        """
+        size = result.pkgs.nbytes + result.scores.nbytes
+        return size + sum([sys.getsizeof(pkg) for pkg in result.pkgs])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, result):
+        """
+        Keep 'result' and return its token, or None if it does not fit.
+        """
+        size = self.get_result_size(result)
+        if size > self.max_size:
+            return None
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.expire()
+            self.entries[token] = (result, size, time.time())
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, old_size, _) = self.entries.popitem(last=False)
+                self.size -= old_size
+        return token
+
+    def get(self, token):
+        """
+        Return the result kept for 'token', or None if it has expired.
+        """
+        with self.lock:
+            self.expire()
+            if token not in self.entries:
+                return None
+            result, size, _ = self.entries.pop(token)
+            self.entries[token] = (result, size, time.time())
+            return result
+
+    def expire(self):
+        # Must be called holding the lock
+        oldest_use = time.time() - self.expiry
+        while self.entries:
+            token, (_, size, last_use) = next(self.entries.iteritems())
+            if last_use >= oldest_use:
+                break
+            del self.entries[token]
+            self.size -= size
 
 
 class Recommender:
     """
     Class designed to play the role of recommender.
     """
+
+    cursor_cache = None
+    cursor_cache_lock = threading.Lock()
+
     def __init__(self):
         """
         Set initial parameters.
         """
         self.cfg = Config()
+        # Bring the indexes into the page cache once per process, so that
+        # the first recommendation is not slowed down by cold pages
+        if self.cfg.warmup:
+            warmup.warm_up(self.cfg)
         # Load xapian indexes
         # self.axi_programs = xapian.Database(cfg.axi_programs)
-        self.axi_desktopapps = xapian.Database(self.cfg.axi_desktopapps)
+        # Database handles are acquired from the process pools, so that
+        # recommenders used by concurrent threads do not share them
+        self.databases = []
+        self.axi_desktopapps = self.acquire_database(self.cfg.axi_desktopapps)
         if self.cfg.popcon:
             # self.popcon_programs = xapian.Database(cfg.popcon_programs)
-            self.popcon_desktopapps = xapian.Database(
+            self.popcon_desktopapps = self.acquire_database(
                 self.cfg.popcon_desktopapps)
         # Load valid programs, desktopapps and tags
         # format: one package or tag name per line
@@ -93,12 +278,25 @@ class Recommender:
         # with open(os.path.join(cfg.filters_dir,"programs")) as pkgs:
         #    self.valid_programs = [line.strip() for line in pkgs
         #                           if not line.startswith("#")]
-        with open(os.path.join(self.cfg.filters_dir, "desktopapps")) as pkgs:
+        desktopapps_path = os.path.join(self.cfg.filters_dir, "desktopapps")
+        with open(desktopapps_path) as pkgs:
             self.valid_desktopapps = [line.strip() for line in pkgs
                                       if not line.startswith("#")]
+        # the set is built once per process, over the package vocabulary
+        self.valid_desktopapps_set = get_pkgs_set(self.valid_desktopapps,
+                                                  desktopapps_path)
         with open(os.path.join(self.cfg.filters_dir, "debtags")) as tags:
             self.valid_tags = [line.strip() for line in tags
                                if not line.startswith("#")]
+        # Packed term vectors of the repositories, if up to date, are loaded
+        # once per process
+        self.term_store = get_term_store(self.cfg.term_store,
+                                         self.axi_desktopapps.get_doccount())
+        self.popcon_term_store = None
+        if self.cfg.popcon:
+            self.popcon_term_store = get_term_store(
+                self.cfg.popcon_term_store,
+                self.popcon_desktopapps.get_doccount())
         # Set xapian index weighting scheme
         if self.cfg.weight == "bm25":
             self.weight = xapian.BM25Weight(self.cfg.bm25_k1, self.cfg.bm25_k2,
@@ -107,6 +305,69 @@ class Recommender:
         else:
             self.weight = xapian.TradWeight()
         self.set_strategy(self.cfg.strategy)
+        # Cursors are shared by all recommenders of the process, as the web
+        # server creates one recommender per request
+        with Recommender.cursor_cache_lock:
+            if Recommender.cursor_cache is None:
+                Recommender.cursor_cache = RecommendationCache(
+                    self.cfg.cursor_cache_size * 1024 * 1024,
+                    self.cfg.cursor_cache_expiry)
+
+    def acquire_database(self, path):
+        """
+        Acquire a handle of the database at 'path' for this recommender.
+        """
+        database = database_pool.get_pool(path).acquire()
+        self.databases.append((path, database))
+        return database
+
+    def reopen(self):
+        """
+        Move the database handles of this recommender to the latest revision
+        of the indexes, as after they are rebuilt.
+        """
+        for path, database in self.databases:
+            database.reopen()
+
+    def close(self):
+        """
+        Give back the database handles of this recommender to their pools.
+        The recommender must not be used afterwards.
+        """
+        for path, database in self.databases:
+            database_pool.get_pool(path).release(database)
+        self.databases = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_items_engine(self):
+        """
+        Return the in-memory BM25 engine of the items repository, shared by
+        the recommenders of the process, or None if matches must be computed
+        by xapian.
+        """
+        if (self.cfg.items_engine != "sparse" or self.cfg.weight != "bm25" or
+                self.term_store is None or
+                self.items_repository is not self.axi_desktopapps):
+            return None
+        return get_bm25_engine(self.term_store, self.cfg.bm25_k1,
+                               self.cfg.bm25_k2, self.cfg.bm25_k3,
+                               self.cfg.bm25_b, self.cfg.bm25_nl)
+
+    def get_eset_store(self, users_repository=False):
+        """
+        Return the term vectors store to be used for query expansion, or
+        None if eset must be computed by xapian.
+        """
+        if self.cfg.eset_engine != "sparse":
+            return None
+        if users_repository:
+            return self.popcon_term_store
+        return self.term_store
 
     def set_strategy(self, strategy_str, k=0, n=0):
         """
@@ -128,7 +389,7 @@ class Recommender:
                 return 1
         # if self.cfg.pkgs_filter.split("/")[-1] == "desktopapps":
         self.items_repository = self.axi_desktopapps
-        self.valid_pkgs = self.valid_desktopapps
+        self.valid_pkgs = self.valid_desktopapps_set
         if "knn" in strategy_str:
             self.users_repository = self.popcon_desktopapps
         # else:
@@ -193,3 +454,121 @@ class Recommender:
             return ""
 
         return self.strategy.run(self, user, result_size)
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """
+        Return the cache token and the offset of 'cursor', or None if it is
+        malformed.
+        """
+        try:
+            token, offset = cursor.rsplit(":", 1)
+            offset = int(offset)
+        except ValueError:
+            return None
+        if offset < 0:
+            return None
+        return (token, offset)
+
+    @staticmethod
+    def get_page(candidates, token, offset, page_size):
+        # page of the cached 'candidates' and cursor of the next one
+        page = candidates[offset:offset + page_size]
+        next_offset = offset + page_size
+        if token is None or next_offset >= candidates.size:
+            return (page, None)
+        return (page, "%s:%d" % (token, next_offset))
+
+    @classmethod
+    def get_cursor_page(cls, cursor, page_size):
+        """
+        Return the page of 'page_size' results at 'cursor' and the cursor of
+        the next page, or (None, None) if 'cursor' is malformed or has
+        expired. Pages are sliced from the cursor cache of the process, so
+        no recommender is needed.
+        """
+        parsed_cursor = cls.parse_cursor(cursor)
+        if parsed_cursor is None:
+            logging.info("Invalid recommendation cursor: %s" % cursor)
+            return (None, None)
+        token, offset = parsed_cursor
+        candidates = None
+        if cls.cursor_cache is not None:
+            candidates = cls.cursor_cache.get(token)
+        if candidates is None:
+            return (None, None)
+        return cls.get_page(candidates, token, offset, page_size)
+
+    def get_recommendation_page(self, user, page_size, cursor=None):
+        """
+        Return a page of 'page_size' ranked results and the cursor of the
+        next page, or None if there are no more results. Candidates are
+        ranked once, up to cfg.cursor_results, and kept in the cursor cache,
+        so the following pages are sliced from them. If 'cursor' has
+        expired, candidates are computed again for 'user', or (None, None)
+        is returned if no user is given. Malformed cursors are handled as
+        expired ones, without computing candidates again.
+        """
+        if cursor and user is None:
+            return self.get_cursor_page(cursor, page_size)
+
+        token, offset, candidates = None, 0, None
+        if cursor:
+            parsed_cursor = self.parse_cursor(cursor)
+            if parsed_cursor is None:
+                logging.info("Invalid recommendation cursor: %s" % cursor)
+                return (None, None)
+            token, offset = parsed_cursor
+            candidates = self.cursor_cache.get(token)
+
+        if candidates is None:
+            if user is None:
+                return (None, None)
+            result = self.get_recommendation(
+                user, max(self.cfg.cursor_results, offset + page_size))
+            if not result:
+                return (result, None)
+            candidates = result[:]
+            token = self.cursor_cache.add(candidates)
+
+        return self.get_page(candidates, token, offset, page_size)
+
+    def get_recommendations(self, user, strategies, result_size=100,
+                            progress=None):
+        """
+        Produces one recommendation for each strategy in 'strategies', all of
+        them starting from the current user profile. The intermediate results
+        the strategies have in common (profiles, profile documents, term
+        statistics and suggestions) are computed only once. The time spent
+        on each strategy, in seconds, is kept in recommendations_time. If
+        given, 'progress' is called with the name of each strategy and the
+        number of strategies done once it is computed.
+        """
+        pkg_profile = list(user.pkg_profile)
+        sharing = user.shared is not None
+        if not sharing:
+            user.share_computations()
+
+        recommendations = OrderedDict()
+        self.recommendations_time = OrderedDict()
+        try:
+            for strategy_str in strategies:
+                begin_time = time.time()
+                user.pkg_profile = list(pkg_profile)
+                if self.set_strategy(strategy_str):
+                    self.strategy = None
+                recommendations[strategy_str] = self.get_recommendation(
+                    user, result_size)
+                self.recommendations_time[strategy_str] = (time.time() -
+                                                           begin_time)
+                logging.info("Strategy %s computed in %.3f seconds" %
+                             (strategy_str,
+                              self.recommendations_time[strategy_str]))
+                if progress:
+                    progress(strategy_str, len(recommendations))
+        finally:
+            user.pkg_profile = pkg_profile
+            if not sharing:
+                user.share_computations(False)
+
+        return recommendations
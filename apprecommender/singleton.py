@@ -20,15 +20,23 @@ __license__ = """
 """
 
 
+import threading
+
+
 class Singleton(object):
     """
     Base class for inheritance of only-one-instance classes.
     Singleton design pattern.
     """
+    _lock = threading.Lock()
+
     def __new__(cls, *args, **kwargs):
         """
         Creates a new instance of the class only if none already exists.
+        Concurrent threads creating the first instance get the same one.
         """
         if '_inst' not in vars(cls):
-            cls._inst = object.__new__(cls)
+            with Singleton._lock:
+                if '_inst' not in vars(cls):
+                    cls._inst = object.__new__(cls)
         return cls._inst
@@ -20,13 +20,13 @@ __license__ = """
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import apt
 import data
 import logging
 import operator
 import os
 import pickle
 import recommender
+import threading
 import xapian
 
 import numpy as np
@@ -34,6 +34,7 @@ import numpy as np
 from abc import ABCMeta, abstractmethod
 from os import path
 
+from apprecommender.apt_cache import get_cache
 from apprecommender.error import Error
 from apprecommender.config import Config
 from apprecommender.ml.bag_of_words import BagOfWords
@@ -41,6 +42,7 @@ from apprecommender.ml.bayes_matrix import BayesMatrix
 from apprecommender.ml.data import MachineLearningData
 from apprecommender.decider import (PkgMatchDecider, PkgExpandDecider,
                                     TagExpandDecider)
+from apprecommender.term_store import PKG_TERM, TAG_TERM
 
 XAPIAN_DATABASE_PATH = path.expanduser('~/.app-recommender/axi_desktopapps/')
 USER_DATA_DIR = Config().user_data_dir
@@ -71,6 +73,21 @@ class ContentBased(RecommendationStrategy):
 
     def get_sugestion_from_profile(self, rec, user, profile,
                                    recommendation_size):
+        key = ('suggestion', data.get_database_key(rec.items_repository),
+               tuple(profile), recommendation_size)
+        return user.get_shared(key, lambda: self.get_mset_suggestion(
+            rec, user, profile, recommendation_size))
+
+    def get_mset_suggestion(self, rec, user, profile, recommendation_size):
+        engine = rec.get_items_engine()
+        if engine and engine.can_score(profile):
+            mask = user.get_shared(
+                ('exclusion_mask', engine.store.path),
+                lambda: engine.get_exclusion_mask(user.get_installed_pkgs()))
+            pkgs, weights = engine.score(profile, recommendation_size, mask)
+            return recommender.RecommendationResult.from_arrays(
+                pkgs, weights, ranked=True)
+
         query = xapian.Query(xapian.Query.OP_OR, profile)
         enquire = xapian.Enquire(rec.items_repository)
         enquire.set_weighting_scheme(rec.weight)
@@ -78,18 +95,16 @@ class ContentBased(RecommendationStrategy):
         # Retrieve matching packages
         try:
             mset = enquire.get_mset(0, recommendation_size, None,
-                                    PkgMatchDecider(user.installed_pkgs))
+                                    PkgMatchDecider(user.get_installed_pkgs()))
         except xapian.DatabaseError as error:
             logging.critical("Content-based strategy: " + error.get_msg())
 
-        # Compose result dictionary
-        item_score = {}
-        ranking = []
-        for m in mset:
-            item_score[m.document.get_data()] = m.weight
-            ranking.append(m.document.get_data())
+        # Compose ranked result
+        pkgs = [m.document.get_data() for m in mset]
+        weights = [m.weight for m in mset]
 
-        result = recommender.RecommendationResult(item_score, ranking)
+        result = recommender.RecommendationResult.from_arrays(pkgs, weights,
+                                                              ranked=True)
         return result
 
     def run(self, rec, user, rec_size):
@@ -98,7 +113,9 @@ class ContentBased(RecommendationStrategy):
         """
         logging.debug("Composing user profile...")
         profile = user.content_profile(rec.items_repository, self.content,
-                                       self.profile_size, rec.valid_tags)
+                                       self.profile_size, rec.valid_tags,
+                                       term_store=rec.term_store,
+                                       eset_store=rec.get_eset_store())
         logging.debug(profile)
         result = self.get_sugestion_from_profile(rec, user, profile, rec_size)
         return result
@@ -130,6 +147,10 @@ class Collaborative(RecommendationStrategy):
         profile = self.get_user_profile(user, rec)
         # query = xapian.Query(xapian.Query.OP_OR,profile)
         query = xapian.Query(xapian.Query.OP_ELITE_SET, profile)
+        shards = self.get_neighborhood_shards(user, rec)
+        if shards:
+            query = xapian.Query(xapian.Query.OP_FILTER, query,
+                                 xapian.Query(xapian.Query.OP_OR, shards))
         enquire = self.get_enquire(rec)
         enquire.set_query(query)
         # Retrieve matching users
@@ -141,6 +162,22 @@ class Collaborative(RecommendationStrategy):
             raise Error
         return mset
 
+    def get_neighborhood_shards(self, user, rec):
+        """
+        Return the shard terms of the users repository to be searched for
+        the user neighbours, or None to search all of it.
+        """
+        if not rec.cfg.popcon_shards:
+            return None
+        medoids = data.get_shards_medoids(rec.users_repository)
+        if not medoids:
+            return None
+        shards = data.get_nearest_shards(
+            medoids, user.filter_pkg_profile(rec.valid_pkgs),
+            rec.cfg.popcon_shards, self.neighbours, rec.users_repository)
+        logging.debug("Searching neighbours in shards %s" % shards)
+        return [data.SHARD_PREFIX + str(shard) for shard in shards]
+
     def get_neighborhood_rset(self, user, rec):
         mset = self.get_neighborhood(user, rec)
         rset = xapian.RSet()
@@ -148,15 +185,38 @@ class Collaborative(RecommendationStrategy):
             rset.add_document(m.document.get_docid())
         return rset
 
+    def get_neighborhood_eset(self, user, rec, size, decider, term_class):
+        """
+        Return the 'size' best (term, weight) pairs of the neighborhood
+        profile expansion, accepted by 'decider'.
+        """
+        term_store = rec.get_eset_store(users_repository=True)
+        if term_store is not None:
+            mset = self.get_neighborhood(user, rec)
+            rows = term_store.get_rows([m.docid for m in mset])
+            return term_store.eset(rows, size,
+                                   term_store.class_mask(term_class),
+                                   decider)
+
+        neighbors_rset = self.get_neighborhood_rset(user, rec)
+        enquire = self.get_enquire(rec)
+        eset = enquire.get_eset(size, neighbors_rset, decider)
+        return [(e.term, e.weight) for e in eset]
+
     def get_result_from_eset(self, eset):
-        # compose result dictionary
-        item_score = {}
-        ranking = []
-        for e in eset:
-            package = e.term.lstrip("XP")
-            item_score[package] = e.weight
-            ranking.append(package)
-        return recommender.RecommendationResult(item_score, ranking)
+        # compose ranked result from (term, weight) pairs
+        pkgs = [term.lstrip("XP") for term, _ in eset]
+        weights = [weight for _, weight in eset]
+        return recommender.RecommendationResult.from_arrays(pkgs, weights,
+                                                            ranked=True)
+
+    def get_result_from_weights(self, weights, recommendation_size):
+        # compose ranked result from sorted (term, weight) pairs
+        weights = weights[:recommendation_size]
+        pkgs = [pkg[0].lstrip("XP") for pkg in weights]
+        scores = [pkg[1] for pkg in weights]
+        return recommender.RecommendationResult.from_arrays(pkgs, scores,
+                                                            ranked=True)
 
 
 class Knn(Collaborative):
@@ -176,14 +236,7 @@ class Knn(Collaborative):
         neighborhood = self.get_neighborhood(user, rec)
         weights = data.tfidf_weighting(rec.users_repository, neighborhood,
                                        PkgExpandDecider(user.items()))
-        item_score = {}
-        ranking = []
-        for pkg in weights[:recommendation_size]:
-            package = pkg[0].lstrip("XP")
-            item_score[package] = pkg[1]
-            ranking.append(package)
-        result = recommender.RecommendationResult(item_score, ranking)
-        return result
+        return self.get_result_from_weights(weights, recommendation_size)
 
 
 class KnnPlus(Collaborative):
@@ -203,14 +256,7 @@ class KnnPlus(Collaborative):
         neighborhood = self.get_neighborhood(user, rec)
         weights = data.tfidf_plus(rec.users_repository, neighborhood,
                                   PkgExpandDecider(user.items()))
-        item_score = {}
-        ranking = []
-        for pkg in weights[:recommendation_size]:
-            package = pkg[0].lstrip("XP")
-            item_score[package] = pkg[1]
-            ranking.append(package)
-        result = recommender.RecommendationResult(item_score, ranking)
-        return result
+        return self.get_result_from_weights(weights, recommendation_size)
 
 
 class KnnEset(Collaborative):
@@ -227,11 +273,10 @@ class KnnEset(Collaborative):
         """
         Perform recommendation strategy.
         """
-        neighbors_rset = self.get_neighborhood_rset(user, rec)
-        enquire = self.get_enquire(rec)
         # Retrieve new packages based on neighborhood profile expansion
-        eset = enquire.get_eset(recommendation_size, neighbors_rset,
-                                PkgExpandDecider(user.items()))
+        eset = self.get_neighborhood_eset(user, rec, recommendation_size,
+                                          PkgExpandDecider(user.items()),
+                                          PKG_TERM)
         result = self.get_result_from_eset(eset)
         return result
 
@@ -265,7 +310,7 @@ class CollaborativeEset(Collaborative):
         enquire.set_weighting_scheme(rec.weight)
         eset = enquire.get_eset(recommendation_size, rset,
                                 PkgExpandDecider(user.items()))
-        result = self.get_result_from_eset(eset)
+        result = self.get_result_from_eset([(e.term, e.weight) for e in eset])
         return result
 
 
@@ -308,12 +353,10 @@ class KnnContentEset(Collaborative):
         """
         Perform recommendation strategy.
         """
-        neighbors_rset = self.get_neighborhood_rset(user, rec)
-        enquire = self.get_enquire(rec)
         # Retrieve relevant tags based on neighborhood profile expansion
-        eset = enquire.get_eset(rec.cfg.profile_size, neighbors_rset,
-                                TagExpandDecider())
-        profile = [e.term for e in eset]
+        eset = self.get_neighborhood_eset(user, rec, rec.cfg.profile_size,
+                                          TagExpandDecider(), TAG_TERM)
+        profile = [term for term, _ in eset]
         result = ContentBased("tag", rec.cfg.profile_size)
         result = result.get_sugestion_from_profile(rec, user, profile,
                                                    recommendation_size)
@@ -345,7 +388,7 @@ class Demographic(RecommendationStrategy):
             rec.set_strategy(self.strategy_str)
             # Redefine repositories after configuring strategy
             rec.items_repository = rec.axi_desktopapps
-            rec.valid_pkgs = rec.valid_desktopapps
+            rec.valid_pkgs = rec.valid_desktopapps_set
             if "col" in self.strategy_str:
                 rec.users_repository = rec.popcon_desktopapps
         return rec.get_recommendation(user, recommendation_size)
@@ -356,6 +399,7 @@ class MachineLearning(ContentBased):
     __metaclass__ = ABCMeta
 
     PKGS_CLASSIFICATIONS = None
+    PKGS_CLASSIFICATIONS_LOCK = threading.Lock()
 
     def __init__(self, content, profile_size, suggestion_size=200):
         ContentBased.__init__(self, content, profile_size)
@@ -363,7 +407,7 @@ class MachineLearning(ContentBased):
         self.description = 'Machine-learning'
         self.profile_size = profile_size
         self.suggestion_size = suggestion_size
-        self.cache = apt.Cache()
+        self.cache = get_cache()
         self.ml_data = MachineLearningData()
         self.axi = xapian.Database(XAPIAN_DATABASE_PATH)
 
@@ -410,43 +454,39 @@ class MachineLearning(ContentBased):
 
     def get_pkgs_and_scores(self, rec, user):
         profile = user.content_profile(rec.items_repository, self.content,
-                                       self.suggestion_size, rec.valid_tags)
+                                       self.suggestion_size, rec.valid_tags,
+                                       term_store=rec.term_store,
+                                       eset_store=rec.get_eset_store())
 
         content_based = self.get_sugestion_from_profile(rec, user,
                                                         profile,
                                                         self.suggestion_size)
         pkgs, pkgs_score = [], {}
-        for pkg_line in str(content_based).splitlines()[1:]:
-            pkg = pkg_line.split(':')[1][1:]
-            pkg_score = int(pkg_line.split(':')[0].strip())
-
+        for rank, (pkg, _) in enumerate(content_based):
             pkgs.append(pkg)
-            pkgs_score[pkg] = self.suggestion_size - pkg_score
+            pkgs_score[pkg] = self.suggestion_size - rank
 
         return pkgs, pkgs_score
 
     def get_pkgs_classifications(self, pkgs, terms_name, debtags_name):
         ml_strategy = self.get_ml_strategy()
-        pkgs_classifications = {}
         kwargs = {}
 
         kwargs['terms_name'] = terms_name
         kwargs['debtags_name'] = debtags_name
         kwargs['ml_strategy'] = ml_strategy
 
-        for pkg in pkgs:
-
-            if pkg not in self.cache:
-                continue
+        pkgs = [pkg for pkg in pkgs if pkg in self.cache]
+        if not pkgs:
+            return {}
 
-            attribute_vector = self.prepare_pkg_data(
-                pkg, **kwargs)
+        # The candidates are classified all at once
+        attribute_vectors = [self.prepare_pkg_data(pkg, **kwargs)
+                             for pkg in pkgs]
+        classifications = self.get_pkgs_classification(ml_strategy,
+                                                       attribute_vectors)
 
-            classification = self.get_pkg_classification(
-                ml_strategy, attribute_vector)
-            pkgs_classifications[pkg] = classification
-
-        return pkgs_classifications
+        return dict(zip(pkgs, classifications))
 
     def load_terms_and_debtags(self):
         terms_name = []
@@ -464,10 +504,14 @@ class MachineLearning(ContentBased):
 
     @staticmethod
     def train(cls):
-        if MachineLearning.PKGS_CLASSIFICATIONS is None:
-            ml_data = MachineLearningData()
-            labels = ['RU', 'U', 'NU']
-            MachineLearning.PKGS_CLASSIFICATIONS = ml_data.create_data(labels)
+        # The classifications data is created once, even if several threads
+        # train at the same time
+        with MachineLearning.PKGS_CLASSIFICATIONS_LOCK:
+            if MachineLearning.PKGS_CLASSIFICATIONS is None:
+                ml_data = MachineLearningData()
+                labels = ['RU', 'U', 'NU']
+                MachineLearning.PKGS_CLASSIFICATIONS = ml_data.create_data(
+                    labels)
 
         cls.run_train(MachineLearning.PKGS_CLASSIFICATIONS)
 
@@ -483,6 +527,10 @@ class MachineLearning(ContentBased):
     def get_pkg_classification(self, ml_strategy, attribute_vector):
         raise NotImplementedError("Method not implemented.")
 
+    @abstractmethod
+    def get_pkgs_classification(self, ml_strategy, attribute_vectors):
+        raise NotImplementedError("Method not implemented.")
+
     @abstractmethod
     def get_terms_path(self):
         raise NotImplementedError("Method not implemented.")
@@ -526,6 +574,9 @@ class MachineLearningBVA(MachineLearning):
     def get_pkg_classification(self, ml_strategy, attribute_vector):
         return ml_strategy.get_classification(attribute_vector)
 
+    def get_pkgs_classification(self, ml_strategy, attribute_vectors):
+        return ml_strategy.classify_batch(np.vstack(attribute_vectors))
+
     def get_terms_path(self):
         return MachineLearningData.MACHINE_LEARNING_TERMS
 
@@ -578,6 +629,9 @@ class MachineLearningBOW(MachineLearning):
     def get_pkg_classification(self, ml_strategy, attribute_vector):
         return ml_strategy.classify_pkg(attribute_vector)
 
+    def get_pkgs_classification(self, ml_strategy, attribute_vectors):
+        return ml_strategy.classify_batch(attribute_vectors)
+
     def get_terms_path(self):
         return BagOfWords.BAG_OF_WORDS_TERMS
 
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""
+    term_store - python module for the per-package term vectors of the items
+                 repository, built offline and memory-mapped at runtime.
+"""
+
+import logging
+import operator
+import os
+import pickle
+import shutil
+import threading
+import xapian
+
+import numpy as np
+import scipy.sparse as sparse
+
+from collections import OrderedDict
+
+from apprecommender.data_classification import (get_time_weights,
+                                                get_usage_time_store)
+from apprecommender.decider import (FilterTag, FilterDescription,
+                                    FilterTag_or_Description)
+
+TAG_TERM = 1
+DESCRIPTION_TERM = 2
+PKG_TERM = 4
+
+FILTER_TERM_CLASSES = {FilterTag: TAG_TERM,
+                       FilterDescription: DESCRIPTION_TERM,
+                       FilterTag_or_Description: TAG_TERM | DESCRIPTION_TERM}
+
+stores_cache = {}
+stores_lock = threading.Lock()
+
+
+def get_term_store(path, doc_count):
+    """
+    Return the term vectors store saved at 'path', loaded once per process
+    and again when it is built anew, or None if there is none or if it does
+    not hold the 'doc_count' documents of its index.
+    """
+    try:
+        mtime = os.stat(os.path.join(path,
+                                     TermVectorStore.VOCABULARY)).st_mtime
+    except OSError:
+        mtime = None
+    with stores_lock:
+        cached = stores_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            stores_cache[path] = (mtime, TermVectorStore.load(path))
+        term_store = stores_cache[path][1]
+    if term_store is not None and term_store.doc_count != doc_count:
+        logging.info("Term vectors store %s is out of date, ignoring it"
+                     % path)
+        return None
+    return term_store
+
+
+class TermVectorStore:
+
+    """
+    Packed term vectors of every document of a xapian repository.
+
+    The store is laid out as a CSR matrix of documents x terms: 'indptr'
+    holds the offsets of each document row, 'indices' the term ids and 'wdf'
+    the within document frequencies. Only terms that can take part in a
+    profile (valid tags, description terms and, optionally, packages) are
+    kept, and each term is marked with its class, so term filters become
+    array masks. Rows are named after the document data, which is the
+    package name on the items repository.
+    """
+
+    VOCABULARY = 'vocabulary.pickle'
+    ARRAYS = ['indptr', 'indices', 'wdf', 'term_class', 'term_freq',
+              'docids', 'doc_length']
+
+    @staticmethod
+    def build(index, path, valid_tags, pkgs_terms=False):
+        """
+        Walk the documents of 'index' once and save their filtered term
+        vectors at 'path'. Package terms ('XP') are only kept if
+        'pkgs_terms' is set, as needed for the users repository.
+        """
+        tag_filter = FilterTag(valid_tags)
+        description_filter = FilterDescription()
+
+        def get_term_class(term):
+            if term.startswith('XP'):
+                return PKG_TERM if pkgs_terms else 0
+            if tag_filter(term):
+                return TAG_TERM
+            if description_filter(term):
+                return DESCRIPTION_TERM
+            return 0
+
+        terms = []
+        terms_ids = {}
+        excluded_terms = set()
+        term_class = []
+        pkgs = []
+        indptr = [0]
+        indices = []
+        wdf = []
+        docids = []
+        doc_length = []
+        for docid in range(1, index.get_lastdocid() + 1):
+            try:
+                doc = index.get_document(docid)
+            except xapian.DocNotFoundError:
+                continue
+            for term in doc.termlist():
+                if term.term in excluded_terms:
+                    continue
+                if term.term not in terms_ids:
+                    term_type = get_term_class(term.term)
+                    if not term_type:
+                        excluded_terms.add(term.term)
+                        continue
+                    terms_ids[term.term] = len(terms)
+                    terms.append(term.term)
+                    term_class.append(term_type)
+                indices.append(terms_ids[term.term])
+                wdf.append(term.wdf)
+            pkgs.append(doc.get_data())
+            indptr.append(len(indices))
+            docids.append(docid)
+            doc_length.append(index.get_doclength(docid))
+
+        term_freq = [index.get_termfreq(term) for term in terms]
+
+        shutil.rmtree(path, 1)
+        os.makedirs(path)
+        arrays = {'indptr': np.array(indptr, dtype=np.int64),
+                  'indices': np.array(indices, dtype=np.int32),
+                  'wdf': np.array(wdf, dtype=np.int32),
+                  'term_class': np.array(term_class, dtype=np.int8),
+                  'term_freq': np.array(term_freq, dtype=np.int32),
+                  'docids': np.array(docids, dtype=np.int32),
+                  'doc_length': np.array(doc_length, dtype=np.int32)}
+        for name in TermVectorStore.ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), arrays[name])
+        vocabulary_path = os.path.join(path, TermVectorStore.VOCABULARY)
+        with open(vocabulary_path, 'wb') as text:
+            pickle.dump({'terms': terms, 'pkgs': pkgs,
+                         'doc_count': index.get_doccount(),
+                         'avlength': index.get_avlength()}, text)
+
+        logging.info("Term vectors of %d documents and %d terms saved at %s"
+                     % (len(pkgs), len(terms), path))
+        with stores_lock:
+            stores_cache.pop(path, None)
+        return TermVectorStore(path)
+
+    @staticmethod
+    def load(path):
+        """
+        Return the store saved at 'path', or None if there is none.
+        """
+        files = [name + '.npy' for name in TermVectorStore.ARRAYS]
+        files.append(TermVectorStore.VOCABULARY)
+        for name in files:
+            if not os.path.exists(os.path.join(path, name)):
+                logging.info("No term vectors store found at %s" % path)
+                return None
+        return TermVectorStore(path)
+
+    def __init__(self, path, cache_size=1024):
+        """
+        Set initial parameters. The arrays are memory-mapped, so only the
+        pages of the documents actually used are read from disk. Stores are
+        shared by the threads of the process, so the cache of the most
+        recently used packages is locked.
+        """
+        self.path = path
+        vocabulary_path = os.path.join(path, TermVectorStore.VOCABULARY)
+        with open(vocabulary_path, 'rb') as text:
+            vocabulary = pickle.load(text)
+        self.terms = vocabulary['terms']
+        self.pkgs = vocabulary['pkgs']
+        self.doc_count = vocabulary['doc_count']
+        self.avlength = vocabulary['avlength']
+        self.pkgs_ids = dict((pkg, i) for i, pkg in enumerate(self.pkgs))
+        self.docids_rows = None
+
+        for name in TermVectorStore.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'),
+                                        mmap_mode='r'))
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.masks = {}
+
+    def __contains__(self, pkg):
+        return pkg in self.pkgs_ids
+
+    def __len__(self):
+        return len(self.pkgs)
+
+    def get(self, pkg):
+        """
+        Return the term ids and wdf arrays of 'pkg', keeping the most
+        recently used packages in memory.
+        """
+        with self.cache_lock:
+            if pkg in self.cache:
+                vector = self.cache.pop(pkg)
+            else:
+                row = self.pkgs_ids[pkg]
+                begin, end = self.indptr[row], self.indptr[row + 1]
+                vector = (np.array(self.indices[begin:end]),
+                          np.array(self.wdf[begin:end]))
+                if len(self.cache) >= self.cache_size:
+                    self.cache.popitem(last=False)
+            self.cache[pkg] = vector
+            return vector
+
+    def get_rows(self, docids):
+        """
+        Return the rows of the documents with the given xapian docids.
+        """
+        if self.docids_rows is None:
+            self.docids_rows = dict((docid, row) for row, docid in
+                                    enumerate(self.docids.tolist()))
+        return [self.docids_rows[docid] for docid in docids
+                if docid in self.docids_rows]
+
+    def class_mask(self, term_class):
+        """
+        Return a boolean mask over the vocabulary with the terms of the
+        classes set in 'term_class'.
+        """
+        if term_class not in self.masks:
+            self.masks[term_class] = (np.asarray(self.term_class) &
+                                      term_class) > 0
+        return self.masks[term_class]
+
+    def filter_mask(self, content_filter):
+        """
+        Return a boolean mask over the vocabulary with the terms accepted by
+        'content_filter'.
+        """
+        filter_class = type(content_filter)
+        valid_tags = getattr(content_filter, 'valid_tags', None)
+        key = (filter_class, frozenset(valid_tags or []))
+        if key not in self.masks:
+            if filter_class in FILTER_TERM_CLASSES:
+                mask = self.class_mask(FILTER_TERM_CLASSES[filter_class])
+                mask = mask.copy()
+                # tag terms were kept for the valid tags of the build, which
+                # may not be the valid tags of this filter
+                tags = np.flatnonzero(mask & self.class_mask(TAG_TERM))
+                mask[tags] = [bool(content_filter(self.terms[term_id]))
+                              for term_id in tags]
+            else:
+                mask = np.array([bool(content_filter(term))
+                                 for term in self.terms])
+            self.masks[key] = mask
+        return self.masks[key]
+
+    def eset(self, rows, size, term_mask, decider=None, expand_k=1.0):
+        """
+        Return the 'size' best expansion terms for the relevant set made of
+        the documents in 'rows', as (term, weight) pairs. Terms are weighted
+        as xapian does in Enquire.get_eset: the probabilistic (Robertson
+        Sparck-Jones) relevance weight times the sum of the normalized wdf of
+        the term over the relevant documents. Only terms in 'term_mask' are
+        considered and, if given, 'decider' is only called on the best
+        ranked candidates until 'size' terms are accepted.
+        """
+        return self.esets(rows, size, [term_mask], decider, expand_k)[0]
+
+    def esets(self, rows, size, term_masks, decider=None, expand_k=1.0):
+        """
+        Return one expansion set, as in eset, for each mask in 'term_masks',
+        merging the term vectors of the relevant documents only once.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return [[] for term_mask in term_masks]
+
+        begins = np.asarray(self.indptr)[rows]
+        ends = np.asarray(self.indptr)[rows + 1]
+        positions = np.concatenate([np.arange(begin, end) for begin, end
+                                    in zip(begins, ends)])
+        term_ids = np.asarray(self.indices)[positions]
+        wdf = np.maximum(np.asarray(self.wdf)[positions], 1).astype(float)
+        doc_length = np.repeat(np.asarray(self.doc_length)[rows],
+                               ends - begins)
+
+        num_terms = len(self.terms)
+        normalized_wdf = ((expand_k + 1) * wdf /
+                          (expand_k * doc_length / self.avlength + wdf))
+        multiplier = np.bincount(term_ids, weights=normalized_wdf,
+                                 minlength=num_terms)
+        rel_term_freq = np.bincount(term_ids, minlength=num_terms)
+        rel_size = float(len(rows))
+
+        esets = []
+        for term_mask in term_masks:
+            candidates = np.flatnonzero((rel_term_freq > 0) & term_mask)
+            r = rel_term_freq[candidates].astype(float)
+            n = np.asarray(self.term_freq)[candidates].astype(float)
+
+            term_weight = ((r + 0.5) *
+                           (self.doc_count - n - rel_size + r + 0.5) /
+                           ((rel_size - r + 0.5) * (n - r + 0.5)))
+            term_weight = np.where(term_weight < 2, term_weight * 0.5 + 1,
+                                   term_weight)
+            weights = np.log(term_weight) * multiplier[candidates]
+
+            eset = []
+            for i in np.argsort(-weights, kind='mergesort'):
+                if len(eset) == size or weights[i] <= 0:
+                    break
+                term = self.terms[candidates[i]]
+                if decider is None or decider(term):
+                    eset.append((term, float(weights[i])))
+            esets.append(eset)
+        return esets
+
+    def tfidf_weighting(self, pkgs_list, content_filter, time_context=0):
+        """
+        Return the terms of the packages in 'pkgs_list' accepted by
+        'content_filter', sorted by their sublinear tfidf weight. It gives
+        the same weights as data.tfidf_weighting on the items repository.
+        """
+        return self.tfidf_weighting_multi(pkgs_list, [content_filter],
+                                          time_context)[0]
+
+    def tfidf_weighting_multi(self, pkgs_list, content_filters,
+                              time_context=0):
+        """
+        Return one tfidf profile, as in tfidf_weighting, for each filter in
+        'content_filters'. Term counts and time weights are computed once
+        for all the terms accepted by any of the filters.
+        """
+        pkgs_list = [pkg for pkg in pkgs_list if pkg in self]
+        if not pkgs_list:
+            return [[] for content_filter in content_filters]
+
+        vectors = [self.get(pkg)[0] for pkg in pkgs_list]
+        term_ids = np.concatenate(vectors)
+        pkgs_rows = np.repeat(np.arange(len(vectors)),
+                              [len(vector) for vector in vectors])
+
+        masks = [self.filter_mask(content_filter)
+                 for content_filter in content_filters]
+        accepted = np.logical_or.reduce(masks)[term_ids]
+        term_ids, pkgs_rows = term_ids[accepted], pkgs_rows[accepted]
+        profile_terms, counts = np.unique(term_ids, return_counts=True)
+
+        tf = 1 + np.log(counts)
+        idf = np.log(self.doc_count /
+                     np.asarray(self.term_freq)[profile_terms].astype(float))
+        weights = tf * idf
+
+        if time_context:
+            incidence = sparse.csr_matrix(
+                (np.ones(len(term_ids), dtype=np.int32),
+                 (np.searchsorted(profile_terms, term_ids), pkgs_rows)),
+                shape=(len(profile_terms), len(pkgs_list)))
+            time_weights = get_time_weights(
+                [self.terms[term_id] for term_id in profile_terms],
+                incidence, pkgs_list)
+            # same as data.get_tfidf_terms_weights: terms without time
+            # weight keep their tfidf weight
+            weights = np.where(np.isnan(time_weights), weights,
+                               weights * time_weights)
+            get_usage_time_store().save()
+
+        profiles = []
+        for mask in masks:
+            selected = np.flatnonzero(mask[profile_terms])
+            # rank as data.tfidf_weighting does, so ties keep the same order
+            # when profiles are cut: terms are weighted in termlist order,
+            # which is sorted, and ranked by a reversed stable sort
+            profile = dict(sorted((self.terms[profile_terms[i]],
+                                   float(weights[i])) for i in selected))
+            profiles.append(list(reversed(sorted(
+                profile.items(), key=operator.itemgetter(1)))))
+        return profiles
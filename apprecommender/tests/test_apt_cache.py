@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import unittest
+
+from apprecommender.apt_cache import CacheSnapshot, get_cache
+
+
+class CacheSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = CacheSnapshot({'gimp': 'gimp-package'})
+
+    def test_read(self):
+        self.assertEqual('gimp-package', self.snapshot['gimp'])
+        self.assertIn('gimp', self.snapshot)
+        self.assertNotIn('vim', self.snapshot)
+        self.assertEqual(1, len(self.snapshot))
+        self.assertIsNone(self.snapshot.get('vim'))
+
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            self.snapshot['vim'] = 'vim-package'
+        self.assertFalse(hasattr(self.snapshot, 'commit'))
+
+
+class GetCacheTests(unittest.TestCase):
+
+    def test_shared(self):
+        self.assertIs(get_cache(), get_cache())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+import xapian
+
+from apprecommender.bm25 import BM25Engine, get_bm25_engine
+from apprecommender.decider import PkgMatchDecider
+from apprecommender.term_store import TermVectorStore
+
+
+class BM25EngineTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index = xapian.WritableDatabase(self.tmp_dir + '/axi',
+                                             xapian.DB_CREATE_OR_OVERWRITE)
+        pkgs_terms = {'gimp': ['XTuse::editing', 'XTworks-with::image',
+                               'imag', 'imag', 'editor'],
+                      'inkscape': ['XTuse::editing', 'vector', 'editor'],
+                      'vim': ['XTuse::editing', 'text', 'editor', 'editor'],
+                      'eog': ['XTworks-with::image', 'imag', 'viewer'],
+                      'libfoo': ['imag', 'editor'],
+                      'kdenlive': ['vector', 'editor'],
+                      'libkdeedu': ['editor'],
+                      'gnome-user-doc': ['text', 'viewer']}
+        for pkg, terms in sorted(pkgs_terms.items()):
+            doc = xapian.Document()
+            doc.set_data(pkg)
+            doc.add_term('XP' + pkg)
+            for term in terms:
+                doc.add_term(term)
+            self.index.add_document(doc)
+        self.index.commit()
+
+        valid_tags = ['use::editing', 'works-with::image']
+        store = TermVectorStore.build(self.index, self.tmp_dir + '/store',
+                                      valid_tags)
+        self.params = (1.2, 0, 7, 0.75, 0.5)
+        self.store = store
+        self.engine = BM25Engine(store, *self.params)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_xapian_result(self, profile, size, decider=None):
+        enquire = xapian.Enquire(self.index)
+        enquire.set_weighting_scheme(xapian.BM25Weight(*self.params))
+        enquire.set_query(xapian.Query(xapian.Query.OP_OR, profile))
+        mset = enquire.get_mset(0, size, None, decider)
+        return [(m.document.get_data(), m.weight) for m in mset]
+
+    def assertSameResult(self, expected, pkgs, weights):
+        self.assertEqual([pkg for pkg, _ in expected], list(pkgs))
+        for (_, expected_weight), weight in zip(expected, weights):
+            self.assertAlmostEqual(expected_weight, weight)
+
+    def test_score_same_as_xapian(self):
+        profile = ['imag', 'editor', 'XTuse::editing', 'editor']
+        pkgs, weights = self.engine.score(profile, 3)
+        self.assertSameResult(self.get_xapian_result(profile, 3), pkgs,
+                              weights)
+
+    def test_exclusion_mask(self):
+        profile = ['imag', 'editor']
+        decider = PkgMatchDecider(['gimp'])
+        mask = self.engine.get_exclusion_mask(['gimp'])
+        pkgs, weights = self.engine.score(profile, 10, mask)
+        self.assertSameResult(self.get_xapian_result(profile, 10, decider),
+                              pkgs, weights)
+
+    def test_exclusion_mask_same_as_decider(self):
+        for installed_pkgs in [[], ['gimp', 'vim'], ['kde', 'eog'],
+                               ['gnome', 'kdenlive'], ['kde', 'gnome']]:
+            decider = PkgMatchDecider(installed_pkgs)
+            expected = [decider.accept_pkg(pkg) for pkg in self.engine.pkgs]
+            mask = self.engine.get_exclusion_mask(installed_pkgs)
+            self.assertEqual(expected, list(mask))
+
+    def test_get_bm25_engine(self):
+        engine = get_bm25_engine(self.store, *self.params)
+        self.assertIs(engine, get_bm25_engine(self.store, *self.params))
+        self.assertIsNot(engine, get_bm25_engine(self.store, 2.0, 0, 7,
+                                                 0.75, 0.5))
+
+    def test_score_batch(self):
+        profiles = [['imag'], ['text', 'vector'], ['editor', 'viewer']]
+        results = self.engine.score_batch(profiles, 2)
+        for profile, (pkgs, weights) in zip(profiles, results):
+            single_pkgs, single_weights = self.engine.score(profile, 2)
+            self.assertEqual(list(single_pkgs), list(pkgs))
+            self.assertEqual(list(single_weights), list(weights))
+
+    def test_can_score(self):
+        self.assertTrue(self.engine.can_score(['imag', 'XTuse::editing']))
+        self.assertFalse(self.engine.can_score(['XPgimp']))
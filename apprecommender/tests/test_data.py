@@ -19,11 +19,16 @@ __license__ = """
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import shutil
+import tempfile
 import unittest
 import xapian
 
+import apprecommender.data as data
+
 from apprecommender.data import PopconSubmission, axi_search_pkg_tags
 from apprecommender.config import Config
+from apprecommender.decider import PkgExpandDecider, TagExpandDecider
 
 
 class AxiSearchTests(unittest.TestCase):
@@ -42,6 +47,160 @@ class AxiSearchTests(unittest.TestCase):
         self.assertEqual(assert_tags, set(tags))
 
 
+class TermsPayloadTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        submissions = {'user1': {'XPgimp': 3, 'XPeog': 1, 'XTuse::editing': 3},
+                       'user2': {'XPvim': 2, 'XPgimp': 1,
+                                 'XTuse::editing': 3},
+                       'user3': {'XPeog': 1, 'XTworks-with::image': 1}}
+        self.payload_index = self.create_index('payload', submissions, True)
+        self.index = self.create_index('plain', submissions, False)
+
+    @classmethod
+    def create_index(self, name, submissions, payload):
+        index = xapian.WritableDatabase(self.tmp_dir + '/' + name,
+                                        xapian.DB_CREATE_OR_OVERWRITE)
+        vocabulary = {}
+        for user_id, doc_terms in sorted(submissions.items()):
+            doc = xapian.Document()
+            doc.set_data(user_id)
+            if payload:
+                data.set_terms_with_payload(doc, doc_terms, vocabulary)
+            else:
+                for term, wdf in doc_terms.items():
+                    doc.add_term(term, wdf)
+            index.add_document(doc)
+        if payload:
+            data.save_payload_vocabulary(index, vocabulary)
+        index.commit()
+        return index
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_docs(self, index):
+        enquire = xapian.Enquire(index)
+        enquire.set_query(xapian.Query(xapian.Query.OP_OR,
+                                       ['XPgimp', 'XPeog']))
+        return enquire.get_mset(0, 10)
+
+    def test_payload_vocabulary(self):
+        self.assertIsNone(data.get_payload_vocabulary(self.index))
+        self.assertEqual(6, len(data.get_payload_vocabulary(
+            self.payload_index)))
+
+    def test_payload_terms_same_as_termlist(self):
+        content_filters = [PkgExpandDecider(['gimp']), TagExpandDecider()]
+        normalized_weights = dict((d.docid, 1.5) for d in
+                                  self.get_docs(self.index))
+        for weights in [0, normalized_weights]:
+            expected_docs, expected_packages = data.get_all_terms_multi(
+                self.index, self.get_docs(self.index), content_filters,
+                weights)
+            terms_docs, terms_packages = data.get_all_terms_multi(
+                self.payload_index, self.get_docs(self.payload_index),
+                content_filters, weights)
+
+            self.assertEqual(expected_packages, terms_packages)
+            for expected_doc, terms_doc in zip(expected_docs, terms_docs):
+                self.assertEqual(
+                    [(t.term, t.wdf) for t in expected_doc.termlist()],
+                    [(t.term, t.wdf) for t in terms_doc.termlist()])
+
+
+class ShardsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index = xapian.WritableDatabase(self.tmp_dir + '/shards',
+                                             xapian.DB_CREATE_OR_OVERWRITE)
+        self.medoids = [['gimp', 'inkscape'], ['vim', 'emacs']]
+        submissions = [('user1', ['gimp', 'inkscape', 'eog'], 0),
+                       ('user2', ['gimp', 'vim', 'emacs'], 1),
+                       ('user3', ['vim', 'emacs'], 1)]
+        for user_id, pkgs, shard in submissions:
+            doc = xapian.Document()
+            doc.set_data(user_id)
+            for pkg in pkgs:
+                doc.add_term('XP' + pkg)
+            data.set_shard(doc, shard)
+            self.index.add_document(doc)
+        data.save_shards_medoids(self.index, self.medoids)
+        self.index.commit()
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shards_medoids(self):
+        self.assertEqual([set(pkgs) for pkgs in self.medoids],
+                         data.get_shards_medoids(self.index))
+
+    def test_shards_medoids_shared_by_handles(self):
+        path = self.tmp_dir + '/medoids'
+        index = xapian.WritableDatabase(path, xapian.DB_CREATE_OR_OVERWRITE)
+        index.add_document(xapian.Document())
+        data.save_shards_medoids(index, [['vim']])
+        index.commit()
+
+        handle = xapian.Database(path)
+        medoids = data.get_shards_medoids(handle)
+        self.assertEqual([set(['vim'])], medoids)
+        self.assertIs(medoids, data.get_shards_medoids(xapian.Database(path)))
+
+        index.add_document(xapian.Document())
+        data.save_shards_medoids(index, [['gimp']])
+        index.commit()
+        handle.reopen()
+        self.assertEqual([set(['gimp'])], data.get_shards_medoids(handle))
+
+    def test_nearest_shards(self):
+        medoids = data.get_shards_medoids(self.index)
+
+        self.assertEqual([1], data.get_nearest_shards(medoids, ['vim'], 1))
+        self.assertEqual([1, 0], data.get_nearest_shards(medoids, ['vim'], 2))
+        self.assertEqual([0, 1], data.get_nearest_shards(
+            medoids, ['gimp'], 1, 2, self.index))
+
+    def test_shard_filter(self):
+        enquire = xapian.Enquire(self.index)
+        enquire.set_query(xapian.Query(
+            xapian.Query.OP_FILTER, xapian.Query('XPgimp'),
+            xapian.Query(data.SHARD_PREFIX + '1')))
+
+        self.assertEqual(['user2'], [m.document.get_data()
+                                     for m in enquire.get_mset(0, 10)])
+
+
+class DatabaseKeyTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_database_key(self):
+        index = xapian.WritableDatabase(self.tmp_dir + '/index',
+                                        xapian.DB_CREATE_OR_OVERWRITE)
+        index.add_document(xapian.Document())
+        index.commit()
+        handle = xapian.Database(self.tmp_dir + '/index')
+        other_handle = xapian.Database(self.tmp_dir + '/index')
+
+        self.assertEqual(data.get_database_key(handle),
+                         data.get_database_key(other_handle))
+
+        index.add_document(xapian.Document())
+        index.commit()
+        other_handle.reopen()
+
+        self.assertNotEqual(data.get_database_key(handle),
+                            data.get_database_key(other_handle))
+
+
 class PopconSubmissionTests(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -1,8 +1,24 @@
 #!/usr/bin/env python
 
+import math
+import os
+import shutil
+import tempfile
 import unittest
 
-from apprecommender.data_classification import linear_percent_function
+import numpy as np
+
+import apprecommender.data_classification as data_classification
+
+from apprecommender.config import Config
+from apprecommender.data_classification import (BoundedCache,
+                                                UsageTimeStore,
+                                                get_pkgs_time_weights,
+                                                get_terms_incidence,
+                                                get_terms_time_weights,
+                                                get_time,
+                                                linear_percent_function)
+from apprecommender.dpkg_state import DPKG_STATUS, get_mtime
 
 
 class DataClassificationTests(unittest.TestCase):
@@ -12,3 +28,117 @@ class DataClassificationTests(unittest.TestCase):
         percent = linear_percent_function(modify, access, time_now)
 
         self.assertEqual(0.75, percent)
+
+    def test_get_time(self):
+        with tempfile.NamedTemporaryFile() as pkg_file:
+            os.utime(pkg_file.name, (100, 200))
+
+            self.assertEqual('100', get_time('X', pkg_file.name, False))
+            self.assertEqual('200', get_time('Y', pkg_file.name, False))
+            self.assertIsNone(get_time('X', pkg_file.name + '.missing',
+                                       False))
+            self.assertIsNone(get_time('X', 'missing-program-name'))
+
+    def test_bounded_cache(self):
+        cache = BoundedCache(2)
+        cache['gimp'] = 1
+        cache['vim'] = 2
+        cache['gimp'] = 3
+        cache['eog'] = 4
+
+        self.assertEqual(2, len(cache))
+        self.assertNotIn('vim', cache)
+        self.assertEqual(3, cache['gimp'])
+        self.assertIsNone(cache.get('vim'))
+
+    def test_terms_time_weights(self):
+        weights = {'gimp': 4.0, 'eog': 2.0, 'vim': 1.0, 'emacs': 3.0,
+                   'dia': 5.0, 'xpdf': 6.0, 'file': np.nan}
+        terms_pkgs = [['gimp', 'eog'],
+                      ['gimp', 'eog', 'vim', 'emacs', 'dia', 'xpdf'],
+                      ['gimp', 'file'],
+                      []]
+        incidence, pkgs = get_terms_incidence(terms_pkgs)
+        pkgs_weights = np.array([weights[pkg] for pkg in pkgs])
+
+        terms_weights = get_terms_time_weights(incidence, pkgs_weights)
+
+        padded = [4.0, 2.0, 2.0 - 0.2, 2.0 - 0.2 - 0.2, 2.0 - 0.2 - 0.2 - 0.2]
+        self.assertEqual(sum(padded) / 5.0, terms_weights[0])
+        self.assertEqual((6.0 + 5.0 + 4.0 + 3.0 + 2.0) / 5.0,
+                         terms_weights[1])
+        self.assertTrue(np.isnan(terms_weights[2]))
+        self.assertTrue(np.isnan(terms_weights[3]))
+
+
+class PkgsTimeWeightsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cfg = Config()
+        self.old_user_data_dir = self.cfg.user_data_dir
+        self.cfg.user_data_dir = self.tmp_dir
+        self.path = os.path.join(self.tmp_dir, 'usage_times')
+
+        # a binary modified at 100 and last used at 150, long ago
+        store = UsageTimeStore(self.path)
+        store.status_mtime = get_mtime(DPKG_STATUS)
+        store.binaries['apprecommender-test-pkg'] = '/usr/bin/test-pkg'
+        store.times['/usr/bin/test-pkg'] = ['100', '150']
+        data_classification.usage_time_stores[self.path] = store
+
+    def tearDown(self):
+        self.cfg.user_data_dir = self.old_user_data_dir
+        del data_classification.usage_time_stores[self.path]
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cached_weight_same_as_computed(self):
+        pkgs = ['apprecommender-test-pkg', 'apprecommender-missing-pkg']
+
+        weights = get_pkgs_time_weights(pkgs)
+        cached_weights = get_pkgs_time_weights(pkgs)
+
+        # the time curve of a weight close to 0, on every encounter
+        self.assertAlmostEqual(10 / math.e, weights[0], places=5)
+        self.assertEqual(weights[0], cached_weights[0])
+        self.assertTrue(np.isnan(weights[1]))
+        self.assertTrue(np.isnan(cached_weights[1]))
+
+
+class UsageTimeStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.binary = os.path.join(self.tmp_dir, 'apprecommender-test-bin')
+        with open(self.binary, 'w'):
+            pass
+        os.chmod(self.binary, 0o755)
+        os.utime(self.binary, (100, 100))
+        self.old_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = self.tmp_dir
+        self.store_path = os.path.join(self.tmp_dir, 'usage_times')
+
+    def tearDown(self):
+        os.environ['PATH'] = self.old_path
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_times(self):
+        store = UsageTimeStore(self.store_path)
+        modify, access = store.get_times('apprecommender-test-bin')
+
+        self.assertEqual('100', access)
+        self.assertEqual(get_time('Z', self.binary, False), modify)
+        self.assertIsNone(store.get_times('apprecommender-missing-pkg'))
+
+    def test_saved_and_refreshed(self):
+        store = UsageTimeStore(self.store_path)
+        store.get_times('apprecommender-test-bin')
+        store.save()
+
+        os.utime(self.binary, (200, 100))
+        store = UsageTimeStore(self.store_path)
+        self.assertIn('apprecommender-test-bin', store.binaries)
+        self.assertEqual('100', store.get_times('apprecommender-test-bin')[1])
+
+        store.refresh()
+        self.assertEqual('200', store.get_times('apprecommender-test-bin')[1])
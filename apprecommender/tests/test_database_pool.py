@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import threading
+import unittest
+import xapian
+
+from apprecommender.database_pool import DatabasePool
+from apprecommender.error import Error
+
+
+class DatabasePoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = self.tmp_dir + '/axi'
+        self.index = xapian.WritableDatabase(self.path,
+                                             xapian.DB_CREATE_OR_OVERWRITE)
+        self.add_document('gimp')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def add_document(self, pkg):
+        doc = xapian.Document()
+        doc.set_data(pkg)
+        doc.add_term('XP' + pkg)
+        self.index.add_document(doc)
+        self.index.commit()
+
+    def test_acquire_and_release(self):
+        pool = DatabasePool(self.path, 2)
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertEqual(1, first.get_doccount())
+
+        pool.release(first)
+        self.assertIs(first, pool.acquire())
+        self.assertEqual(2, pool.opened)
+
+    def test_bounded_pool(self):
+        pool = DatabasePool(self.path, 1, timeout=0)
+        database = pool.acquire()
+        with self.assertRaises(Error):
+            pool.acquire()
+        pool.release(database)
+        self.assertIs(database, pool.acquire())
+
+    def test_reopen(self):
+        pool = DatabasePool(self.path, 1)
+        with pool.handle() as database:
+            self.assertEqual(1, database.get_doccount())
+
+        self.add_document('inkscape')
+        pool.reopen()
+        with pool.handle() as database:
+            self.assertEqual(2, database.get_doccount())
+
+    def test_one_handle_per_thread(self):
+        pool = DatabasePool(self.path, 4)
+        handles = []
+        threads = [threading.Thread(target=lambda: handles.append(
+            pool.acquire())) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(4, len(set([id(handle) for handle in handles])))
+        self.assertEqual(4, pool.opened)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+from apprecommender.dependency_index import DependencyIndex
+
+
+class Dependency:
+
+    def __init__(self, names):
+        self.or_dependencies = [Package(name) for name in names]
+
+
+class Package:
+
+    def __init__(self, name, deps=None):
+        self.name = name
+        self.candidate = None
+        if deps is not None:
+            self.candidate = self
+            self.dependencies = [Dependency(names) for names in deps]
+
+
+class DependencyIndexTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        cache = [Package('gimp', [['libgimp2.0'], ['libc6']]),
+                 Package('libgimp2.0', [['libc6'], ['gimp-data']]),
+                 Package('inkscape', [['libc6'], ['python', 'python2.7']]),
+                 Package('libc6', []),
+                 Package('vim')]
+        self.index = DependencyIndex.build(cache, self.tmp_dir + '/deps')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_missing_index(self):
+        self.assertIsNone(DependencyIndex.load(self.tmp_dir + '/missing'))
+
+    def test_dependencies(self):
+        self.assertEqual(['libc6', 'libgimp2.0'],
+                         sorted(self.index.get_dependencies('gimp')))
+        self.assertEqual(['gimp', 'inkscape', 'libgimp2.0'],
+                         sorted(self.index.get_reverse_dependencies('libc6')))
+        self.assertEqual([], self.index.get_dependencies('vim'))
+        self.assertEqual([], self.index.get_dependencies('emacs'))
+
+    def test_maximal(self):
+        pkgs = ['libc6', 'gimp', 'vim', 'libgimp2.0', 'python', 'inkscape',
+                'emacs', 'gimp-data']
+        self.assertEqual(['gimp', 'vim', 'inkscape', 'emacs'],
+                         self.index.get_maximal(pkgs))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import gzip
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from apprecommender.dpkg_state import (get_dpkg_state, get_pkg_files,
+                                       get_logged_installed_pkgs)
+
+STATUS = "apprecommender/tests/test_data/dpkg/status"
+EXTENDED_STATES = "apprecommender/tests/test_data/dpkg/extended_states"
+INFO = "apprecommender/tests/test_data/dpkg/info"
+
+
+class DpkgStateTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.state = get_dpkg_state(STATUS, EXTENDED_STATES)
+
+    def test_installed(self):
+        self.assertEqual(set(['dpkg', 'gimp', 'libgimp2.0', 'perl']),
+                         self.state.installed)
+
+    def test_known(self):
+        self.assertEqual(set(['dpkg', 'gimp', 'libgimp2.0', 'perl', 'vim']),
+                         self.state.known)
+
+    def test_manual(self):
+        self.assertEqual(set(['dpkg', 'gimp', 'perl']), self.state.manual)
+
+    def test_priorities(self):
+        self.assertEqual('required', self.state.priorities['dpkg'])
+        self.assertEqual('optional', self.state.priorities['vim'])
+        self.assertEqual(['dpkg', 'perl'], sorted(
+            self.state.get_pkgs_with_priority(['required', 'standard'])))
+
+    def test_cached(self):
+        self.assertIs(self.state, get_dpkg_state(STATUS, EXTENDED_STATES))
+
+    def test_missing_extended_states(self):
+        state = get_dpkg_state(STATUS, EXTENDED_STATES + '.missing')
+        self.assertEqual(state.installed, state.manual)
+        self.assertIs(state, get_dpkg_state(STATUS,
+                                            EXTENDED_STATES + '.missing'))
+
+    def test_pkg_files(self):
+        self.assertEqual(['/.', '/usr', '/usr/bin', '/usr/bin/gimp'],
+                         get_pkg_files('gimp', INFO))
+        self.assertEqual(['/.', '/usr/lib/x86_64-linux-gnu/libgimp-2.0.so.0'],
+                         get_pkg_files('libgimp2.0', INFO))
+        self.assertEqual([], get_pkg_files('vim', INFO))
+
+
+class DpkgLogsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.tmp_dir, 'dpkg.log')
+        self.logs_pattern = self.log_path + '*'
+        self.state_path = os.path.join(self.tmp_dir, 'state')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_log(self, lines, mode='a'):
+        with open(self.log_path, mode) as log:
+            log.write(lines)
+
+    def get_pkgs(self):
+        return get_logged_installed_pkgs(self.state_path, self.logs_pattern)
+
+    def test_incremental_parsing(self):
+        self.write_log("2016-05-18 15:16:40 install gimp:amd64 <none> 2.8\n"
+                       "2016-05-18 15:16:41 status installed gimp:amd64 2.8\n"
+                       "2016-05-18 15:16:42 install vim:amd64")
+        self.assertEqual(set(['gimp']), self.get_pkgs())
+
+        self.write_log(" <none> 7.4\n"
+                       "2016-05-19 10:00:00 upgrade eog:amd64 3.18 3.20\n")
+        self.assertEqual(set(['gimp', 'vim']), self.get_pkgs())
+
+        with open(self.state_path, 'rb') as state_file:
+            state = pickle.load(state_file)
+        offset, _, _ = state[os.stat(self.log_path).st_ino]
+        self.assertEqual(os.path.getsize(self.log_path), offset)
+
+    def test_rotated_logs(self):
+        self.write_log("2016-05-18 15:16:40 install gimp:amd64 <none> 2.8\n")
+        self.assertEqual(set(['gimp']), self.get_pkgs())
+
+        os.rename(self.log_path, self.log_path + '.1')
+        self.write_log("2016-05-20 09:00:00 install eog:amd64 <none> 3.2\n")
+        with gzip.open(self.log_path + '.2.gz', 'wb') as log:
+            log.write("2016-04-01 09:00:00 install vim:amd64 <none> 7.4\n")
+
+        self.assertEqual(set(['gimp', 'eog', 'vim']), self.get_pkgs())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import scipy.sparse as sparse
+
+try:
+    from sklearn.naive_bayes import GaussianNB, MultinomialNB
+    from apprecommender.ml.bag_of_words import BagOfWords
+except ImportError:
+    BagOfWords = None
+
+
+@unittest.skipIf(BagOfWords is None, "scikit-learn is not available")
+class BagOfWordsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        graphics = ['image editor paint photo', 'image photo viewer editor',
+                    'paint image drawing editor', 'photo image gallery',
+                    'image paint photo drawing', 'photo paint image']
+        text = ['text editor vim code', 'code text editor ide',
+                'vim text code editor', 'text code terminal',
+                'code vim text terminal', 'terminal text vim code']
+        self.pkgs_description = graphics + text
+        self.pkgs_classification = ['RU'] * len(graphics) + ['NU'] * len(text)
+
+        self.bag_of_words = BagOfWords()
+        self.features = self.bag_of_words.vectorizer.fit_transform(
+            self.pkgs_description)
+        self.bag_of_words.classifier = MultinomialNB()
+        self.bag_of_words.classifier.fit(self.features,
+                                         self.pkgs_classification)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_classify_sparse_features(self):
+        self.assertTrue(sparse.isspmatrix_csr(self.features))
+
+        labels = self.bag_of_words.classify_batch(self.features,
+                                                  transform=False)
+
+        self.assertEqual(self.pkgs_classification, labels)
+        for i, label in enumerate(labels):
+            self.assertEqual(label, self.bag_of_words.classify_pkg(
+                self.features[i], transform=False))
+
+    def test_classify_descriptions(self):
+        descriptions = ['photo image paint', 'vim code terminal']
+
+        labels = self.bag_of_words.classify_batch(descriptions)
+
+        self.assertEqual(['RU', 'NU'], labels)
+        self.assertEqual(labels, [self.bag_of_words.classify_pkg(description)
+                                  for description in descriptions])
+
+    def test_gaussian_model_takes_sparse_features(self):
+        self.bag_of_words.classifier = GaussianNB()
+        self.bag_of_words.classifier.fit(self.features.toarray(),
+                                         self.pkgs_classification)
+
+        labels = self.bag_of_words.classify_batch(self.features,
+                                                  transform=False)
+
+        self.assertEqual(labels, [self.bag_of_words.classify_pkg(
+            self.features[i], transform=False) for i in range(len(labels))])
+
+    def test_pkgs_features_saved_and_loaded(self):
+        path = os.path.join(self.tmp_dir, 'bow_pkgs_features.npz')
+        pkgs_list = ['pkg%d' % i for i in range(len(self.pkgs_description))]
+
+        self.bag_of_words.save_pkgs_features(path, pkgs_list, self.features,
+                                             self.pkgs_classification)
+        loaded_pkgs, features, classifications = (
+            BagOfWords.load_pkgs_features(path))
+
+        self.assertEqual(pkgs_list, loaded_pkgs)
+        self.assertEqual(self.pkgs_classification, classifications)
+        self.assertEqual(0, (features != self.features).nnz)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
+import itertools
+import pickle
 import unittest
 import numpy as np
+import scipy.sparse as sparse
 
 from apprecommender.ml.bayes_matrix import BayesMatrix
 
@@ -44,6 +47,40 @@ class PkgClassificationTests(unittest.TestCase):
         self.assertEqual(
             1, self.bayes_matrix.get_classification(attribute_vector))
 
+    def test_classify_batch(self):
+        data_matrix = np.matrix("1 0 1 0 1; 0 1 1 0 1; 1 0 0 1 1; 1 0 1 1 0;\
+                                 0 1 1 1 0")
+        classifications = np.matrix([[1], [2], [0], [1], [2]])
+
+        self.bayes_matrix.training(data_matrix, classifications, [0, 1, 2])
+
+        # every binary vector, with the labels the per vector formula gives
+        attributes_matrix = np.matrix(list(itertools.product([0, 1],
+                                                             repeat=5)))
+        expected = [1, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2,
+                    1, 0, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 1, 1, 1, 1]
+        self.assertEqual(
+            expected, self.bayes_matrix.classify_batch(attributes_matrix))
+        self.assertEqual(
+            expected, self.bayes_matrix.classify_batch(
+                sparse.csr_matrix(attributes_matrix)))
+
+    def test_pickled_model(self):
+        data_matrix = np.matrix("1 0 1 0 1; 0 1 1 0 1; 1 0 0 1 1; 1 0 1 1 0;\
+                                 0 1 1 1 0")
+        classifications = np.matrix([[1], [2], [0], [1], [2]])
+        self.bayes_matrix.training(data_matrix, classifications, [0, 1, 2])
+
+        bayes_matrix = pickle.loads(pickle.dumps(self.bayes_matrix))
+
+        for attribute in BayesMatrix.TRAINING_ATTRIBUTES:
+            self.assertIsNone(getattr(bayes_matrix, attribute))
+        attributes_matrix = sparse.csr_matrix(
+            np.matrix("1 0 1 1 0; 0 1 1 0 1"))
+        self.assertEqual(
+            self.bayes_matrix.classify_batch(attributes_matrix),
+            bayes_matrix.classify_batch(attributes_matrix))
+
     def test_convert_classifications_to_numbers(self):
         classifications = np.matrix([['M'], ['B'], ['G']])
         order_of_classifications = ['B', 'M', 'G']
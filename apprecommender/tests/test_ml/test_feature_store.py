@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+
+from apprecommender.config import Config
+from apprecommender.ml.feature_store import FeatureStore, get_feature_store
+
+
+class Package:
+
+    def __init__(self, section):
+        self.candidate = self
+        self.section = section
+
+
+class FeaturesData:
+
+    features = {'gimp': (['imag', 'editor', 'imag'],
+                         ['works-with::image', 'use::editing'], 'graphics'),
+                'vim': (['editor', 'vi'], [], 'editors')}
+
+    def extract_pkg_terms(self, cache, pkg):
+        return FeaturesData.features[pkg][0]
+
+    def extract_pkg_debtags(self, axi, pkg):
+        return FeaturesData.features[pkg][1]
+
+    def extract_pkg_section(self, cache, pkg):
+        return cache[pkg].section
+
+
+class FeatureStoreTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        cache = {'gimp': Package('graphics'), 'vim': Package('editors')}
+        self.store = FeatureStore.build(['gimp', 'vim', 'emacs'],
+                                        FeaturesData(), None, cache,
+                                        self.tmp_dir + '/features')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_missing_store(self):
+        self.assertIsNone(FeatureStore.load(self.tmp_dir + '/missing'))
+
+    def test_features(self):
+        self.assertEqual(2, len(self.store))
+        self.assertNotIn('emacs', self.store)
+        self.assertEqual(['imag', 'editor', 'imag'],
+                         self.store.get_terms('gimp'))
+        self.assertEqual(['works-with::image', 'use::editing'],
+                         self.store.get_debtags('gimp'))
+        self.assertEqual([], self.store.get_debtags('vim'))
+        self.assertEqual('editors', self.store.get_section('vim'))
+
+    def test_load(self):
+        store = FeatureStore.load(self.tmp_dir + '/features')
+        self.assertEqual(['editor', 'vi'], store.get_terms('vim'))
+
+    def test_build_replaces_cached_store(self):
+        cfg = Config()
+        old_feature_store = cfg.ml_feature_store
+        cfg.ml_feature_store = self.tmp_dir + '/cached'
+        try:
+            self.assertIsNone(get_feature_store())
+            FeatureStore.build(['vim'], FeaturesData(), None,
+                               {'vim': Package('editors')},
+                               cfg.ml_feature_store)
+            self.assertIn('vim', get_feature_store())
+        finally:
+            cfg.ml_feature_store = old_feature_store
@@ -1,7 +1,13 @@
+import os
+import shutil
+import tempfile
 import unittest
+import scipy.sparse as sparse
 from numpy import array
 
-from apprecommender.ml.utils import create_binary_matrix
+from apprecommender.ml.utils import (create_binary_matrix,
+                                     load_sparse_features,
+                                     save_sparse_features)
 
 
 class MLUtilsTest(unittest.TestCase):
@@ -21,3 +27,39 @@ class MLUtilsTest(unittest.TestCase):
 
         for i in range(num_data):
             self.assertEqual(expected_result[i][0], actual_result[i][0])
+
+
+class SparseFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'pkgs_features.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_saved_and_loaded(self):
+        features = sparse.csr_matrix(array([[0.5, 0, 0, 0.25],
+                                            [0, 0, 0, 0],
+                                            [0, 1.0, 0, 0]]))
+        pkgs_list = ['gimp', 'vim', 'inkscape-extensions']
+        classifications = ['RU', 'NU', 'U']
+
+        save_sparse_features(self.path, pkgs_list, features, classifications)
+        loaded_pkgs, loaded_features, loaded_classifications = (
+            load_sparse_features(self.path))
+
+        self.assertEqual(pkgs_list, loaded_pkgs)
+        self.assertEqual(classifications, loaded_classifications)
+        self.assertTrue(sparse.isspmatrix_csr(loaded_features))
+        self.assertEqual((3, 4), loaded_features.shape)
+        self.assertEqual(features.toarray().tolist(),
+                         loaded_features.toarray().tolist())
+
+    def test_dense_features_saved_sparse(self):
+        save_sparse_features(self.path, ['gimp'], array([[0, 2.0]]), ['U'])
+
+        _, features, _ = load_sparse_features(self.path)
+
+        self.assertEqual(1, features.nnz)
+        self.assertEqual([[0, 2.0]], features.toarray().tolist())
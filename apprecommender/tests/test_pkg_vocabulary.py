@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from apprecommender.config import Config
+from apprecommender.pkg_vocabulary import (PackageVocabulary, PackageSet,
+                                           get_pkgs_set, get_vocabulary,
+                                           load_pkgs_set)
+
+
+class PackageVocabularyTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.vocabulary = PackageVocabulary.build(
+            ['vim', 'gimp', 'eog', 'inkscape', 'gimp'],
+            self.tmp_dir + '/pkgs_vocabulary.npy')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_missing_vocabulary(self):
+        self.assertIsNone(PackageVocabulary.load(self.tmp_dir + '/missing'))
+
+    def test_get_ids(self):
+        ids = self.vocabulary.get_ids(['gimp', 'emacs', 'vim', 'inkscape-ext'])
+
+        self.assertEqual(4, len(self.vocabulary))
+        self.assertEqual([1, -1, 3, -1], list(ids))
+        self.assertEqual(1, self.vocabulary.get_id('gimp'))
+        self.assertEqual(-1, self.vocabulary.get_id('inkscape-extensions'))
+        self.assertEqual(['gimp', 'vim'], self.vocabulary.get_names([1, 3]))
+
+    def test_package_set(self):
+        pkgs_set = PackageSet(self.vocabulary, ['vim', 'eog', 'emacs'])
+
+        self.assertEqual(3, len(pkgs_set))
+        self.assertTrue('vim' in pkgs_set)
+        self.assertTrue('emacs' in pkgs_set)
+        self.assertFalse('gimp' in pkgs_set)
+        self.assertEqual(set(['vim', 'eog', 'emacs']), set(pkgs_set))
+        self.assertEqual([True, False], list(pkgs_set.contains_ids([0, 1])))
+        self.assertEqual(['vim', 'emacs', 'eog'], pkgs_set.filter(
+            ['vim', 'gimp', 'emacs', 'nano', 'eog']))
+        self.assertEqual([True, False, True, False], list(pkgs_set.contains(
+            ['emacs', 'gimp', 'eog', 'nano'])))
+
+    def test_empty_package_set(self):
+        pkgs_set = PackageSet(self.vocabulary, [])
+
+        self.assertEqual(0, len(pkgs_set))
+        self.assertFalse('vim' in pkgs_set)
+        self.assertEqual([], pkgs_set.filter(['vim', 'emacs']))
+
+
+class GetPackagesSetTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cfg = Config()
+        self.old_vocabulary = self.cfg.pkgs_vocabulary
+        self.cfg.pkgs_vocabulary = os.path.join(self.tmp_dir,
+                                                'pkgs_vocabulary.npy')
+
+    def tearDown(self):
+        self.cfg.pkgs_vocabulary = self.old_vocabulary
+        shutil.rmtree(self.tmp_dir)
+
+    def test_vocabulary_built_later(self):
+        self.assertIsNone(get_vocabulary())
+
+        PackageVocabulary.build(['vim', 'gimp'], self.cfg.pkgs_vocabulary)
+
+        self.assertEqual(2, len(get_vocabulary()))
+
+    def test_cached_set_same_size(self):
+        PackageVocabulary.build(['vim', 'gimp', 'eog'],
+                                self.cfg.pkgs_vocabulary)
+
+        pkgs_set = get_pkgs_set(['vim', 'gimp'], 'key')
+        self.assertIs(pkgs_set, get_pkgs_set(['gimp', 'vim'], 'key'))
+
+        pkgs_set = get_pkgs_set(['vim', 'eog'], 'key')
+        self.assertTrue('eog' in pkgs_set)
+        self.assertFalse('gimp' in pkgs_set)
+
+    def test_load_pkgs_set(self):
+        path = os.path.join(self.tmp_dir, 'desktopapps')
+        with open(path, 'w') as pkgs_file:
+            pkgs_file.write('vim\ngimp\n')
+        pkgs_set = load_pkgs_set(path)
+        self.assertEqual(set(['vim', 'gimp']), set(pkgs_set))
+        self.assertIs(pkgs_set, load_pkgs_set(path))
+
+        PackageVocabulary.build(['vim', 'gimp'], self.cfg.pkgs_vocabulary)
+
+        pkgs_set = load_pkgs_set(path)
+        self.assertIsInstance(pkgs_set, PackageSet)
+        self.assertEqual(['gimp'], pkgs_set.filter(['eog', 'gimp']))
@@ -19,9 +19,13 @@ __license__ = """
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import time
 import unittest
 
-from apprecommender.recommender import RecommendationResult, Recommender
+import apprecommender.database_pool as database_pool
+
+from apprecommender.recommender import (RecommendationCache,
+                                        RecommendationResult, Recommender)
 from apprecommender.user import User
 from apprecommender.config import Config
 from apprecommender.strategy import (ContentBased, MachineLearningBVA,
@@ -42,6 +46,61 @@ class RecommendationResultTests(unittest.TestCase):
         prediction = [("inkscape", 3.0), ("gimp", 1.5), ("eog", 1)]
         self.assertEqual(self.result.get_prediction(), prediction)
 
+    def test_get_prediction_limit(self):
+        prediction = [("inkscape", 3.0), ("gimp", 1.5)]
+        self.assertEqual(self.result.get_prediction(2), prediction)
+
+    def test_iter(self):
+        self.assertEqual(list(self.result),
+                         [("inkscape", 3.0), ("gimp", 1.5), ("eog", 1)])
+
+    def test_slice(self):
+        top = self.result[:2]
+        self.assertIsInstance(top, RecommendationResult)
+        self.assertEqual(top.ranking, ["inkscape", "gimp"])
+        self.assertEqual(self.result[2], ("eog", 1))
+
+    def test_from_arrays_ranked(self):
+        result = RecommendationResult.from_arrays(["eog", "gimp"], [2.0, 1.0],
+                                                  ranked=True)
+        self.assertEqual(result.item_score, {"eog": 2.0, "gimp": 1.0})
+        self.assertEqual(result.get_prediction(1), [("eog", 2.0)])
+
+
+class RecommendationCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.result = RecommendationResult({"gimp": 1.5, "inkscape": 3.0})
+        self.result_size = RecommendationCache.get_result_size(self.result)
+
+    def test_get(self):
+        cache = RecommendationCache(self.result_size, 60)
+        token = cache.add(self.result)
+        self.assertIs(self.result, cache.get(token))
+        self.assertIsNone(cache.get("unknown"))
+
+    def test_memory_cap(self):
+        cache = RecommendationCache(2 * self.result_size, 60)
+        first = cache.add(self.result)
+        second = cache.add(self.result)
+        cache.get(first)
+        third = cache.add(self.result)
+
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(second))
+        self.assertIsNotNone(cache.get(first))
+        self.assertIsNotNone(cache.get(third))
+
+        small_cache = RecommendationCache(self.result_size - 1, 60)
+        self.assertIsNone(small_cache.add(self.result))
+
+    def test_expiry(self):
+        cache = RecommendationCache(self.result_size, 0.01)
+        token = cache.add(self.result)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(token))
+        self.assertEqual(0, cache.size)
+
 
 class RecommenderTests(unittest.TestCase):
     @classmethod
@@ -53,6 +112,13 @@ class RecommenderTests(unittest.TestCase):
         cfg.popcon = 0
         self.rec = Recommender()
 
+    def test_context_manager_releases_databases(self):
+        pool = database_pool.get_pool(self.rec.cfg.axi_desktopapps)
+        for i in range(pool.max_size + 1):
+            with Recommender() as rec:
+                self.assertTrue(rec.databases)
+            self.assertEqual([], rec.databases)
+
     def test_set_strategy(self):
         self.rec.set_strategy("cb")
         self.assertIsInstance(self.rec.strategy, ContentBased)
@@ -86,3 +152,56 @@ class RecommenderTests(unittest.TestCase):
         result = self.rec.get_recommendation(user)
         self.assertIsInstance(result, RecommendationResult)
         self.assertGreater(len(result.item_score), 0)
+
+    def test_get_recommendations(self):
+        user = User({"inkscape": 1, "gimp": 1, "eog": 1})
+        strategies = ["cbt", "cbh", "cbtm"]
+        progress = []
+        results = self.rec.get_recommendations(
+            user, strategies, progress=lambda *done: progress.append(done))
+
+        self.assertEqual(strategies, results.keys())
+        self.assertEqual([("cbt", 1), ("cbh", 2), ("cbtm", 3)], progress)
+        self.assertIsNone(user.shared)
+        for strategy_str in strategies:
+            self.rec.set_strategy(strategy_str)
+            expected = self.rec.get_recommendation(user)
+            self.assertEqual(expected.get_prediction(),
+                             results[strategy_str].get_prediction())
+
+    def test_get_recommendation_page(self):
+        user = User({"inkscape": 1, "gimp": 1, "eog": 1})
+        self.rec.set_strategy("cb")
+        expected = self.rec.get_recommendation(user, 4).get_prediction()
+
+        first_page, cursor = self.rec.get_recommendation_page(user, 2)
+        second_page, _ = self.rec.get_recommendation_page(None, 2, cursor)
+
+        self.assertEqual(expected, first_page.get_prediction() +
+                         second_page.get_prediction())
+        self.assertEqual((None, None),
+                         self.rec.get_recommendation_page(None, 2, "old:2"))
+
+    def test_get_recommendation_page_invalid_cursor(self):
+        user = User({"inkscape": 1, "gimp": 1, "eog": 1})
+        self.rec.set_strategy("cb")
+        _, cursor = self.rec.get_recommendation_page(user, 2)
+        token = cursor.rsplit(":", 1)[0]
+
+        for invalid_cursor in [token, token + ":two", token + ":-2", ":"]:
+            self.assertEqual((None, None), self.rec.get_recommendation_page(
+                user, 2, invalid_cursor))
+            self.assertEqual((None, None), Recommender.get_cursor_page(
+                invalid_cursor, 2))
+
+    def test_get_cursor_page(self):
+        user = User({"inkscape": 1, "gimp": 1, "eog": 1})
+        self.rec.set_strategy("cb")
+        _, cursor = self.rec.get_recommendation_page(user, 2)
+        page, next_cursor = self.rec.get_recommendation_page(None, 2, cursor)
+
+        cursor_page, cursor_next = Recommender.get_cursor_page(cursor, 2)
+        self.assertEqual(page.get_prediction(), cursor_page.get_prediction())
+        self.assertEqual(next_cursor, cursor_next)
+        self.assertEqual((None, None), Recommender.get_cursor_page("old:2",
+                                                                   2))
@@ -19,6 +19,7 @@ __license__ = """
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import threading
 import unittest
 from apprecommender.singleton import Singleton
 
@@ -28,3 +29,16 @@ class SingletonTests(unittest.TestCase):
         object_1 = Singleton()
         object_2 = Singleton()
         self.assertEqual(id(object_1), id(object_2))
+
+    def test_concurrent_creation(self):
+        class Shared(Singleton):
+            pass
+
+        objects = []
+        threads = [threading.Thread(target=lambda: objects.append(Shared()))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(set([id(obj) for obj in objects])))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import shutil
+import tempfile
+import unittest
+import xapian
+
+import apprecommender.data as data
+
+from apprecommender.decider import FilterTag, FilterDescription
+from apprecommender.term_store import TermVectorStore, get_term_store
+
+
+class TermVectorStoreTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index = xapian.WritableDatabase(self.tmp_dir + '/axi',
+                                             xapian.DB_CREATE_OR_OVERWRITE)
+        pkgs_terms = {'gimp': ['XTuse::editing', 'XTworks-with::image',
+                               'imag', 'editor'],
+                      'inkscape': ['XTuse::editing', 'vector', 'editor'],
+                      'vim': ['XTuse::editing', 'text', 'editor'],
+                      'eog': ['XTworks-with::image', 'imag', 'viewer']}
+        for pkg, terms in sorted(pkgs_terms.items()):
+            doc = xapian.Document()
+            doc.set_data(pkg)
+            doc.add_term('XP' + pkg)
+            for term in terms:
+                doc.add_term(term)
+            self.index.add_document(doc)
+        self.index.commit()
+
+        self.valid_tags = ['use::editing', 'works-with::image']
+        self.store = TermVectorStore.build(self.index, self.tmp_dir + '/store',
+                                           self.valid_tags)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get(self):
+        term_ids, wdf = self.store.get('inkscape')
+        terms = set([self.store.terms[term_id] for term_id in term_ids])
+
+        self.assertEqual(set(['XTuse::editing', 'vector', 'editor']), terms)
+        self.assertEqual([1, 1, 1], list(wdf))
+
+    def test_load_missing_store(self):
+        self.assertIsNone(TermVectorStore.load(self.tmp_dir + '/missing'))
+
+    def test_get_term_store(self):
+        path = self.tmp_dir + '/shared_store'
+        TermVectorStore.build(self.index, path, self.valid_tags)
+        store = get_term_store(path, self.index.get_doccount())
+
+        self.assertIs(store, get_term_store(path, self.index.get_doccount()))
+        self.assertIsNone(get_term_store(path, self.index.get_doccount() + 1))
+        TermVectorStore.build(self.index, path, self.valid_tags)
+        self.assertIsNot(store, get_term_store(path,
+                                               self.index.get_doccount()))
+        self.assertIsNone(get_term_store(self.tmp_dir + '/missing', 0))
+
+    def test_tfidf_weighting_same_as_index(self):
+        pkgs = ['gimp', 'eog', 'vim']
+        docs = data.axi_search_pkgs(self.index, pkgs)
+
+        for content_filter in [FilterTag(self.valid_tags),
+                               FilterDescription()]:
+            expected = data.tfidf_weighting(self.index, docs, content_filter)
+            actual = self.store.tfidf_weighting(pkgs, content_filter)
+
+            self.assertEqual([term for term, _ in expected],
+                             [term for term, _ in actual])
+            for (_, expected_weight), (_, weight) in zip(expected, actual):
+                self.assertAlmostEqual(expected_weight, weight)
+
+    def test_tfidf_weighting_ties_same_as_index(self):
+        # 'text' and 'viewer' have the same weight
+        pkgs = ['gimp', 'eog', 'vim']
+        docs = data.axi_search_pkgs(self.index, pkgs)
+        content_filter = FilterDescription()
+
+        expected = [term for term, _ in
+                    data.tfidf_weighting(self.index, docs, content_filter)]
+        actual = [term for term, _ in
+                  self.store.tfidf_weighting(pkgs, content_filter)]
+
+        for profile_size in range(1, len(expected) + 1):
+            self.assertEqual(expected[:profile_size], actual[:profile_size])
+
+    def test_filter_mask_valid_tags(self):
+        mask = self.store.filter_mask(FilterTag(['use::editing']))
+        terms = [term for term, accepted in zip(self.store.terms, mask)
+                 if accepted]
+
+        self.assertEqual(['XTuse::editing'], terms)
+        self.assertEqual(2, sum(self.store.filter_mask(
+            FilterTag(self.valid_tags))))
+
+    def test_empty_store(self):
+        store = TermVectorStore.build(xapian.WritableDatabase(
+            self.tmp_dir + '/empty', xapian.DB_CREATE_OR_OVERWRITE),
+            self.tmp_dir + '/empty_store', self.valid_tags)
+
+        self.assertIsNotNone(store)
+        self.assertEqual(0, len(store))
+        self.assertEqual([], store.tfidf_weighting(['gimp'],
+                                                   FilterDescription()))
+
+    def test_eset_same_as_xapian(self):
+        pkgs = ['gimp', 'eog']
+        content_filter = FilterDescription()
+
+        rset = xapian.RSet()
+        for doc in data.axi_search_pkgs(self.index, pkgs):
+            rset.add_document(doc.docid)
+        enquire = xapian.Enquire(self.index)
+        expected = [(e.term, e.weight) for e in
+                    enquire.get_eset(3, rset, 0, 1, content_filter)]
+
+        rows = [self.store.pkgs_ids[pkg] for pkg in pkgs]
+        actual = self.store.eset(rows, 3,
+                                 self.store.filter_mask(content_filter))
+
+        self.assertEqual(set([term for term, _ in expected]),
+                         set([term for term, _ in actual]))
+        expected = dict(expected)
+        for term, weight in actual:
+            self.assertAlmostEqual(expected[term], weight)
+
+    def test_multi_filter_same_as_single_filter(self):
+        pkgs = ['gimp', 'eog', 'vim']
+        content_filters = [FilterTag(self.valid_tags), FilterDescription()]
+        docs = data.axi_search_pkgs(self.index, pkgs)
+
+        index_profiles = data.tfidf_weighting_multi(self.index, docs,
+                                                    content_filters)
+        store_profiles = self.store.tfidf_weighting_multi(pkgs,
+                                                          content_filters)
+        rows = [self.store.pkgs_ids[pkg] for pkg in pkgs]
+        esets = self.store.esets(rows, 3, [self.store.filter_mask(f)
+                                           for f in content_filters])
+
+        for i, content_filter in enumerate(content_filters):
+            self.assertEqual(data.tfidf_weighting(self.index, docs,
+                                                  content_filter),
+                             index_profiles[i])
+            self.assertEqual(self.store.tfidf_weighting(pkgs, content_filter),
+                             store_profiles[i])
+            self.assertEqual(self.store.eset(
+                rows, 3, self.store.filter_mask(content_filter)), esets[i])
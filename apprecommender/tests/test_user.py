@@ -23,6 +23,7 @@ import unittest
 import xapian
 
 from apprecommender.user import User, LocalSystem, FilterTag, FilterDescription
+from apprecommender.decider import FilterAny
 from apprecommender.config import Config
 from apprecommender.data import SampleAptXapianIndex
 
@@ -52,6 +53,18 @@ class FilterDescriptionTests(unittest.TestCase):
         self.assertFalse(FilterDescription()("XTprogram"))
 
 
+class FilterAnyTests(unittest.TestCase):
+    def test_accepting_filters(self):
+        filter_any = FilterAny([FilterTag([]), FilterDescription()])
+
+        self.assertTrue(filter_any("XTuse::editing"))
+        self.assertTrue(filter_any("program"))
+        self.assertFalse(filter_any("XPgimp"))
+        self.assertEqual([0], filter_any.accepting_filters("XTuse::editing"))
+        self.assertEqual([1], filter_any.accepting_filters("program"))
+        self.assertEqual([], filter_any.accepting_filters("XPgimp"))
+
+
 class UserTests(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -126,6 +139,66 @@ class UserTests(unittest.TestCase):
         self.assertEqual(set(self.user.items()),
                          set(["gimp", "aaphoto", "eog", "emacs"]))
 
+    def test_installed_pkgs(self):
+        calls = []
+
+        def get_installed_pkgs():
+            calls.append(1)
+            return set(["gimp"])
+
+        new_user = User({"gimp": 1}, installed_pkgs=get_installed_pkgs)
+        self.assertEqual([], calls)
+        self.assertEqual(set(["gimp"]), new_user.get_installed_pkgs())
+        self.assertEqual(set(["gimp"]), new_user.get_installed_pkgs())
+        self.assertEqual([1], calls)
+
+        new_user = User({"gimp": 1}, installed_pkgs=["eog"])
+        self.assertEqual(["eog"], new_user.get_installed_pkgs())
+
+    def test_apply_profile_stages(self):
+        new_user = User({"gimp": 1, "eog": 1, "vim": 1, "libgimp2.0": 1})
+        profile = new_user.pkg_profile
+
+        def no_lib_profile(profile):
+            return [pkg for pkg in profile if not pkg.startswith("lib")]
+
+        new_user.apply_profile_stages(
+            [new_user.get_filter_stage(["gimp", "vim", "libgimp2.0"]),
+             no_lib_profile])
+
+        self.assertIs(profile, new_user.pkg_profile)
+        self.assertEqual(set(["gimp", "vim"]), set(new_user.pkg_profile))
+        self.assertIsNone(new_user.get_filter_stage(None))
+
+    def test_get_shared(self):
+        new_user = User({"gimp": 1, "eog": 1})
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(1, new_user.get_shared(('key',), compute))
+        self.assertEqual(2, new_user.get_shared(('key',), compute))
+
+        new_user.share_computations()
+        self.assertEqual(3, new_user.get_shared(('key',), compute))
+        self.assertEqual(3, new_user.get_shared(('key',), compute))
+        new_user.pkg_profile = ["gimp"]
+        self.assertEqual(4, new_user.get_shared(('key',), compute))
+
+        new_user.share_computations(False)
+        self.assertIsNone(new_user.shared)
+
+    def test_eset_profiles_same_as_single_filter(self):
+        content_filters = [FilterTag([]), FilterDescription()]
+        profiles = self.user.eset_profiles(self.sample_axi, 4, content_filters)
+
+        for content_filter, profile in zip(content_filters, profiles):
+            self.assertEqual(self.user.eset_profile(self.sample_axi, 4,
+                                                    content_filter),
+                             profile)
+
     def test_maximal_pkg_profile(self):
         old_pkg_profile = self.user.items()
         aaphoto_deps = ["libc6", "libgomp1", "libjasper1", "libjpeg62",
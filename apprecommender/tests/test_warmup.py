@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+import xapian
+
+import apprecommender.warmup as warmup
+
+
+class FakeConfig:
+
+    def __init__(self, tmp_dir):
+        self.axi_desktopapps = os.path.join(tmp_dir, 'axi')
+        self.term_store = os.path.join(tmp_dir, 'term_store')
+        self.popcon = 0
+        self.warmup_queries = "XPgimp XTuse::editing;XPeog"
+
+
+class WarmupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cfg = FakeConfig(self.tmp_dir)
+        index = xapian.WritableDatabase(self.cfg.axi_desktopapps,
+                                        xapian.DB_CREATE_OR_OVERWRITE)
+        doc = xapian.Document()
+        doc.set_data('gimp')
+        doc.add_term('XPgimp')
+        index.add_document(doc)
+        index.commit()
+        warmup.ready.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        warmup.ready.clear()
+
+    def test_prefetch_files(self):
+        os.makedirs(self.cfg.term_store)
+        with open(os.path.join(self.cfg.term_store, 'data'), 'wb') as data:
+            data.write('x' * 3000)
+
+        self.assertEqual(3000, warmup.prefetch_files(self.cfg.term_store))
+
+    def test_warm_up(self):
+        self.assertFalse(warmup.ready.is_set())
+        warmup.warm_up(self.cfg)
+        self.assertTrue(warmup.ready.is_set())
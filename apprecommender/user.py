@@ -20,10 +20,7 @@ __license__ = """
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import apt
-import commands
 import datetime
-import glob
 import logging
 import os
 import pickle
@@ -33,9 +30,15 @@ import xapian
 
 import apprecommender.data as data
 
+from apprecommender.apt_cache import get_cache
+from apprecommender.config import Config
+from apprecommender.dependency_index import get_dependency_index
+from apprecommender.dpkg_state import get_dpkg_state, get_logged_installed_pkgs
 from apprecommender.error import Error
+from apprecommender.pkg_vocabulary import (PackageSet, get_pkgs_set,
+                                           load_pkgs_set)
 from apprecommender.singleton import Singleton
-from apprecommender.decider import (FilterTag, FilterDescription,
+from apprecommender.decider import (FilterAny, FilterTag, FilterDescription,
                                     FilterTag_or_Description)
 
 
@@ -66,21 +69,40 @@ class DemographicProfile(Singleton):
         return demographic_profile
 
 
+def _store_key(term_store):
+    return term_store.path if term_store is not None else None
+
+
+def _filter_key(content_filter):
+    # filters are rebuilt by each strategy, so they are identified by their
+    # class and valid tags
+    valid_tags = getattr(content_filter, 'valid_tags', 0) or ()
+    return (type(content_filter).__name__, tuple(valid_tags))
+
+
 class User:
 
     """
     Define a user of a recommender.
     """
 
-    def __init__(self, item_score, user_id=0, arch=0, demo_profiles_set=0):
+    shared = None
+
+    def __init__(self, item_score, user_id=0, arch=0, demo_profiles_set=0,
+                 installed_pkgs=None):
         """
         Set initial user attributes. pkg_profile gets the whole set of items,
         a random user_id is set if none was provided and the demographic
-        profile defaults to 'desktop'.
+        profile defaults to 'desktop'. 'installed_pkgs', the packages not to
+        be recommended, is a collection or a callable returning it, and
+        defaults to the packages installed on the local system.
         """
         self.item_score = item_score
         self.pkg_profile = self.items()
-        self.installed_pkgs = data.get_user_installed_pkgs()
+        if installed_pkgs is None:
+            installed_pkgs = data.get_user_installed_pkgs
+        self.installed_pkgs_provider = installed_pkgs
+        self.installed_pkgs = None
         self.arch = arch
 
         if user_id:
@@ -99,6 +121,46 @@ class User:
         """
         return self.item_score.keys()
 
+    def get_installed_pkgs(self):
+        """
+        Return the packages not to be recommended to the user, computing
+        them on first use.
+        """
+        if self.installed_pkgs is None:
+            if callable(self.installed_pkgs_provider):
+                self.installed_pkgs = self.installed_pkgs_provider()
+            else:
+                self.installed_pkgs = self.installed_pkgs_provider
+        return self.installed_pkgs
+
+    def share_computations(self, enable=True):
+        """
+        Keep (or stop keeping) the intermediate results computed for this
+        user, so that several strategies run in sequence compute each of
+        them only once. Results are kept per package profile.
+        """
+        self.shared = {} if enable else None
+
+    def get_shared(self, key, compute):
+        """
+        Return the result of 'compute' for the current package profile,
+        computing it only once while computations are shared.
+        """
+        if self.shared is None:
+            return compute()
+        key = key + (tuple(self.pkg_profile),)
+        if key not in self.shared:
+            self.shared[key] = compute()
+        return self.shared[key]
+
+    def get_profile_docs(self, items_repository):
+        """
+        Return the documents of the package profile in 'items_repository'.
+        """
+        return self.get_shared(
+            ('docs', data.get_database_key(items_repository)),
+            lambda: data.axi_search_pkgs(items_repository, self.pkg_profile))
+
     def set_demographic_profile(self, profiles_set):
         """
         Set demographic profle based on labels in 'profiles_set'.
@@ -106,61 +168,63 @@ class User:
         self.demographic_profile = DemographicProfile()(profiles_set)
 
     def content_profile(self, items_repository, content, size, valid_tags=0,
-                        time_context=0):
+                        time_context=0, term_store=None, eset_store=None):
         """
         Get user profile for a specific type of content: packages tags,
-        description or both (mixed and half-half profiles)
+        description or both (mixed and half-half profiles). If term vectors
+        stores are given, tfidf and eset profiles are built from them instead
+        of walking the items repository.
         """
         if content == "tag":
             profile = self.tfidf_profile(items_repository, size,
-                                         FilterTag(valid_tags), time_context)
+                                         FilterTag(valid_tags), time_context,
+                                         term_store)
         elif content == "desc":
             profile = self.tfidf_profile(items_repository,
                                          size, FilterDescription(),
-                                         time_context)
+                                         time_context, term_store)
         elif content == 'mlbow_mix' or content == 'mlbva_mix':
-            self.pkg_profile = self.get_most_usefull_pkgs()
+            self.pkg_profile = self.get_shared(('most_usefull_pkgs',),
+                                               self.get_most_usefull_pkgs)
             profile = self.tfidf_profile(items_repository, size,
                                          FilterTag_or_Description(valid_tags),
-                                         time_context)
+                                         time_context, term_store)
         elif content == "mix":
             profile = self.tfidf_profile(items_repository, size,
                                          FilterTag_or_Description(valid_tags),
-                                         time_context)
+                                         time_context, term_store)
         elif content == "half":
-            tag_profile = self.tfidf_profile(items_repository, size,
-                                             FilterTag(valid_tags),
-                                             time_context)
-            desc_profile = self.tfidf_profile(items_repository, size,
-                                              FilterDescription(),
-                                              time_context)
+            tag_profile, desc_profile = self.tfidf_profiles(
+                items_repository, size,
+                [FilterTag(valid_tags), FilterDescription()],
+                time_context, term_store)
             profile = tag_profile[:size / 2] + desc_profile[:size / 2]
         elif content == "time":
-            tag_profile = self.tfidf_profile(items_repository, size,
-                                             FilterTag(valid_tags),
-                                             time_context=1)
-            desc_profile = self.tfidf_profile(items_repository, size,
-                                              FilterDescription(),
-                                              time_context=1)
+            tag_profile, desc_profile = self.tfidf_profiles(
+                items_repository, size,
+                [FilterTag(valid_tags), FilterDescription()],
+                1, term_store)
             profile = tag_profile[:size / 2] + desc_profile[:size / 2]
         elif content == "tag_eset":
             profile = self.eset_profile(items_repository, size,
-                                        FilterTag(valid_tags))
+                                        FilterTag(valid_tags), eset_store)
         elif content == "desc_eset":
             profile = self.eset_profile(items_repository, size,
-                                        FilterDescription())
+                                        FilterDescription(), eset_store)
         elif content == 'mlbow_mix_eset' or content == 'mlbva_mix_eset':
-            self.pkg_profile = self.get_most_usefull_pkgs()
+            self.pkg_profile = self.get_shared(('most_usefull_pkgs',),
+                                               self.get_most_usefull_pkgs)
             profile = self.eset_profile(items_repository, size,
-                                        FilterTag_or_Description(valid_tags))
+                                        FilterTag_or_Description(valid_tags),
+                                        eset_store)
         elif content == "mix_eset":
             profile = self.eset_profile(items_repository, size,
-                                        FilterTag_or_Description(valid_tags))
+                                        FilterTag_or_Description(valid_tags),
+                                        eset_store)
         elif content == "half_eset":
-            tag_profile = self.eset_profile(items_repository, size,
-                                            FilterTag(valid_tags))
-            desc_profile = self.eset_profile(items_repository, size,
-                                             FilterDescription())
+            tag_profile, desc_profile = self.eset_profiles(
+                items_repository, size,
+                [FilterTag(valid_tags), FilterDescription()], eset_store)
             profile = tag_profile[:size / 2] + desc_profile[:size / 2]
         else:
             logging.debug("Unknown content type %s." % content)
@@ -169,38 +233,107 @@ class User:
         return profile
 
     def tfidf_profile(self, items_repository, size, content_filter,
-                      time_context=0):
+                      time_context=0, term_store=None):
         """
         Return the most relevant tags for the user list of packages based on
         the sublinear tfidf weight of packages' tags.
         """
+        return self.tfidf_profiles(items_repository, size, [content_filter],
+                                   time_context, term_store)[0]
 
-        docs = data.axi_search_pkgs(items_repository, self.pkg_profile)
-        # weights = data.tfidf_plus(items_repository,docs,content_filter)
-        weights = data.tfidf_weighting(items_repository, docs, content_filter,
-                                       time_context=time_context)
+    def tfidf_profiles(self, items_repository, size, content_filters,
+                       time_context=0, term_store=None):
+        """
+        Return one tfidf profile for each filter in 'content_filters',
+        reading the user packages documents only once.
+        """
+        filters_key = tuple(_filter_key(f) for f in content_filters)
+        key = ('tfidf', data.get_database_key(items_repository), filters_key,
+               size, time_context, _store_key(term_store))
+        return self.get_shared(key, lambda: self._tfidf_profiles(
+            items_repository, size, content_filters, time_context,
+            term_store))
+
+    def _tfidf_profiles(self, items_repository, size, content_filters,
+                        time_context, term_store):
+        if term_store is not None:
+            weights_list = term_store.tfidf_weighting_multi(
+                self.pkg_profile, content_filters, time_context)
+        else:
+            # The terms statistics do not depend on the time context
+            filters_key = tuple(_filter_key(f) for f in content_filters)
+            terms_docs, terms_packages = self.get_shared(
+                ('terms', data.get_database_key(items_repository),
+                 filters_key),
+                lambda: data.get_all_terms_multi(
+                    items_repository, self.get_profile_docs(items_repository),
+                    content_filters, 0))
+            # weights = data.tfidf_plus(items_repository,docs,content_filter)
+            weights_list = data.sort_tfidf_weights(
+                terms_docs, items_repository, terms_packages, time_context)
         # Eliminate duplicated stemmed term
-        profile = self._eliminate_duplicated([w[0] for w in weights], size)
-        return profile
+        return [self._eliminate_duplicated([w[0] for w in weights], size)
+                for weights in weights_list]
 
-    def eset_profile(self, items_repository, size, content_filter):
+    def eset_profile(self, items_repository, size, content_filter,
+                     term_store=None):
         """
         Return most relevant tags for a list of packages.
         """
+        return self.eset_profiles(items_repository, size, [content_filter],
+                                  term_store)[0]
+
+    def eset_profiles(self, items_repository, size, content_filters,
+                      term_store=None):
+        """
+        Return one eset profile for each filter in 'content_filters',
+        expanding the user relevant set only once.
+        """
+        filters_key = tuple(_filter_key(f) for f in content_filters)
+        key = ('eset', data.get_database_key(items_repository), filters_key,
+               size, _store_key(term_store))
+        return self.get_shared(key, lambda: self._eset_profiles(
+            items_repository, size, content_filters, term_store))
+
+    def _eset_profiles(self, items_repository, size, content_filters,
+                       term_store):
+        if term_store is not None:
+            rows = [term_store.pkgs_ids[pkg] for pkg in self.pkg_profile
+                    if pkg in term_store]
+            masks = [term_store.filter_mask(content_filter)
+                     for content_filter in content_filters]
+            esets = term_store.esets(rows, size * 2, masks)
+            return [self._eliminate_duplicated([term for term, _ in eset],
+                                               size)
+                    for eset in esets]
         # Store package documents in a relevant set
         enquire = xapian.Enquire(items_repository)
-        docs = data.axi_search_pkgs(items_repository, self.pkg_profile)
+        docs = self.get_profile_docs(items_repository)
         rset_packages = xapian.RSet()
         for d in docs:
             rset_packages.add_document(d.docid)
-        # Get expanded query terms (statistically good differentiators)
-        eset_tags = enquire.get_eset(size * 2, rset_packages,
-                                     xapian.Enquire.INCLUDE_QUERY_TERMS,
-                                     1, content_filter)
+        # The weight of a term does not depend on the filter, so a single
+        # expansion over the terms accepted by any filter is split in each
+        # filter profile. It only grows while the expansion is full and a
+        # filter has not got all the terms it needs.
+        content_filter = FilterAny(content_filters)
+        max_terms = size * 2 * len(content_filters)
+        while True:
+            # Get expanded query terms (statistically good differentiators)
+            eset_tags = enquire.get_eset(max_terms, rset_packages,
+                                         xapian.Enquire.INCLUDE_QUERY_TERMS,
+                                         1, content_filter)
+            filters_terms = [[] for f in content_filters]
+            for res in eset_tags:
+                for i in content_filter.accepting_filters(res.term):
+                    filters_terms[i].append(res.term)
+            if (eset_tags.size() < max_terms or
+                    min([len(terms) for terms in filters_terms]) >= size * 2):
+                break
+            max_terms *= 2
         # Eliminate duplicated stemmed term
-        profile = self._eliminate_duplicated([res.term for res in eset_tags],
-                                             size)
-        return profile
+        return [self._eliminate_duplicated(terms[:size * 2], size)
+                for terms in filters_terms]
 
     def _eliminate_duplicated(self, sorted_list, size):
         profile = sorted_list[:size]
@@ -219,57 +352,86 @@ class User:
                             next_index += 1
         return profile
 
-    def filter_pkg_profile(self, filter_list_or_file):
+    def apply_profile_stages(self, stages):
         """
-        Return list of packages from profile listed in the filter_file.
+        Run the package profile through 'stages', functions from a packages
+        list to the list of the packages kept, in order. The profile is
+        updated once, at the end.
+        """
+        profile = self.pkg_profile
+        for stage in stages:
+            old_profile_size = len(profile)
+            profile = stage(profile)
+            logging.debug("%s: reduced packages profile size from %d to %d."
+                          % (stage.__name__, old_profile_size, len(profile)))
+        # the profile list is updated in place, as it may be shared
+        self.pkg_profile[:] = profile
+        return self.pkg_profile
+
+    def get_filter_stage(self, filter_list_or_file):
+        """
+        Return the profile stage keeping the packages listed in the filter,
+        or None if no filter was given. Filter files are loaded once.
         """
         if type(filter_list_or_file).__name__ == "list":
-            valid_pkgs = filter_list_or_file
+            valid_pkgs = get_pkgs_set(filter_list_or_file)
         elif type(filter_list_or_file).__name__ == "str":
             try:
-                with open(filter_list_or_file) as valid:
-                    valid_pkgs = [line.strip() for line in valid]
-            except IOError:
+                valid_pkgs = load_pkgs_set(filter_list_or_file)
+            except (IOError, OSError):
                 logging.critical("Could not open profile filter file: %s" %
                                  filter_list_or_file)
                 raise Error
+        elif isinstance(filter_list_or_file, (PackageSet, set, frozenset)):
+            valid_pkgs = filter_list_or_file
         else:
+            return None
+
+        def filter_profile(profile):
+            if isinstance(valid_pkgs, PackageSet):
+                return valid_pkgs.filter(profile)
+            return [pkg for pkg in profile if pkg in valid_pkgs]
+        return filter_profile
+
+    def get_maximal_stage(self):
+        """
+        Return the profile stage keeping the packages that are not
+        dependence of any other package of the profile.
+        """
+        def maximal_profile(profile):
+            dependency_index = get_dependency_index()
+            if dependency_index:
+                return dependency_index.get_maximal(profile)
+
+            cache = get_cache()
+            deps = set()
+            for p in profile:
+                if p in cache:
+                    pkg = cache[p]
+
+                    if pkg.candidate:
+                        for dep in pkg.candidate.dependencies:
+                            for or_dep in dep.or_dependencies:
+                                deps.add(or_dep.name)
+            return [p for p in profile if p not in deps]
+        return maximal_profile
+
+    def filter_pkg_profile(self, filter_list_or_file):
+        """
+        Return list of packages from profile listed in the filter_file.
+        """
+        stage = self.get_filter_stage(filter_list_or_file)
+        if stage is None:
             logging.debug("No filter provided for user profiling.")
             return self.pkg_profile
-
-        old_profile_size = len(self.pkg_profile)
-        for pkg in self.pkg_profile[:]:  # iterate list copy
-            if pkg not in valid_pkgs:
-                self.pkg_profile.remove(pkg)
-                logging.debug("Discarded package %s during profile filtering"
-                              % pkg)
-        profile_size = len(self.pkg_profile)
-        logging.debug("Filtered package profile: reduced packages profile size \
-                       from %d to %d." % (old_profile_size, profile_size))
-        return self.pkg_profile
+        return self.apply_profile_stages([stage])
 
     def maximal_pkg_profile(self):
         """
         Return list of packages that are not dependence of any other package in
         the list.
         """
-        cache = apt.Cache()
-        old_profile_size = len(self.pkg_profile)
-
-        for p in self.pkg_profile[:]:  # iterate list copy
-            if p in cache:
-                pkg = cache[p]
-
-                if pkg.candidate:
-                    for dep in pkg.candidate.dependencies:
-                        for or_dep in dep.or_dependencies:
-                            if or_dep.name in self.pkg_profile:
-                                self.pkg_profile.remove(or_dep.name)
-
-        profile_size = len(self.pkg_profile)
-        logging.debug("Maximal package profile: reduced packages profile size \
-                       from %d to %d." % (old_profile_size, profile_size))
-        return self.pkg_profile
+        return self.apply_profile_stages([self.get_maximal_stage()])
 
     def get_most_usefull_pkgs(self):
         classification_path = os.path.expanduser(
@@ -361,12 +523,7 @@ class LocalSystem(User):
         """
         Set initial parameters.
         """
-        item_score = {}
-        dpkg_output = commands.getoutput('/usr/bin/dpkg --get-selections')
-
-        for line in dpkg_output.splitlines():
-            pkg = line.split('\t')[0]
-            item_score[pkg] = 1
+        item_score = dict.fromkeys(get_dpkg_state().installed, 1)
 
         self.user_id = "local-" + str(datetime.datetime.now())
 
@@ -384,76 +541,41 @@ class LocalSystem(User):
 
         return time_score
 
+    def get_no_auto_stage(self):
+        """
+        Return the profile stage keeping the packages voluntarily installed.
+        """
+        known_pkgs = get_dpkg_state().known
+        manual_installed = self.get_manual_installed_pkgs()
+        system_pkgs = frozenset(self.get_system_pkgs())
+
+        def no_auto_profile(profile):
+            return [p for p in profile
+                    if p not in known_pkgs or
+                    (p in manual_installed and p not in system_pkgs and
+                     not p.startswith('lib'))]
+        return no_auto_profile
+
     def no_auto_pkg_profile(self):
         """
         Return list of packages voluntarily installed.
         """
-        cache = apt.Cache()
-        old_profile_size = len(self.pkg_profile)
-
-        manual_installed = self.get_manual_installed_pkgs()
-        system_pkgs = self.get_system_pkgs()
-
-        for p in self.pkg_profile[:]:  # iterate list copy
-            if p in cache:
-                if (p not in manual_installed or
-                   p in system_pkgs or
-                   p.startswith('lib')):
-                    self.pkg_profile.remove(p)
-        profile_size = len(self.pkg_profile)
-        logging.debug("No auto-intalled package profile: reduced packages"
-                      "profile size from %d to %d." %
-                      (old_profile_size, profile_size))
-        return self.pkg_profile
+        return self.apply_profile_stages([self.get_no_auto_stage()])
 
     def get_system_pkgs(self):
-        system_pkgs = []
-        all_pkgs = commands.getoutput("dpkg-query -Wf \
-                                      '${Package;-40}${Priority}\n'")
-
         priority_terms = set(['important', 'required', 'standard'])
         languages_terms = set(['python', 'perl'])
 
-        for line in all_pkgs.splitlines():
-            line_split = line.split(' ')
-            pkg_name = line_split[0]
-            pkg_priority = line_split[-1].strip()
-
-            if (pkg_priority in priority_terms and
-               pkg_name not in languages_terms):
-                system_pkgs.append(pkg_name)
-
-        return system_pkgs
+        return [pkg for pkg in
+                get_dpkg_state().get_pkgs_with_priority(priority_terms)
+                if pkg not in languages_terms]
 
     def __get_apt_installed_pkgs(self):
-        apt_pkgs = set()
-
-        dpkg_log = glob.glob('/var/log/dpkg.log*')
-
-        for log in dpkg_log:
-            command = 'zcat' if log.endswith('gz') else 'cat'
-            log_files = commands.getoutput(
-                '{} {} | grep "[0-9] install"'.format(command, log))
-
-            '''
-            The log_files will hold packages with this format:
-            2016-05-18 15:16:40 install liblmdb0:amd64 <none> 0.9.18-1
-            Therefore it is necessary to perform another filter on it
-            to only get the package name.
-            '''
-
-            for pkg in log_files.splitlines():
-                pkg = pkg.split()[3]
-                pkg = pkg.split(':')[0]
-                apt_pkgs.add(pkg)
-
-        return apt_pkgs
+        state_path = os.path.join(Config().user_data_dir, 'dpkg_logs_state')
+        return get_logged_installed_pkgs(state_path)
 
     def __get_manual_marked_pkgs(self):
-        list_manual = commands.getoutput('apt-mark showmanual | sort')
-        list_manual = list_manual.splitlines()
-
-        return set([pkg for pkg in list_manual])
+        return set(get_dpkg_state().manual)
 
     def __remove_lib_packages(self, pkgs):
         return set([pkg for pkg in pkgs if not re.match(r'^lib', pkg)])
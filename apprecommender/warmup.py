@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+    warmup - python module to bring the recommender indexes into the page
+             cache before the first recommendation.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+import time
+import xapian
+
+import apprecommender.database_pool as database_pool
+
+POSIX_FADV_WILLNEED = 3
+READ_CHUNK_SIZE = 1024 * 1024
+
+ready = threading.Event()
+warmup_lock = threading.Lock()
+
+
+def _get_fadvise():
+    # os.posix_fadvise only exists from python 3.3 on
+    if hasattr(os, 'posix_fadvise'):
+        return lambda fd: os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fadvise = libc.posix_fadvise
+    except (OSError, AttributeError):
+        return None
+    fadvise.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64,
+                        ctypes.c_int]
+    return lambda fd: fadvise(fd, 0, 0, POSIX_FADV_WILLNEED)
+
+
+def prefetch_files(path):
+    """
+    Ask the kernel to read ahead every file under 'path' and stream them
+    with sequential reads, so that their pages are cached. Return the number
+    of bytes read.
+    """
+    fadvise = _get_fadvise()
+    if os.path.isdir(path):
+        files = [os.path.join(root, name)
+                 for root, dirs, names in os.walk(path) for name in names]
+    else:
+        files = [path]
+
+    read_bytes = 0
+    for file_path in files:
+        try:
+            with open(file_path, 'rb') as data:
+                if fadvise:
+                    fadvise(data.fileno())
+                chunk = data.read(READ_CHUNK_SIZE)
+                while chunk:
+                    read_bytes += len(chunk)
+                    chunk = data.read(READ_CHUNK_SIZE)
+        except IOError as error:
+            logging.debug("Could not prefetch %s: %s" % (file_path, error))
+    return read_bytes
+
+
+def run_queries(path, queries, size=20):
+    """
+    Run each query, a list of terms, on a handle of the database at 'path'
+    from the process pool, so that the handle is opened and warm too.
+    """
+    with database_pool.get_pool(path).handle() as database:
+        enquire = xapian.Enquire(database)
+        for terms in queries:
+            enquire.set_query(xapian.Query(xapian.Query.OP_OR, terms))
+            enquire.get_mset(0, size)
+
+
+def get_warmup_paths(cfg):
+    """
+    Return the xapian databases and the other data read by a recommender.
+    """
+    databases = [cfg.axi_desktopapps]
+    files = [cfg.term_store]
+    if cfg.popcon:
+        databases.append(cfg.popcon_desktopapps)
+        files.append(cfg.popcon_term_store)
+    return databases, files
+
+
+def warm_up(cfg):
+    """
+    Prefetch the recommender indexes and run the configured canned queries
+    on them, once per process. Concurrent callers wait for the first one to
+    finish, and 'ready' is set when it is done.
+    """
+    with warmup_lock:
+        if ready.is_set():
+            return
+        begin_time = time.time()
+        databases, files = get_warmup_paths(cfg)
+        read_bytes = 0
+        for path in databases + files:
+            if os.path.exists(path):
+                read_bytes += prefetch_files(path)
+
+        queries = [query.split() for query in cfg.warmup_queries.split(';')
+                   if query.strip()]
+        for path in databases:
+            try:
+                run_queries(path, queries)
+            except xapian.Error as error:
+                logging.warning("Could not warm up %s: %s" %
+                                (path, error.get_msg()))
+
+        logging.info("Warm-up read %d MB and ran %d queries in %.2f seconds"
+                     % (read_bytes / (1024 * 1024), len(queries) *
+                        len(databases), time.time() - begin_time))
+        ready.set()
+        logging.info("Recommender ready")
@@ -8,6 +8,8 @@ import logging
 
 sys.path.insert(0, "/var/www/AppRecommender/src/")
 
+import warmup
+
 from config import Config
 from recommender import Recommender
 from user import PopconSystem, PkgsListSystem
@@ -48,12 +50,28 @@ class AppRecommender:
     def __init__(self):
         logging.info("Setting up AppRecommender...")
         self.cfg = Config()
-        self.rec = Recommender(self.cfg)
+        self.rec = Recommender()
         self.requests_dir = "/var/www/AppRecommender/src/web/requests/"
         if not os.path.exists(self.requests_dir):
             os.makedirs(self.requests_dir)
 
     def POST(self):
+        # give back the database handles for other requests, whatever
+        # happens while handling this one
+        with self.rec:
+            first_page = self.recommend()
+        if first_page is None:
+            return render.error(
+                ["Could not extract profile from uploaded file. It must have at least 10 applications."],  # noqa
+                                 "/", "RECOMMENDATION")
+        page, cursor = first_page
+        return render_page(page, cursor)
+
+    def recommend(self):
+        """
+        Return the first page of recommendations for the uploaded file and
+        its cursor, or None if no profile can be extracted from it.
+        """
         web_input = web.input(pkgs_file={})
         user_dir = tempfile.mkdtemp(prefix='', dir=self.requests_dir)
         user_id = user_dir.split("/")[-1]
@@ -68,27 +86,42 @@ class AppRecommender:
             else:
                 user = PkgsListSystem(uploaded_file, user_id)
         if len(user.pkg_profile) < 10:
+            return None
+        self.rec.set_strategy("knn_eset")
+        user.maximal_pkg_profile()
+        page, cursor = self.rec.get_recommendation_page(user, 12)
+        logging.info("Prediction for user %s" % user.user_id)
+        return (page, cursor)
+
+
+def render_page(page, cursor):
+    prediction = page.get_prediction() if page else []
+    logging.info(str(prediction))
+    recommendation = [result[0] for result in prediction]
+    pkgs_details = []
+    for pkg_name in recommendation:
+        logging.info("Getting details of package %s" % pkg_name)
+        pkg = DebianPackage(pkg_name)
+        pkg.load_summary()
+        pkgs_details.append(pkg)
+    if pkgs_details:
+        logging.info("Rendering recommendation...")
+        return render.apprec(pkgs_details, cursor)
+    else:
+        return render.error(["No recommendation produced for the uploaded file."], "/", "RECOMMENDATION")  # noqa
+
+
+class More:
+
+    def GET(self, cursor):
+        # the following pages are sliced from the cursor cache of the
+        # process, without setting up a recommender
+        page, next_cursor = Recommender.get_cursor_page(cursor, 12)
+        if page is None:
             return render.error(
-                ["Could not extract profile from uploaded file. It must have at least 10 applications."],  # noqa
-                                 "/", "RECOMMENDATION")
-        else:
-            self.rec.set_strategy("knn_eset")
-            user.maximal_pkg_profile()
-            prediction = self.rec.get_recommendation(user, 12).get_prediction()
-            logging.info("Prediction for user %s" % user.user_id)
-            logging.info(str(prediction))
-            recommendation = [result[0] for result in prediction]
-            pkgs_details = []
-            for pkg_name in recommendation:
-                logging.info("Getting details of package %s" % pkg_name)
-                pkg = DebianPackage(pkg_name)
-                pkg.load_summary()
-                pkgs_details.append(pkg)
-            if pkgs_details:
-                logging.info("Rendering recommendation...")
-                return render.apprec(pkgs_details)
-            else:
-                return render.error(["No recommendation produced for the uploaded file."], "/", "RECOMMENDATION")  # noqa
+                ["Recommendation expired, please upload your file again."],
+                "/", "RECOMMENDATION")
+        return render_page(page, next_cursor)
 
 
 # parsing json from screenshots - can be usefull in the future...
@@ -123,6 +156,7 @@ render_plain = web.template.render(
 urls = ('/', 'Index',
         '/index', 'Index',
         '/apprec', 'AppRecommender',
+        '/apprec/more/(.*)', 'More',
         '/support', 'Support',
         '/about', 'About',
         '/package/(.*)', 'Package'
@@ -132,6 +166,9 @@ web.webapi.internalerror = web.debugerror
 
 # if __name__ == "__main__":
 cfg = Config()
+# warm up the indexes before serving the first request
+if cfg.warmup:
+    warmup.warm_up(cfg)
 app = web.application(urls, globals(), autoreload=False)
 application = app.wsgifunc()
 
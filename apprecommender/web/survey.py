@@ -181,7 +181,7 @@ class Survey:
     def __init__(self):
         logging.info("Setting up survey...")
         self.cfg = Config()
-        self.rec = Recommender(self.cfg)
+        self.rec = Recommender()
         self.submissions_dir = "/var/www/AppRecommender/src/web/submissions/"
         if not os.path.exists(self.submissions_dir):
             os.makedirs(self.submissions_dir)
@@ -190,6 +190,12 @@ class Survey:
                            "knnco"]
 
     def POST(self):
+        # give back the database handles for other requests, whatever
+        # happens while handling this one
+        with self.rec:
+            return self.recommend()
+
+    def recommend(self):
         web_input = web.input(pkgs_file={})
         if 'user_id' in web_input:
             user_id = web_input['user_id'].encode('utf8')
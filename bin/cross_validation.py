@@ -56,6 +56,7 @@ if __name__ == '__main__':
     metrics.append(FPR())
     validation = CrossValidation(0.9, 20, rec, metrics, 0.005)
     validation.run(user)
+    rec.close()
     print validation
 
     end_time = datetime.datetime.now()
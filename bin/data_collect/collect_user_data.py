@@ -1,13 +1,11 @@
 #!/usr/bin/env python
 
-import apt
 import binascii
 import commands
 import datetime as dt
 import logging
 import os
 import sys
-import time
 
 sys.path.insert(0, '../../')
 
@@ -16,6 +14,7 @@ from subprocess import Popen, PIPE
 
 from bin.ml_cross_validation import ml_cross_validation
 from apprecommender.app_recommender import AppRecommender
+from apprecommender.apt_cache import get_cache
 from apprecommender.data import get_user_installed_pkgs
 from apprecommender.data_classification import get_alternative_pkg
 from apprecommender.ml.data import MachineLearningData
@@ -173,17 +172,17 @@ def get_pkg_binary(pkg):
     return get_alternative_pkg(pkg)
 
 
-def get_pkgs_of_recommendation(recommendation_size, strategy,
-                               no_auto_pkg_profile):
+def get_pkgs_of_recommendations(recommendation_size, strategies,
+                                no_auto_pkg_profile, progress=None):
     app_recommender = AppRecommender()
 
-    app_recommender.recommender.set_strategy(strategy)
-    recommender = (app_recommender.make_recommendation(recommendation_size,
-                                                       no_auto_pkg_profile))
-    pkgs = [pkg.split(':')[1][1:]
-            for pkg in str(recommender).splitlines()[1:]]
+    recommendations = app_recommender.make_recommendations(
+        recommendation_size, strategies, no_auto_pkg_profile, progress)
+    pkgs = dict((strategy, [pkg for pkg, _ in recommendation])
+                for strategy, recommendation in recommendations.iteritems())
+    recommendations_time = app_recommender.recommender.recommendations_time
 
-    return pkgs
+    return pkgs, recommendations_time
 
 
 def collect_user_preferences():
@@ -191,26 +190,22 @@ def collect_user_preferences():
     no_auto_pkg_profile = True
     strategies = ['cbh', 'cbtm', 'mlbva', 'mlbow']
 
-    recommendations = {}
-    recommendations_time = []
-
     percent_message = "Preparing recommendations...\n"
     percent_message += "[{}%]"
 
-    os.system('clear')
-    print percent_message.format(0.0)
-    for index, strategy in enumerate(strategies):
-        first_time = int(round(time.time() * 1000))
-        recommendations[strategy] = (get_pkgs_of_recommendation(
-                                     recommendation_size,
-                                     strategy, no_auto_pkg_profile))
-        last_time = int(round(time.time() * 1000))
-        recommendations_time.append("{0}: {1}".format(strategy,
-                                                      last_time - first_time))
-        percent = (index + 1.0) * 100.0 / len(strategies)
+    def print_percent(strategy, done):
+        percent = done * 100.0 / len(strategies)
         os.system('clear')
         print percent_message.format(percent)
 
+    print_percent(None, 0)
+    recommendations, strategies_time = get_pkgs_of_recommendations(
+        recommendation_size, strategies, no_auto_pkg_profile, print_percent)
+    recommendations_time = [
+        "{0}: {1}".format(strategy,
+                          int(round(strategies_time[strategy] * 1000)))
+        for strategy in strategies]
+
     all_recommendations = set(sum(recommendations.values(), []))
     all_recommendations = sorted(list(all_recommendations))
 
@@ -229,7 +224,7 @@ def collect_user_preferences():
 
     message_error = "\nPlease use digits 1-4 to rank a package: "
 
-    apt_cache = apt.Cache()
+    apt_cache = get_cache()
     for i in range(len(all_recommendations)):
         pkg = all_recommendations[i]
         pkg_description = apt_cache[pkg].versions[0].description
@@ -3,7 +3,6 @@
 import datetime as dt
 import logging
 import os
-import pickle
 import sys
 import getopt
 
@@ -36,9 +35,12 @@ def get_strategy(ml_strategy_str, pkg_data, partition_size, rounds,
 
 def get_pkg_data(ml_strategy_str, ml_data, labels):
     if ml_strategy_str == 'bow':
-        path = BagOfWords.BAG_OF_WORDS_PKGS_CLASSIFICATION
-        with open(path, 'ra') as pkgs_classification:
-            return pickle.load(pkgs_classification)
+        # the bag of words model is trained again from the packages texts,
+        # so only their classifications are needed
+        pkgs_list, features, classifications = BagOfWords.load_pkgs_features(
+            BagOfWords.BAG_OF_WORDS_PKGS_FEATURES)
+        return dict([(pkg, [label]) for pkg, label in
+                     zip(pkgs_list, classifications)])
     else:
         return ml_data.create_data(labels)
 
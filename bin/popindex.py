@@ -26,6 +26,7 @@ import datetime
 
 from apprecommender.config import Config
 from apprecommender.data import PopconXapianIndex
+from apprecommender.term_store import TermVectorStore
 
 if __name__ == '__main__':
     cfg = Config()
@@ -42,6 +43,8 @@ if __name__ == '__main__':
 
     delta = end_time - begin_time
     logging.info("Time elapsed: %d seconds." % delta.seconds)
+    TermVectorStore.build(popindex, cfg.popcon_term_store,
+                          popindex.valid_tags, pkgs_terms=True)
     if cfg.index_mode == "cluster" or cfg.index_mode == "recluster":
         logging.info("Medoids: %d\tDispersion:%f" %
                      (cfg.k_medoids, popindex.cluster_dispersion))
@@ -1,4 +1,4 @@
-sudo apt-get install python python-xapian python-apt python-cluster python-webpy python-simplejson python-numpy apt-xapian-index python-xdg debtags python-pip python-sklearn python-matplotlib python-stemmer -y
+sudo apt-get install python python-xapian python-apt python-cluster python-webpy python-simplejson python-numpy apt-xapian-index python-xdg debtags python-pip python-scipy python-sklearn python-matplotlib python-stemmer -y
 
 sudo update-apt-xapian-index
 